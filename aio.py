@@ -0,0 +1,900 @@
+# -*- coding: utf-8 -*-
+"""Asyncio runtime: the same bot as main.py, served by an ASGI server.
+
+Under gunicorn + Flask, TeleBot(threaded=True) runs handlers on a small thread
+pool, and a handler waiting on the model holds its thread for the whole call -
+tens of seconds for a report. Concurrent screenings are capped by the pool
+size, not by anything the dyno is actually short of. Here every update is a
+task on one event loop: a screening waiting on the model is a suspended
+coroutine, so a single process holds hundreds of them.
+
+The clients are the async counterparts of the threaded ones (clients.py):
+AsyncTeleBot, redis.asyncio and openai.AsyncOpenAI. Telegram sends still go
+through the shared Outbound queue (outbound.AsyncPacedBot), and prompts,
+sessions, the archive layout and the screening logic are the same modules the
+threaded runtime uses, as are the flags, texts, formatting and email helpers
+(common.py). Model calls share main's limits through modelpool.AsyncModelPool.
+Nothing here imports main, so this process builds no Flask app,
+sender threads or model pool it would not use.
+
+AsyncTeleBot has no register_next_step_handler, so the step a chat is in (name,
+age, observations, subject, body) is kept in the session as `awaiting` and one
+text handler dispatches on it. Unlike the in-memory next-step table, that
+survives a restart.
+
+`app` is a plain ASGI application (webhook + /metrics), served by uvicorn;
+AsyncTeleBot needs aiohttp. Both are in the Pipfile:
+
+    web: uvicorn aio:app --host 0.0.0.0 --port $PORT
+
+The Procfile still runs the threaded runtime.
+"""
+
+import asyncio
+import hmac
+import logging
+import time
+from datetime import datetime
+from functools import wraps
+
+from telebot import types
+
+import clients
+import deadlines
+import llm
+import local_report
+import metrics
+import modelpool
+import outbound
+import prompts
+import screening_logic
+import section_cache
+import sessions
+import speculation
+from catalog import DOMAIN_TABLE, checklist_options
+from common import (BUSY_TEXT, METRICS_SECRET, PAUSED_TEXT, REPORT_PREVIEW, SECTION_CACHE,
+                    SPECULATIVE_REPORTS, WEBHOOK_SECRET, escape_markdown_v2, format_years_months, send_email_new, split_message)
+from instrumentation import span
+from logsafe import HashedChat, SessionSummary
+from report_archive import AsyncReportArchive
+
+logger = logging.getLogger(__name__)
+
+AGE_GROUPS = prompts.AGE_GROUPS
+
+bot = outbound.AsyncPacedBot(clients.async_bot, outbound.Outbound())
+r = clients.async_redis
+archive = AsyncReportArchive(r)
+sections = section_cache.AsyncSectionCache(r)
+
+# As in main: at most MODEL_CONCURRENCY model calls at once, the rest queued.
+model_pool = modelpool.AsyncModelPool()
+
+# Updates being handled. The webhook answers Telegram at once and the handler
+# runs as a task; holding a reference keeps it from being garbage collected.
+_tasks = set()
+
+# As in main: the no-observations report starts at checklist submission.
+speculator = speculation.Speculator(speculation.TaskSpawner())
+
+
+async def load_session(chat_id):
+    """Read a chat's session dict from Redis."""
+    metrics.REDIS_OPS.inc(op="get")
+    with span("redis.get", chat_id):
+        raw = await asyncio.wait_for(r.get(chat_id), deadlines.timeout(None, "redis.get"))
+    if raw is None:
+        raise sessions.SessionExpired(chat_id)
+    return sessions.decode(raw)
+
+
+async def save_session(chat_id, user_data):
+    """Write a chat's session dict to Redis, expiring per its phase."""
+    metrics.REDIS_OPS.inc(op="set")
+    with span("redis.set", chat_id):
+        await asyncio.wait_for(r.set(chat_id, sessions.encode(user_data), ex=sessions.ttl_for(user_data)),
+                               deadlines.timeout(None, "redis.set"))
+
+
+def tracked(handler):
+    """Count every update a handler processes, and run it under the update's deadline.
+
+    Handlers re-raise DeadlineExceeded ahead of their generic error reply: a
+    spent budget is not an error to tell the user about, and replying would
+    only raise it again. This wrapper is where it ends.
+    """
+    @wraps(handler)
+    async def wrapper(*args, **kwargs):
+        metrics.UPDATES.inc(handler=handler.__name__)
+        with deadlines.budget():
+            try:
+                return await handler(*args, **kwargs)
+            except deadlines.DeadlineExceeded as e:
+                logger.warning("%s: %s", handler.__name__, e)
+    return wrapper
+
+
+async def create_response(function, chat_id=None, **kwargs):
+    """As main.create_response: one call on the model pool, routed and counted
+    under `function`; raises one of MODEL_UNAVAILABLE without waiting."""
+    llm.BREAKER.check()
+
+    async def on_queued(position):
+        if chat_id is not None:
+            await announce_queue_position(chat_id, position)
+    return await model_pool.run(_call_model, function, kwargs, on_queued=on_queued)
+
+
+async def _call_model(function, kwargs):
+    with span("model." + function):
+        return await llm.acall(clients.async_openai_client(), function, **kwargs)
+
+
+async def announce_queue_position(chat_id, position):
+    await bot.send_message(chat_id, f"⏳ We're busy right now - you're in the queue, position {position}. "
+                                    "We'll carry on as soon as it's your turn.")
+
+
+# Raised by create_response instead of waiting; callers tell the user, not the log.
+MODEL_UNAVAILABLE = (modelpool.Saturated, llm.CircuitOpen)
+
+
+async def reply_unavailable(chat_id, exc, markup=None):
+    text = PAUSED_TEXT if isinstance(exc, llm.CircuitOpen) else BUSY_TEXT
+    await bot.send_message(chat_id, text, reply_markup=markup)
+
+
+async def get_age_from_gpt(text, chat_id=None):
+    """As main.get_age_from_gpt: None only when the answer is not a number."""
+    response = await create_response(
+        "age", chat_id=chat_id, instructions=prompts.AGE_INSTRUCTIONS, input=text)
+    try:
+        return int(response.output_text.strip())
+    except (ValueError, TypeError) as e:
+        logger.error(f"Error generating age from chatGPT: {e}")
+        return None
+
+
+async def generate_report_text(milestones, age, observations, facts, result, chat_id=None, speculative=False):
+    """As main.generate_recommendations_new: model prose, locally rendered facts."""
+    try:
+        if SECTION_CACHE:
+            return await write_split_report(milestones, age, observations, facts, result, chat_id, speculative)
+        response = await create_response(
+            "report", chat_id=chat_id, instructions=prompts.PROSE_INSTRUCTIONS,
+            input=prompts.prose_input(milestones, age, observations, facts, result),
+            text=prompts.PROSE_FORMAT)
+        return local_report.render(result, observations,
+                                   prose=local_report.parse_prose(response.output_text))
+    except MODEL_UNAVAILABLE:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating recommendations from chatGPT: {e}")
+        return None
+
+
+async def write_split_report(milestones, age, observations, facts, result, chat_id=None, speculative=False):
+    """As main.write_split_report; on a miss both calls run concurrently, and
+    only the sections call announces a queue position."""
+    shape = section_cache.shape_of(result)
+    deadlines.timeout(None, "redis.sections")
+    metrics.REDIS_OPS.inc(op="sections")
+    with span("redis.sections"):
+        shared = await sections.get(shape, count=not speculative)
+    calls = [create_response(
+        "observations", chat_id=chat_id if shared is not None else None,
+        instructions=prompts.OBSERVATIONS_INSTRUCTIONS,
+        input=prompts.report_input(milestones, age, observations, facts),
+        text=prompts.OBSERVATIONS_FORMAT)]
+    if shared is None:
+        calls.append(create_response("sections", chat_id=chat_id, **section_cache.request(shape)))
+    responses = await asyncio.gather(*calls)
+    personal = section_cache.parse_observations(responses[0].output_text)
+    if shared is None:
+        shared = section_cache.parse_sections(responses[1].output_text)
+        metrics.REDIS_OPS.inc(op="sections")
+        with span("redis.sections"):
+            await sections.put(shape, shared)
+    return local_report.render(result, observations, prose=section_cache.stitch(personal, shared))
+
+
+# --------------------------------------------------------------------------
+# Keyboards
+# --------------------------------------------------------------------------
+
+def checklist_markup(options, ticks, age_group):
+    markup = types.InlineKeyboardMarkup()
+    for idx, option in enumerate(options):
+        status = "✅" if ticks[idx] else "⬜️"
+        markup.add(types.InlineKeyboardButton(f"{status} {option}".ljust(73, ' '),
+                                              callback_data=f"toggle_{idx}"))
+    if age_group != AGE_GROUPS[0]:
+        markup.add(types.InlineKeyboardButton("See Previous Milestones", callback_data="previous_milestones"))
+    markup.add(types.InlineKeyboardButton("Submit", callback_data="submit_checklist"))
+    markup.add(types.InlineKeyboardButton("Restart", callback_data="restart"))
+    return markup
+
+
+def email_markup():
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("Change Subject", callback_data="change_subject"),
+               types.InlineKeyboardButton("Change Body", callback_data="change_body"),
+               types.InlineKeyboardButton("Send Email", callback_data="send_email"))
+    return markup
+
+
+def restart_markup():
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("Restart", callback_data="restart"))
+    return markup
+
+
+async def show_checklist(chat_id, user_data, heading):
+    """Send the checklist for the session's current band, creating its ticks."""
+    age_group = user_data['age_group']
+    options = checklist_options[age_group]
+    ticks = user_data.setdefault('checklists', {}).setdefault(age_group, [False] * len(options))
+    await save_session(chat_id, user_data)
+    numbered_list = "\n".join(f"{idx + 1}. {option}" for idx, option in enumerate(options))
+    await bot.send_message(chat_id, f"{heading}\n\n{numbered_list}",
+                           reply_markup=checklist_markup(options, ticks, age_group))
+
+
+async def send_report(chat_id, recommendations):
+    """Send a report as MarkdownV2 chunks, in order."""
+    with span("markdown.escape", chat_id):
+        escaped_recommendations = escape_markdown_v2(recommendations)
+    chunks = split_message(
+        f"📝 Based on the screening, here are the recommendations for the child:\n\n{escaped_recommendations}",
+        max_length=4000
+    )
+    with span("telegram.send_report", chat_id):
+        sent = asyncio.gather(*[bot.submit("send_message", chat_id, chunk, parse_mode="MarkdownV2")
+                                for chunk in chunks])
+        if deadlines.nearly_spent("telegram.send_report"):
+            # Too late to wait, but the chunks still go out: hold the gather
+            # like a handler task, so shutdown waits for it and a failed send
+            # is logged rather than lost.
+            _tasks.add(sent)
+            sent.add_done_callback(_report_sent)
+        else:
+            await outbound.await_queued(sent, "telegram.send_report")
+
+
+def _report_sent(sent):
+    _tasks.discard(sent)
+    if not sent.cancelled() and sent.exception() is not None:
+        logger.warning("report send failed: %s", sent.exception())
+
+
+# --------------------------------------------------------------------------
+# Intake
+# --------------------------------------------------------------------------
+
+@bot.message_handler(commands=["start", "restart"])
+@tracked
+async def start(message):
+    """Handle /start and /restart commands."""
+    try:
+        await save_session(message.chat.id, {"awaiting": "name"})
+        await bot.send_message(message.chat.id, "Hello! Please enter the child's name", parse_mode="Markdown")
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error starting the bot: {e}")
+
+
+@bot.message_handler(commands=["history"])
+@tracked
+async def history(message):
+    """List this chat's archived reports, newest first."""
+    try:
+        metrics.REDIS_OPS.inc(op="archive")
+        with span("redis.archive", message.chat.id):
+            entries = await archive.entries(message.chat.id)
+        if not entries:
+            await bot.send_message(message.chat.id, "No saved reports yet. Press /start to run a screening.")
+            return
+        markup = types.InlineKeyboardMarkup()
+        for entry in entries:
+            label = entry.subject or datetime.fromtimestamp(entry.created).strftime('%d/%m/%y %H:%M')
+            markup.add(types.InlineKeyboardButton(label, callback_data=f"history_{entry.report_id}"))
+        await bot.send_message(message.chat.id, "Saved reports - choose one to see it again:", reply_markup=markup)
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error listing report history: {e}")
+        await bot.send_message(message.chat.id, "An error occurred while loading your reports. Please try again later.")
+
+
+@bot.message_handler(commands=["fast"])
+@tracked
+async def fast_report(message):
+    """Toggle the checklist-only report for the screening in progress."""
+    try:
+        user_data = await load_session(message.chat.id)
+        user_data['fast_report'] = not user_data.get('fast_report', False)
+        await save_session(message.chat.id, user_data)
+        if user_data['fast_report']:
+            await bot.send_message(message.chat.id, "Fast report on: this screening's report will be built from the "
+                                                    "checklist results right away, without the written interpretation. "
+                                                    "Send /fast again to turn it off.")
+        else:
+            await bot.send_message(message.chat.id, "Fast report off: this screening will get the full written report.")
+    except sessions.SessionExpired:
+        await bot.send_message(message.chat.id, "Press /start to begin a screening, then send /fast.")
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error toggling fast report: {e}")
+
+
+async def get_child_name(message, user_data):
+    await save_session(message.chat.id, {"name": message.text, "awaiting": "age"})
+    await bot.send_message(message.chat.id, "Thanks! Now, please enter the child's age (e.g., 2 years, 3 months).",
+                           parse_mode="Markdown")
+
+
+async def get_child_age(message, user_data):
+    try:
+        age = int(await get_age_from_gpt(message.text, chat_id=message.chat.id))
+        age_group = screening_logic.band_for_age(age).key
+    except screening_logic.OutOfScope:
+        await age_more_than_range(message)
+        return
+    except MODEL_UNAVAILABLE as e:
+        await reply_unavailable(message.chat.id, e)
+        return
+    except (ValueError, TypeError):
+        await bot.send_message(message.chat.id, "Invalid age. Please enter a valid age.")
+        return
+    user_data.pop("awaiting", None)
+    user_data["age"] = age
+    user_data["age_group"] = age_group
+    await show_checklist(message.chat.id, user_data, "Please select the milestones achieved:")
+
+
+async def save_observations(message, user_data):
+    user_data.pop("awaiting", None)
+    user_data['observations'] = message.text.strip()
+    await save_session(message.chat.id, user_data)
+    await bot.send_message(message.chat.id, "Observations saved successfully.")
+    await bot.send_message(message.chat.id, "Generating recommendations...")
+    await proceed_with_recommendations(message, user_data)
+
+
+async def set_new_subject(message, user_data):
+    user_data.pop("awaiting", None)
+    user_data['email_subject'] = message.text
+    await save_session(message.chat.id, user_data)
+    await bot.send_message(message.chat.id, f"Subject updated to: {message.text}")
+    await bot.send_message(message.chat.id, "You can now change the subject or body, or send the email.",
+                           reply_markup=email_markup())
+
+
+async def set_new_body(message, user_data):
+    user_data.pop("awaiting", None)
+    user_data['email_body'] = message.text
+    await save_session(message.chat.id, user_data)
+    await bot.send_message(message.chat.id, "Email body updated successfully.")
+    await bot.send_message(message.chat.id, "You can now change the subject or body, or send the email.",
+                           reply_markup=email_markup())
+
+
+STEPS = {
+    "name": get_child_name,
+    "age": get_child_age,
+    "observations": save_observations,
+    "subject": set_new_subject,
+    "body": set_new_body,
+}
+
+
+@bot.message_handler(func=lambda message: True, content_types=["text"])
+@tracked
+async def text_reply(message):
+    """Route free text to the step the chat is waiting on, if any."""
+    try:
+        user_data = await load_session(message.chat.id)
+        step = STEPS.get(user_data.get("awaiting"))
+        if step is not None:
+            await step(message, user_data)
+    except sessions.SessionExpired:
+        pass
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error handling text reply: {e}")
+        await bot.send_message(message.chat.id, "An error occurred. Please try again.")
+
+
+async def await_text(call, step, prompt):
+    user_data = await load_session(call.message.chat.id)
+    user_data["awaiting"] = step
+    await save_session(call.message.chat.id, user_data)
+    await bot.send_message(call.message.chat.id, prompt)
+
+
+# --------------------------------------------------------------------------
+# Checklist
+# --------------------------------------------------------------------------
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("toggle_"))
+@tracked
+async def toggle_checklist(call):
+    """Toggle the checked/unchecked state of an option."""
+    try:
+        user_id = call.message.chat.id
+        option_idx = int(call.data.split("_")[1])
+        user_data = await load_session(user_id)
+        age_group = user_data['age_group']
+        options = checklist_options[age_group]
+        ticks = user_data.setdefault('checklists', {}).setdefault(age_group, [False] * len(options))
+        ticks[option_idx] = not ticks[option_idx]
+        await save_session(user_id, user_data)
+        with span("telegram.edit_markup", user_id):
+            await bot.edit_message_reply_markup(
+                user_id, call.message.message_id,
+                reply_markup=checklist_markup(options, ticks, age_group))
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error toggling checklist: {e}")
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "previous_milestones")
+@tracked
+async def show_previous_milestones(call):
+    """Display the previous age group's milestones."""
+    try:
+        user_id = call.message.chat.id
+        user_data = await load_session(user_id)
+        current_index = AGE_GROUPS.index(user_data['age_group'])
+        if current_index > 0:
+            user_data['age_group'] = AGE_GROUPS[current_index - 1]
+            await show_checklist(user_id, user_data,
+                                 f"Showing milestones for {user_data['age_group']} months:")
+        else:
+            await bot.send_message(user_id, "No previous milestones available.")
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error showing previous milestones: {e}")
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "submit_checklist")
+@tracked
+async def submit_checklist(call):
+    """Handle checklist submission."""
+    try:
+        user_id = call.message.chat.id
+        user_data = await load_session(user_id)
+
+        achieved_milestones = [checklist_options[age_group][idx]
+                               for age_group, ticks in user_data['checklists'].items()
+                               for idx, achieved in enumerate(ticks) if achieved]
+        formatted_checklist = "\n".join(f"{idx + 1}. {milestone}"
+                                        for idx, milestone in enumerate(achieved_milestones))
+
+        current_age_group = user_data['age_group']
+        if all(user_data['checklists'].get(current_age_group, [])):
+            user_data.setdefault('achieved_milestones', []).extend(checklist_options[current_age_group])
+            current_index = AGE_GROUPS.index(current_age_group)
+            if current_index < len(AGE_GROUPS) - 1:
+                user_data['age_group'] = AGE_GROUPS[current_index + 1]
+                await bot.send_message(
+                    user_id,
+                    "🎉 Congratulations! You've completed all milestones for this age group.\n\nMoving on to the next set of milestones."
+                )
+                await show_checklist(user_id, user_data,
+                                     f"Showing milestones for {user_data['age_group']} months:")
+                return
+            await bot.send_message(
+                user_id, "🎉 Fantastic! You've reached the highest age group and completed all milestones.")
+
+        await bot.send_message(user_id, 'Milestones achieved by the child:\n' + formatted_checklist)
+
+        markup = types.InlineKeyboardMarkup()
+        markup.add(types.InlineKeyboardButton("Yes", callback_data="add_observations"),
+                   types.InlineKeyboardButton("No", callback_data="skip_observations"))
+        await bot.send_message(user_id, "Would you like to add any other observations?", reply_markup=markup)
+
+        user_data['formatted_checklist'] = formatted_checklist
+        await save_session(user_id, user_data)
+        await speculate_report(user_id, user_data)
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error submitting checklist: {e}")
+        await bot.send_message(call.message.chat.id, "An error occurred while submitting the checklist. Please try again later.")
+
+
+# --------------------------------------------------------------------------
+# Report
+# --------------------------------------------------------------------------
+
+def analyze_session(user_data, chat_id=None):
+    """The ScreeningResult for a session's age and checklists."""
+    with span("screening.analyze", chat_id):
+        return screening_logic.analyze(
+            user_data["age"],
+            {int(k): v for k, v in user_data.get('checklists', {}).items()},
+            checklist_options,
+            DOMAIN_TABLE,
+        )
+
+
+async def write_report(user_data, result, chat_id=None, speculative=False):
+    """As main.write_report; raises MODEL_UNAVAILABLE."""
+    with span("screening.facts_block"):
+        facts = screening_logic.build_facts_block(result)
+    return await generate_report_text(
+        user_data.get('formatted_checklist', ''), user_data["age"],
+        user_data.get('observations', ''), facts, result, chat_id, speculative)
+
+
+async def speculate_report(chat_id, user_data):
+    """Start writing the no-observations report before the user asks for it."""
+    if not SPECULATIVE_REPORTS or user_data.get('fast_report'):
+        return
+    try:
+        result = analyze_session(user_data, chat_id)
+    except screening_logic.OutOfScope:
+        return
+    # As in main: only on spare pool capacity, two slots on a section-cache
+    # miss (the sections and the observations run at once).
+    slots = 1
+    if SECTION_CACHE:
+        metrics.REDIS_OPS.inc(op="sections")
+        with span("redis.sections", chat_id):
+            if not await sections.contains(section_cache.shape_of(result)):
+                slots = 2
+    running, queued = model_pool.depth()
+    if running + queued + slots > model_pool.concurrency:
+        metrics.SPECULATIONS.inc(outcome="skipped")
+        return
+    speculator.start(chat_id, speculation.report_key(user_data),
+                     write_report, dict(user_data, observations=""), result, speculative=True)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "add_observations")
+@tracked
+async def add_observations(call):
+    """Prompt the user to add additional observations."""
+    try:
+        speculator.discard(call.message.chat.id)
+        await await_text(call, "observations", "Please enter any additional observations you'd like to add:")
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error prompting for observations: {e}")
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "skip_observations")
+@tracked
+async def skip_observations(call):
+    """Skip adding additional observations and proceed."""
+    try:
+        user_data = await load_session(call.message.chat.id)
+        user_data['observations'] = ""
+        await save_session(call.message.chat.id, user_data)
+        await bot.send_message(call.message.chat.id, "No additional observations added.")
+        await bot.send_message(call.message.chat.id, "Generating recommendations...")
+        await proceed_with_recommendations(call.message, user_data)
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error skipping observations: {e}")
+        await bot.send_message(call.message.chat.id, "An error occurred. Please try again.")
+
+
+async def persist_report(chat_id, user_data):
+    """Archive a freshly generated report and save the session once."""
+    metrics.REDIS_OPS.inc(op="archive")
+    with span("redis.archive", chat_id):
+        user_data['report_id'] = await archive.append(
+            chat_id, user_data['recommendations'],
+            subject=user_data['email_subject'], age=user_data["age"])
+    await save_session(chat_id, user_data)
+
+
+async def proceed_with_recommendations(message, user_data):
+    """Generate and send recommendations based on milestones and observations."""
+    chat_id = message.chat.id
+    try:
+        # As in main: every number comes from screening_logic, never the model.
+        try:
+            result = analyze_session(user_data, chat_id)
+        except screening_logic.OutOfScope as e:
+            logger.error(f"Screening out of scope: {e}")
+            await age_more_than_range(message)
+            return
+
+        # As in main: the speculative report if it still applies, preview now,
+        # and the local report if the model can't help.
+        fast = user_data.get('fast_report', False)
+        recommendations = None
+        draft = None
+        if fast or user_data.get('observations'):
+            speculator.discard(chat_id)
+        else:
+            draft = speculator.take(chat_id, speculation.report_key(user_data))
+        if not fast:
+            if REPORT_PREVIEW and not (draft and draft.done()):
+                await bot.send_message(chat_id, local_report.render_preview(result), priority=outbound.INTERACTIVE)
+            out_of_time = False
+            if draft is not None:
+                try:
+                    with span("report.speculative_wait", chat_id):
+                        recommendations = await outbound.await_queued(
+                            draft, "report.speculative_wait", reserve=deadlines.RESERVE)
+                    if recommendations and SECTION_CACHE:
+                        # As in main: the draft's shape is counted once it is used.
+                        await sections.seen(section_cache.shape_of(result))
+                except deadlines.DeadlineExceeded as e:
+                    draft.cancel()
+                    metrics.SPECULATIONS.inc(outcome="discarded")
+                    logger.warning("Speculative report not ready in time, sending the local report: %s", e)
+                    out_of_time = True
+                except Exception as e:
+                    logger.warning("Speculative report failed, writing it now: %s", e)
+            try:
+                if not recommendations and not out_of_time:
+                    with span("report.generate", chat_id):
+                        recommendations = await write_report(user_data, result, chat_id=chat_id)
+            except MODEL_UNAVAILABLE as e:
+                logger.warning("Model unavailable, sending the local report: %s", e)
+        local = not recommendations
+        if local:
+            with span("report.local", chat_id):
+                recommendations = local_report.render(result, user_data.get('observations', ''))
+            if not fast:
+                await bot.send_message(chat_id, "The written report isn't available right now, so here is "
+                                                "the report built from the checklist results.")
+        user_data['report_mode'] = "local" if local else "model"
+
+        default_subject = f"Milestones Report - {user_data['name']} - {datetime.now().strftime('%d/%m/%y %H:%M')}"
+        user_data['recommendations'] = recommendations
+        user_data['email_subject'] = default_subject
+        user_data['email_body'] = recommendations
+
+        await asyncio.gather(persist_report(chat_id, user_data), send_report(chat_id, recommendations))
+        logger.info("Report saved for chat %s: %s", HashedChat(chat_id), SessionSummary(user_data))
+
+        markup = types.InlineKeyboardMarkup()
+        markup.add(types.InlineKeyboardButton("Send Email", callback_data="send_email"),
+                   types.InlineKeyboardButton("Change Subject", callback_data="change_subject"),
+                   types.InlineKeyboardButton("Restart", callback_data="restart"))
+        if local and not fast:
+            markup.add(types.InlineKeyboardButton("Write Full Report", callback_data="retry_report"))
+        await bot.send_message(chat_id, "Email Subject: " + default_subject + "\n\nWould you like to email the report?",
+                               reply_markup=markup)
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error proceeding with recommendations: {e}")
+        await bot.send_message(chat_id, "An error occurred while generating recommendations. Please try again later.")
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "retry_report")
+@tracked
+async def retry_report(call):
+    """Ask the model for the written report after a local one was sent instead."""
+    try:
+        user_data = await load_session(call.message.chat.id)
+        user_data.pop('fast_report', None)
+        await bot.send_message(call.message.chat.id, "Generating recommendations...")
+        await proceed_with_recommendations(call.message, user_data)
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrying the report: {e}")
+        await bot.send_message(call.message.chat.id, "An error occurred. Please try again.")
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "generate_report")
+@tracked
+async def generate_report(call):
+    """Generate the report and display email options."""
+    try:
+        user_id = call.message.chat.id
+        user_data = await load_session(user_id)
+        default_subject = f"Milestones Report - {user_data['name']} - {datetime.now().strftime('%d/%m/%y %H:%M')}"
+        default_body = f"""
+Hello,
+
+Here are the development screening results for {user_data['name']},  This child is currently {format_years_months(user_data['age'])} months old and is performing in the {user_data['word_dev_age']} range according to ASHA Developmental Milestones. The recommendations for the team and family are to:
+
+{user_data['recommendations']}
+
+For exact age equivalencies a formal full speech and language screening is needed. See this https://www.asha.org/public/developmental-milestones/communication-milestones/ from ASHA for further recommendations.
+
+Best Regards,
+Milestones Bot
+    """
+        user_data['email_subject'] = default_subject
+        user_data['email_body'] = default_body
+        await save_session(user_id, user_data)
+
+        await bot.send_message(user_id, f"Subject: {default_subject}")
+        await bot.send_message(user_id, f"Body:\n{default_body}")
+        markup = email_markup()
+        markup.add(types.InlineKeyboardButton("Restart", callback_data="restart"))
+        await bot.send_message(user_id, "You can change the subject or body, or send the email.", reply_markup=markup)
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating report: {e}")
+        await bot.send_message(call.message.chat.id, "An error occurred while generating the report. Please try again.")
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("history_"))
+@tracked
+async def resend_report(call):
+    """Re-send an archived report as it was generated - no model call."""
+    try:
+        chat_id = call.message.chat.id
+        metrics.REDIS_OPS.inc(op="archive")
+        with span("redis.archive", chat_id):
+            record = await archive.get(chat_id, int(call.data.split("_", 1)[1]))
+        if record is None:
+            await bot.send_message(chat_id, "That report is no longer stored.")
+            return
+        await bot.send_message(chat_id, record["subject"] or "Saved report")
+        await send_report(chat_id, record["report"])
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error re-sending archived report: {e}")
+        await bot.send_message(call.message.chat.id, "An error occurred while loading the report. Please try again later.")
+
+
+# --------------------------------------------------------------------------
+# Email
+# --------------------------------------------------------------------------
+
+@bot.callback_query_handler(func=lambda call: call.data == "change_subject")
+@tracked
+async def change_subject(call):
+    """Prompt the user to enter a new subject."""
+    try:
+        await await_text(call, "subject", "Please enter a new subject:")
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error changing subject: {e}")
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "change_body")
+@tracked
+async def change_body(call):
+    """Prompt the user to enter a new body."""
+    try:
+        await await_text(call, "body", "Please enter a new body for the email:")
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error changing body: {e}")
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "send_email")
+@tracked
+async def send_email_action(call):
+    """Send the email using the stored subject and body."""
+    try:
+        user_id = call.message.chat.id
+        user_data = await load_session(user_id)
+        logger.info("Sending report email for chat %s: %s", HashedChat(user_id), SessionSummary(user_data))
+        if sessions.is_compacted(user_data):
+            await bot.send_message(user_id, "This report has been archived. Use /history to see it again, or restart to run a new screening.")
+            return
+
+        # smtplib blocks; keep it off the event loop. to_thread copies the
+        # context, so send_email_new's connection timeout follows the budget.
+        with span("email.send_all", user_id):
+            for to_email in clients.to_emails():
+                await asyncio.to_thread(send_email_new, user_data['email_subject'], user_data['email_body'], to_email)
+
+        user_data['emailed_at'] = int(time.time())
+        await save_session(user_id, user_data)
+        await bot.send_message(user_id, "Email sent successfully!")
+        await bot.send_message(user_id, "Would you like to restart?", reply_markup=restart_markup())
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error sending email: {e}")
+        await bot.send_message(call.message.chat.id, "An error occurred while sending the email. Please try again later.")
+
+
+async def age_more_than_range(message):
+    """Handler for children over 5 years old."""
+    try:
+        await bot.send_message(message.chat.id, "We are sorry, but our system only supports children up to 5 years old.")
+        await bot.send_message(message.chat.id, "You can restart the process.", reply_markup=restart_markup())
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error handling age more than 60: {e}")
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "restart")
+@tracked
+async def handle_restart_callback(call):
+    """Callback handler for the restart button."""
+    try:
+        await start(call.message)
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error handling restart callback: {e}")
+
+
+# --------------------------------------------------------------------------
+# ASGI
+# --------------------------------------------------------------------------
+
+async def _body(receive):
+    chunks = []
+    while True:
+        event = await receive()
+        chunks.append(event.get("body", b""))
+        if not event.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _respond(send, status, body, content_type=b"text/plain"):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type)]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _process(update):
+    try:
+        await bot.process_new_updates([update])
+    except Exception as e:
+        logger.error(f"Error processing update: {e}")
+
+
+async def _lifespan(receive, send):
+    while True:
+        event = await receive()
+        if event["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif event["type"] == "lifespan.shutdown":
+            if _tasks:
+                await asyncio.wait(_tasks, timeout=25)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """Webhook and /metrics, as a bare ASGI application."""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    path, method = scope["path"], scope["method"]
+
+    if method == "POST" and WEBHOOK_SECRET and path == f"/{WEBHOOK_SECRET}":
+        try:
+            update = types.Update.de_json((await _body(receive)).decode("utf8"))
+        except Exception as e:
+            logger.error(f"Error processing webhook: {e}")
+            await _respond(send, 500, b"error")
+            return
+        task = asyncio.create_task(_process(update))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+        await _respond(send, 200, b"ok")
+        return
+
+    if method == "GET" and path == "/metrics":
+        headers = dict(scope.get("headers") or [])
+        supplied = headers.get(b"authorization", b"").decode("latin-1")
+        if METRICS_SECRET and hmac.compare_digest(supplied, f"Bearer {METRICS_SECRET}"):
+            await _respond(send, 200, metrics.render().encode("utf-8"),
+                           b"text/plain; version=0.0.4")
+            return
+
+    await _respond(send, 404, b"not found")
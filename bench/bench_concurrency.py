@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Concurrent screenings: handler threads vs asyncio tasks, through the bot's own code.
+
+Each simulated screening makes the calls a real one waits on - an age call, a
+handful of Redis round trips and Telegram sends, then the report call. Only
+the clients are fake, and every call on them sleeps for a typical latency;
+what runs between the calls is the bot's: llm.call / llm.acall route and
+account the model calls, and every Telegram send goes through an
+outbound.Outbound queue, paced against the real rate limits. N screenings
+arrive at once:
+
+- threads-2:  TeleBot(threaded=True)'s default pool of two handler threads,
+              sending through outbound.PacedBot
+- threads-16: the same with a larger pool
+- asyncio:    one task per update on a single event loop, running aio.py's
+              own session, model and send_report coroutines over its
+              outbound.AsyncPacedBot
+
+The threaded runs call the model directly, so aio's model pool is sized to
+the screenings: this measures the runtimes, not MODEL_CONCURRENCY.
+
+It needs the bot's dependencies (aio imports telebot) but no network or
+credentials:
+
+    python bench/bench_concurrency.py [screenings] [report_ms]
+"""
+
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aio  # noqa: E402
+import clients  # noqa: E402
+import deadlines  # noqa: E402
+import llm  # noqa: E402
+import modelpool  # noqa: E402
+import outbound  # noqa: E402
+import prompts  # noqa: E402
+from common import escape_markdown_v2, split_message  # noqa: E402
+
+AGE_MS = 800.0
+REDIS_MS = 8.0
+TELEGRAM_MS = 120.0
+
+AGE_INPUT = "three years old"
+REPORT_TEXT = "## SPEECH AND LANGUAGE THERAPY REPORT\n\n" + "\n\n".join(
+    "## Section %d:\n  - A point about the child's milestones." % i for i in range(12))
+
+
+class Response(object):
+    def __init__(self, output_text):
+        self.output_text = output_text
+        self.usage = None
+
+
+class FakeModel(object):
+    """responses.create: "36" for the age call, the report otherwise."""
+
+    def __init__(self, report_ms, asynchronous=False):
+        self.report_ms = report_ms
+        self.asynchronous = asynchronous
+        self.responses = self
+
+    def _reply(self, params):
+        if params.get("input") == AGE_INPUT:
+            return AGE_MS / 1000.0, Response("36")
+        return self.report_ms / 1000.0, Response(REPORT_TEXT)
+
+    def create(self, **params):
+        seconds, response = self._reply(params)
+        if self.asynchronous:
+            return self._later(seconds, response)
+        time.sleep(seconds)
+        return response
+
+    async def _later(self, seconds, response):
+        await asyncio.sleep(seconds)
+        return response
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        time.sleep(REDIS_MS / 1000.0)
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        time.sleep(REDIS_MS / 1000.0)
+        self.values[key] = value
+
+
+class FakeAsyncRedis(FakeRedis):
+    async def get(self, key):
+        await asyncio.sleep(REDIS_MS / 1000.0)
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        await asyncio.sleep(REDIS_MS / 1000.0)
+        self.values[key] = value
+
+
+class FakeBot(object):
+    def send_message(self, chat_id, text, **kwargs):
+        time.sleep(TELEGRAM_MS / 1000.0)
+
+
+class FakeAsyncBot(object):
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(TELEGRAM_MS / 1000.0)
+
+
+def threaded(n, report_ms, workers):
+    bot = outbound.PacedBot(FakeBot(), outbound.Outbound())
+    redis, model = FakeRedis(), FakeModel(report_ms)
+
+    def screening(chat_id):
+        with deadlines.budget():
+            int(llm.call(model, "age", instructions=prompts.AGE_INSTRUCTIONS, input=AGE_INPUT).output_text)
+            redis.set(chat_id, "{}")
+            bot.send_message(chat_id, "checklist")
+            redis.get(chat_id)
+            report = llm.call(model, "report", input="facts").output_text
+            redis.set(chat_id, "{}")
+            chunks = split_message(escape_markdown_v2(report))
+            sent = [bot.submit("send_message", chat_id, chunk, parse_mode="MarkdownV2") for chunk in chunks]
+            for future in sent:
+                outbound.wait(future, "telegram.send_report")
+            bot.send_message(chat_id, "Send email?")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(screening, chat_id) for chat_id in range(n)]:
+            future.result()
+    return time.perf_counter() - start
+
+
+def tasks(n, report_ms):
+    aio.bot = outbound.AsyncPacedBot(FakeAsyncBot(), outbound.Outbound())
+    aio.r = FakeAsyncRedis()
+    aio.model_pool = modelpool.AsyncModelPool(concurrency=n, max_queue=n)
+    model = FakeModel(report_ms, asynchronous=True)
+    clients.async_openai_client = lambda: model
+
+    async def screening(chat_id):
+        with deadlines.budget():
+            await aio.get_age_from_gpt(AGE_INPUT)
+            await aio.save_session(chat_id, {"awaiting": "checklist"})
+            await aio.bot.send_message(chat_id, "checklist")
+            user_data = await aio.load_session(chat_id)
+            report = (await aio.create_response("report", input="facts")).output_text
+            await aio.save_session(chat_id, user_data)
+            await aio.send_report(chat_id, report)
+            await aio.bot.send_message(chat_id, "Send email?")
+
+    async def run():
+        await asyncio.gather(*[screening(chat_id) for chat_id in range(n)])
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    report_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 2000.0
+    one = (AGE_MS + report_ms + 3 * REDIS_MS + 3 * TELEGRAM_MS) / 1000.0
+    print("%d screenings, at least %.0f ms of waiting each" % (n, one * 1000))
+    for name, elapsed in (("threads-2", threaded(n, report_ms, 2)),
+                          ("threads-16", threaded(n, report_ms, 16)),
+                          ("asyncio", tasks(n, report_ms))):
+        print("%-11s %8.2f s  %6.1f screenings/s" % (name, elapsed, n / elapsed))
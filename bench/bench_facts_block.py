@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""FACTS block build time: per-report regrouping vs precompiled fragments.
+
+Renders the same screening results both ways - with the compiled
+FactsTemplates attached (the runtime path) and with them detached, which falls
+back to regrouping the milestone entries on every call as the bot used to.
+
+    python bench/bench_facts_block.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import screening_logic as sl  # noqa: E402
+from catalog import DOMAIN_TABLE, checklist_options  # noqa: E402
+
+RUNS = 20
+
+
+def sample_results(n=200, seed=7):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        age = rng.randint(0, 60)
+        chrono = sl.band_for_age(age).key
+        administered = [b.key for b in sl.BANDS if b.key <= chrono and rng.random() < 0.6]
+        administered.append(chrono)
+        checklists = {k: [rng.random() < 0.6 for _ in checklist_options[k]]
+                      for k in set(administered)}
+        out.append(sl.analyze(age, checklists, checklist_options, DOMAIN_TABLE))
+    return out
+
+
+def per_call_us(results):
+    seconds = min(timeit.repeat(lambda: [sl.build_facts_block(r) for r in results],
+                                number=RUNS, repeat=5))
+    return seconds / (RUNS * len(results)) * 1e6
+
+
+if __name__ == "__main__":
+    results = sample_results()
+    templated = per_call_us(results)
+
+    templates = [r.templates for r in results]
+    for r in results:
+        r.templates = None
+    regrouped = per_call_us(results)
+    for r, t in zip(results, templates):
+        r.templates = t
+
+    print("%-12s %10s" % ("", "us/block"))
+    print("%-12s %10.1f" % ("regrouped", regrouped))
+    print("%-12s %10.1f" % ("templated", templated))
+    print("speedup x%.1f" % (regrouped / templated))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Per-report logging cost: the old verbatim session/HTML logging vs logsafe.
+
+Replays the log calls one report makes (proceed_with_recommendations, send_email
+per recipient, send_email_action) against a representative session, with a
+handler that counts the bytes it would have written.
+
+    python bench/bench_logging.py
+"""
+
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logsafe  # noqa: E402
+from logsafe import HashedChat, SessionSummary  # noqa: E402
+
+RECIPIENTS = 2
+RUNS = 2000
+
+REPORT = ("## SPEECH AND LANGUAGE THERAPY REPORT\n\n"
+          + "  - **Expressive Language:** uses two-word combinations in play.\n" * 90)
+HTML = "<p>" + REPORT.replace("\n", "</p><p>") + "</p>"
+
+SESSION = {
+    "name": "Alex Example",
+    "age": 24,
+    "age_group": 24,
+    "checklists": {24: [True, True, True, True, False, False],
+                   18: [True] * 8},
+    "formatted_checklist": "\n".join("%d. milestone text number %d" % (i, i) for i in range(14)),
+    "observations": "Points at objects but does not use any words yet. " * 4,
+    "recommendations": REPORT,
+    "email_subject": "Milestones Report - Alex Example - 19/10/26 10:00",
+    "email_body": REPORT,
+}
+
+
+class Sink(object):
+    """A stream that keeps only a byte count."""
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, text):
+        self.written += len(text.encode("utf-8"))
+
+    def flush(self):
+        pass
+
+
+def make_logger(name, sink):
+    logger = logging.getLogger("bench." + name)
+    logger.handlers[:] = [logging.StreamHandler(sink)]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def old_style(logger):
+    chat_id = 123456789
+    logger.info(f"User id: {chat_id}")
+    logger.info(f"UserId data type: {type(chat_id)}")
+    logger.info(f"User data saved before redis: {SESSION}")
+    logger.info(f"User data saved from redis: {SESSION}")
+    logger.info(f"User id in send email: {chat_id}")
+    logger.info(f"UserId data type in send email: {type(chat_id)}")
+    logger.info(f"User data in Send Email: {SESSION}")
+    for _ in range(RECIPIENTS):
+        logger.info(f"Email sent successfully" + HTML)
+
+
+def new_style(logger):
+    chat_id = 123456789
+    logger.info("Report saved for chat %s: %s", HashedChat(chat_id), SessionSummary(SESSION))
+    logger.info("Sending report email for chat %s: %s",
+                HashedChat(chat_id), SessionSummary(SESSION))
+    logsafe.dump(logger, "User data in Send Email", SESSION)
+    for _ in range(RECIPIENTS):
+        logger.info("Sending email (%d chars html)", len(HTML))
+        logsafe.dump(logger, "Email html", HTML)
+
+
+def measure(fn):
+    sink = Sink()
+    logger = make_logger(fn.__name__, sink)
+    fn(logger)
+    volume = sink.written
+    seconds = min(timeit.repeat(lambda: fn(logger), number=RUNS, repeat=3))
+    return seconds / RUNS * 1e6, volume
+
+
+if __name__ == "__main__":
+    old_us, old_bytes = measure(old_style)
+    new_us, new_bytes = measure(new_style)
+    print("%-10s %12s %14s" % ("", "us/report", "bytes/report"))
+    print("%-10s %12.1f %14d" % ("verbatim", old_us, old_bytes))
+    print("%-10s %12.1f %14d" % ("logsafe", new_us, new_bytes))
+    print("cpu x%.1f less, log volume x%.0f less"
+          % (old_us / new_us, old_bytes / float(new_bytes)))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Wall time from "report generated" to "email buttons shown".
+
+Replays the I/O proceed_with_recommendations does after the model returns,
+with each round trip replaced by a sleep of typical latency:
+
+- serial:     archive, save, send chunks, save again, send keyboard
+              (the read-back only ran with LOG_FULL_PAYLOADS, so it is left out)
+- overlapped: archive + one save on a background thread while the chunks go
+              out in order; join before the keyboard
+
+    python bench/bench_post_generation.py [telegram_ms] [redis_ms]
+"""
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNKS = 3  # a typical report is 9-11k chars of MarkdownV2: three 4000-char chunks
+
+
+def serial(telegram, redis, log):
+    for op in ("archive", "save"):
+        time.sleep(redis)
+        log.append(op)
+    for i in range(CHUNKS):
+        time.sleep(telegram)
+        log.append("chunk%d" % i)
+    time.sleep(redis)
+    log.append("save")
+    time.sleep(telegram)
+    log.append("keyboard")
+
+
+def overlapped(telegram, redis, log, pool):
+    def persist():
+        for op in ("archive", "save"):
+            time.sleep(redis)
+            with lock:
+                log.append(op)
+
+    lock = threading.Lock()
+    saved = pool.submit(persist)
+    for i in range(CHUNKS):
+        time.sleep(telegram)
+        with lock:
+            log.append("chunk%d" % i)
+    saved.result()
+    time.sleep(telegram)
+    log.append("keyboard")
+
+
+def measure(run, runs=5):
+    best = None
+    for _ in range(runs):
+        log = []
+        start = time.perf_counter()
+        run(log)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, log
+
+
+if __name__ == "__main__":
+    telegram_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 120.0
+    redis_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 8.0
+    t, r = telegram_ms / 1000.0, redis_ms / 1000.0
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        serial_ms, _ = measure(lambda log: serial(t, r, log))
+        overlapped_ms, log = measure(lambda log: overlapped(t, r, log, pool))
+    chunks = [op for op in log if op.startswith("chunk")]
+    print("telegram %.0f ms, redis %.0f ms, %d chunks" % (telegram_ms, redis_ms, CHUNKS))
+    print("%-11s %8.1f ms" % ("serial", serial_ms))
+    print("%-11s %8.1f ms" % ("overlapped", overlapped_ms))
+    print("bound (sends only) %.1f ms; chunk order kept: %s"
+          % ((CHUNKS + 1) * telegram_ms, chunks == sorted(chunks) and log[-1] == "keyboard"))
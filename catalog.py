@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""The milestone catalog: one file, one in-memory index, every consumer.
+
+The milestone text used to live in four places - checklist_options.json,
+suggestions.json, the positional domain map in milestone_domains.py and a
+hand-copied ASHA list inside the report prompt - and they had to be edited in
+lockstep. milestones_catalog.json is now the only copy. Each milestone carries
+a stable id, its band (from the band it is listed under), its position, its
+communication domain with the clinical rationale for ambiguous calls, and its
+text; each band lists the parent-activity suggestions that go with it, and
+each suggestion lists the milestones it `addresses`, so a prompt or report can
+offer only the activities aimed at what the child has not met yet.
+
+The file is parsed and validated once, at import, into a Catalog. The
+keyboards, analyze(), the FACTS block, prompt assembly, prod_check and the eval
+harness all read the same object, so nothing re-reads or re-scans the text.
+
+Position still matters: sessions store ticks as a per-band list of booleans, so
+reordering milestones within a band changes what an in-flight session's ticks
+mean. Append rather than reorder, and give new milestones new ids.
+
+Domain assignments: NOTE reviewed by <clinician> on <date> - pending sign-off.
+Suggestion links (`addresses`): likewise pending sign-off. A suggestion with no
+links is general advice, offered only when nothing targeted applies.
+"""
+
+import json
+import os
+from collections import OrderedDict, namedtuple
+
+from screening_logic import BAND_BY_KEY, DOMAIN_ORDER, DomainTable
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "milestones_catalog.json")
+
+Milestone = namedtuple("Milestone", ["id", "band", "index", "domain", "text", "domain_note"])
+Suggestion = namedtuple("Suggestion", ["id", "text", "addresses"])
+
+
+class CatalogError(Exception):
+    """milestones_catalog.json is malformed or internally inconsistent."""
+
+
+class Catalog(object):
+    """Indexed, read-only view of the milestone catalog."""
+
+    def __init__(self, raw):
+        problems = []
+        milestones = []
+        by_id = {}
+        by_band = OrderedDict()
+        band_suggestions = OrderedDict()
+        suggestion_by_id = OrderedDict(
+            (sid, Suggestion(sid, s.get("text"), tuple(s.get("addresses", ()))))
+            for sid, s in raw.get("suggestions", {}).items())
+
+        for band in raw.get("bands", []):
+            key = band.get("key")
+            if key not in BAND_BY_KEY:
+                problems.append("unknown band %r" % (key,))
+                continue
+            if key in by_band:
+                problems.append("band %r listed twice" % (key,))
+                continue
+            entries = []
+            for index, m in enumerate(band.get("milestones", [])):
+                milestone = Milestone(m.get("id"), key, index, m.get("domain"), m.get("text"),
+                                      m.get("domain_note"))
+                if not milestone.id or not milestone.text:
+                    problems.append("band %r milestone %d has no id or text" % (key, index))
+                elif milestone.id in by_id:
+                    problems.append("duplicate milestone id %r" % milestone.id)
+                if milestone.domain not in DOMAIN_ORDER:
+                    problems.append("%r has unknown domain %r" % (milestone.id, milestone.domain))
+                by_id[milestone.id] = milestone
+                entries.append(milestone)
+                milestones.append(milestone)
+            by_band[key] = tuple(entries)
+
+            linked = []
+            for sid in band.get("suggestions", []):
+                if sid not in suggestion_by_id:
+                    problems.append("band %r links unknown suggestion %r" % (key, sid))
+                else:
+                    linked.append(suggestion_by_id[sid])
+            band_suggestions[key] = tuple(linked)
+
+        addressed_by = {}
+        for suggestion in suggestion_by_id.values():
+            for mid in suggestion.addresses:
+                milestone = by_id.get(mid)
+                if milestone is None:
+                    problems.append("%r addresses unknown milestone %r" % (suggestion.id, mid))
+                elif suggestion not in band_suggestions.get(milestone.band, ()):
+                    problems.append("%r addresses %r but is not listed in its band"
+                                    % (suggestion.id, mid))
+        for key, linked in band_suggestions.items():
+            for suggestion in linked:
+                for mid in suggestion.addresses:
+                    if by_id.get(mid) is not None and by_id[mid].band == key:
+                        addressed_by.setdefault(mid, []).append(suggestion)
+
+        if problems:
+            raise CatalogError("milestones_catalog.json: " + "; ".join(problems))
+
+        self.milestones = tuple(milestones)
+        self.by_id = by_id
+        self.by_band = by_band
+        self.suggestion_by_id = suggestion_by_id
+        self.band_suggestions = band_suggestions
+        self.addressed_by = {mid: tuple(ss) for mid, ss in addressed_by.items()}
+
+        # The shapes the rest of the code has always consumed, built once.
+        self.checklist_options = {k: [m.text for m in ms] for k, ms in by_band.items()}
+        self.suggestions = {k: [s.text for s in ss] for k, ss in band_suggestions.items()}
+        self.domain_table = DomainTable(
+            (k, tuple(m.domain for m in ms)) for k, ms in by_band.items())
+        self._reference = {}
+
+    def milestone(self, band_key, index):
+        return self.by_band[band_key][index]
+
+    def ids(self, entries):
+        """Milestone ids for analyze()-style (band_key, idx, ...) entries."""
+        return tuple(self.by_band[e[0]][e[1]].id for e in entries)
+
+    def suggestions_for(self, milestone_id):
+        """Parent-activity suggestions that address a milestone, in band order."""
+        return self.addressed_by.get(milestone_id, ())
+
+    def targeted_suggestions(self, band_key, milestone_ids):
+        """The band's suggestions addressing any of `milestone_ids`, in band order.
+
+        The band's whole list when none do - nothing unmet, or nothing linked -
+        so there is always enrichment to offer.
+        """
+        wanted = set()
+        for mid in milestone_ids:
+            wanted.update(s.id for s in self.addressed_by.get(mid, ()))
+        band = self.band_suggestions.get(band_key, ())
+        return tuple(s for s in band if s.id in wanted) or band
+
+    def reference_text(self, band_keys=None):
+        """The ASHA milestone list for the report prompt, one block per band.
+
+        Rendered once per distinct band selection and cached.
+        """
+        keys = tuple(sorted(self.by_band if band_keys is None else band_keys))
+        text = self._reference.get(keys)
+        if text is None:
+            blocks = []
+            for key in keys:
+                lines = ["[%s:]" % BAND_BY_KEY[key].label]
+                lines.extend(m.text.strip() for m in self.by_band[key])
+                blocks.append("\n".join(lines) + "\n\n")
+            text = self._reference[keys] = "".join(blocks)
+        return text
+
+
+def load(path=CATALOG_PATH):
+    with open(path, encoding="utf-8") as f:
+        return Catalog(json.load(f, object_pairs_hook=OrderedDict))
+
+
+CATALOG = load()
+
+checklist_options = CATALOG.checklist_options
+suggestions = CATALOG.suggestions
+DOMAIN_TABLE = CATALOG.domain_table
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""What main.py (threads) and aio.py (asyncio) share besides the clients.
+
+aio.py used to import these from main, and importing main builds the Flask
+app, a second Outbound with its sender threads, the model pool's executors and
+the FACTS templates - none of which the asyncio runtime uses. This module holds
+only the feature flags and secrets, the user-facing texts, the message
+formatting and the email senders, and importing it starts nothing.
+"""
+
+import logging
+import os
+import re
+import smtplib
+from email.mime.text import MIMEText
+
+import markdown
+from dotenv import load_dotenv
+
+import clients
+import deadlines
+import logsafe
+import metrics
+from instrumentation import span
+
+# Before the settings below are read; main.py loads it again, harmlessly.
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+METRICS_SECRET = os.environ.get("METRICS_SECRET")
+
+# Send the locally rendered summary while the model writes the full report.
+REPORT_PREVIEW = os.environ.get("REPORT_PREVIEW", "1").lower() in ("1", "true", "yes")
+
+# Start the no-observations report at checklist submission, while the user is
+# still answering "add observations?" (see speculation.py). Only ever on spare
+# pool capacity, so it never queues ahead of someone's real request.
+SPECULATIVE_REPORTS = os.environ.get("SPECULATIVE_REPORTS", "1").lower() in ("1", "true", "yes")
+
+# Write the two Recommendations sections once per band and unmet set, and only
+# the observations per child (see section_cache.py).
+SECTION_CACHE = os.environ.get("SECTION_CACHE", "1").lower() in ("1", "true", "yes")
+
+# List only the result's bands in the full-report prompt (prompts.prompt_bands).
+# Off until an eval shows it scores no lower than the full list:
+#     python evals/eval_harness.py --label full --mode full
+#     python evals/eval_harness.py --label trimmed --mode trimmed
+#     python evals/eval_harness.py --compare full trimmed
+TRIMMED_PROMPT = os.environ.get("TRIMMED_PROMPT", "0").lower() in ("1", "true", "yes")
+
+
+BUSY_TEXT = "We're handling a lot of screenings right now. Please try again in a few minutes."
+PAUSED_TEXT = ("Our report service is having trouble right now, so we've paused it. "
+               "Please try again in a minute or two.")
+
+
+def escape_markdown_v2(text):
+    """Escape characters for Telegram MarkdownV2."""
+    escape_chars = r'_*[]()~`>#+-=|{}.!'
+    return re.sub(r'([%s])' % re.escape(escape_chars), r'\\\1', text)
+
+def split_message(text, max_length=4000):
+    """
+    Splits a long message into smaller chunks to comply with Telegram's message length limits.
+    
+    Args:
+        text (str): The original message text to split.
+        max_length (int): The maximum length of each chunk. Default is 4000 to provide a buffer below Telegram's 4096 limit.
+    
+    Returns:
+        List[str]: A list of message chunks.
+    """
+    messages = []
+    paragraphs = text.split('\n\n')  # Split text by double newlines (paragraphs)
+    
+    current_message = ""
+    for para in paragraphs:
+        # Check if adding the next paragraph exceeds the max_length
+        if len(current_message) + len(para) + 2 <= max_length:
+            current_message += para + '\n\n'
+        else:
+            if current_message:
+                messages.append(current_message.strip())
+            current_message = para + '\n\n'
+    
+    # Append any remaining text
+    if current_message:
+        messages.append(current_message.strip())
+    
+    return messages
+
+
+# Per SMTP connection, shortened to what is left of the update.
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", 15))
+
+def send_email(subject, message, to_email):
+    from markdownmail import MarkdownMail
+
+    smtp = clients.smtp_settings()
+    smtp_server = smtp.server
+    smtp_port = smtp.port
+    smtp_login = smtp.login
+    smtp_password = smtp.password
+    from_email = smtp.from_email
+
+    from_name = "Milestones Bot"
+    from_addr = f"{from_name} <{from_email}>"
+
+    html = markdown.markdown(message)
+    email = MarkdownMail(
+        from_addr=from_addr, to_addr=to_email, subject=subject, content=html
+    )
+    logger.info("Sending email (%d chars html)", len(html))
+    logsafe.dump(logger, "Email html", html)
+    try:
+        with span("smtp.send"):
+            email.send(
+                smtp_server, login=smtp_login, password=smtp_password, port=smtp_port
+            )
+        metrics.SMTP_SENDS.inc(outcome="ok")
+        logger.info("Email sent successfully")
+
+    except Exception as e:
+        metrics.SMTP_SENDS.inc(outcome="error")
+        logger.exception("Error sending email: %s", e)
+
+def send_email_new(subject, message, to_email):
+       """
+       Sends an email with the given subject and message to the specified recipient.
+
+       Args:
+           subject (str): The subject of the email.
+           message (str): The body of the email. Supports plain text and HTML content.
+           to_email (str): The recipient's email address.
+       """
+       # Retrieve SMTP configuration from environment variables
+       smtp = clients.smtp_settings(default_port=587)  # Default to 587 if not set
+       smtp_server = smtp.server
+       smtp_port = smtp.port
+       smtp_login = smtp.login
+       smtp_password = smtp.password
+       from_email = smtp.from_email
+
+       from_name = "Milestones Bot"
+       from_addr = f"{from_name} <{from_email}>"
+
+       # Create MIMEText object for the email content
+       html = markdown.markdown(message)
+       logger.info("Sending email (%d chars html)", len(html))
+       logsafe.dump(logger, "Email html", html)
+       msg = MIMEText(html, 'html')  # Use 'plain' for plain text emails
+       msg['Subject'] = subject
+       msg['From'] = from_addr
+       msg['To'] = to_email
+
+       try:
+           # Establish connection with the SMTP server
+           timeout = deadlines.timeout(SMTP_TIMEOUT, "smtp.send")
+           with span("smtp.send"), smtplib.SMTP(smtp_server, smtp_port, timeout=timeout) as server:
+               server.starttls()  # Secure the connection
+               server.login(smtp_login, smtp_password)  # Log in to the SMTP server
+               server.sendmail(from_addr, [to_email], msg.as_string())  # Send the email
+
+           metrics.SMTP_SENDS.inc(outcome="ok")
+           logger.info("Email sent successfully")
+       except Exception as e:
+           metrics.SMTP_SENDS.inc(outcome="error")
+           logger.exception("Error sending email: %s", e)
+
+
+def format_years_months(months):
+    years = months // 12
+    remaining_months = months % 12
+    
+    result = f"{years} years, {remaining_months} months" if years else f"{remaining_months} months"
+    
+    return result
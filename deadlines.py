@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""A time budget per Telegram update, shared by every I/O call it makes.
+
+Each call had its own timeout, or none at all: Redis blocked forever, the
+model had OPENAI_TIMEOUT, SMTP and Telegram sends whatever their libraries
+defaulted to. Each was reasonable alone, but they added up. A slow Redis read,
+then a slow model call, then a slow SMTP server could run past gunicorn's 60 s
+worker timeout and kill the worker mid-report, losing the report and every
+other update that worker held.
+
+`tracked` now opens a Deadline of UPDATE_BUDGET seconds for each update and
+keeps it in a context variable. I/O code asks it for what is left instead of
+being handed it:
+
+- `timeout(cap, step)` is the timeout for one call: `cap`, shortened to the
+  remaining budget (less `reserve`). It raises DeadlineExceeded when nothing
+  is left, so a call that cannot finish is never started;
+- `nearly_spent(step)` is how a handler degrades: when fewer than RESERVE
+  seconds remain it takes the path that does not wait, such as leaving report
+  chunks or the email to be delivered from the queue after the handler returns.
+
+Outside an update (tools, background work, speculative reports) there is no
+deadline: `timeout()` returns `cap` and `nearly_spent()` is False. Model pool
+threads run the submitting update's context, so its budget follows the call
+(see modelpool.py).
+"""
+
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# Under gunicorn's --timeout 60, with room to log and answer the webhook.
+UPDATE_BUDGET = float(os.environ.get("UPDATE_BUDGET_SECONDS", 55))
+# Below this a handler stops waiting on slow work and degrades instead.
+RESERVE = float(os.environ.get("UPDATE_RESERVE_SECONDS", 8))
+
+
+class DeadlineExceeded(Exception):
+    """The update's budget is spent; the call was not attempted."""
+
+    def __init__(self, step):
+        Exception.__init__(self, "update budget spent before %s" % step)
+        self.step = step
+
+
+class Deadline(object):
+
+    def __init__(self, seconds, clock=time.monotonic):
+        self.clock = clock
+        self.expires = clock() + seconds
+
+    def remaining(self):
+        return self.expires - self.clock()
+
+    def timeout(self, cap, step, reserve=0.0):
+        available = self.remaining() - reserve
+        if available <= 0:
+            metrics.DEADLINES.inc(step=step, outcome="exceeded")
+            raise DeadlineExceeded(step)
+        return available if cap is None else min(cap, available)
+
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def budget(seconds=UPDATE_BUDGET, clock=time.monotonic):
+    """Run the block under a deadline; a block already under one keeps it."""
+    if _current.get() is not None:
+        yield _current.get()
+        return
+    token = _current.set(Deadline(seconds, clock))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def remaining():
+    """Seconds left in the current update, or None outside one."""
+    deadline = _current.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def timeout(cap, step, reserve=0.0):
+    """The timeout for one call at `step`; raises DeadlineExceeded if none is left."""
+    deadline = _current.get()
+    return cap if deadline is None else deadline.timeout(cap, step, reserve)
+
+
+def nearly_spent(step, reserve=RESERVE):
+    """True, and counted, when `step` should degrade rather than wait."""
+    left = remaining()
+    if left is None or left >= reserve:
+        return False
+    metrics.DEADLINES.inc(step=step, outcome="degraded")
+    return True
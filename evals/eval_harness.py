@@ -11,6 +11,14 @@ Usage (from project root):
     python evals/eval_harness.py --label baseline
     python evals/eval_harness.py --label candidate
     python evals/eval_harness.py --compare baseline candidate
+
+--mode picks the report prompt: "sections" (prose as JSON, with the
+Recommendations sections shared through main's section cache - the default),
+"structured" (all the prose in one call), "full" (the model writes the whole
+report against every band's milestones) or "trimmed" (the same, listing only
+the case's bands; main's TRIMMED_PROMPT is turned on for the run). --tokens prints each case's prompt size in every mode,
+without calling the API; for "sections" that is the per-child call a cache hit
+leaves.
 """
 
 import argparse
@@ -25,10 +33,15 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 RESULTS_DIR = os.path.join(PROJECT_ROOT, "evals", "results")
 sys.path.insert(0, PROJECT_ROOT)
 
+import prompts  # noqa: E402
 import screening_logic as sl  # noqa: E402
+from catalog import DOMAIN_TABLE  # noqa: E402
+from catalog import checklist_options as CHECKLIST_OPTIONS  # noqa: E402
 
 REPORT_ITERATIONS = 2
 
+MODES = ("sections", "structured", "trimmed", "full")
+
 # ---------------------------------------------------------------- normalising
 
 _QUOTES = dict.fromkeys(map(ord, "‘’ʼ“”"), "'")
@@ -238,20 +251,90 @@ def score_report(text, case, truth, checklist_options):
     return checks
 
 
+# ---------------------------------------------------------------- prompt size
+
+def count_tokens(text):
+    """Tokens in `text`: exact if tiktoken is installed, else a chars/4 estimate."""
+    try:
+        import tiktoken
+    except ImportError:
+        return (len(text) + 3) // 4
+    return len(tiktoken.get_encoding("o200k_base").encode(text))
+
+
+def achieved_message(truth):
+    """The message the bot builds today: a numbered list of achieved milestones."""
+    return "\n".join("%d. %s" % (i + 1, m[2]) for i, m in enumerate(truth.met))
+
+
+def prompt_tokens(mode, case, truth):
+    """Input tokens (instructions + user message) of one report call in `mode`."""
+    user = prompts.report_input(achieved_message(truth), case["age"], case["observations"],
+                                sl.build_facts_block(truth))
+    if mode == "sections":
+        instructions = prompts.OBSERVATIONS_INSTRUCTIONS
+    elif mode == "structured":
+        instructions = prompts.PROSE_INSTRUCTIONS
+        user = prompts.prose_input(achieved_message(truth), case["age"], case["observations"],
+                                   sl.build_facts_block(truth), truth)
+    else:
+        instructions = prompts.report_instructions(
+            prompts.prompt_bands(truth) if mode == "trimmed" else None)
+    return count_tokens(instructions) + count_tokens(user)
+
+
+def token_report():
+    cases = build_report_cases(CHECKLIST_OPTIONS)
+    totals = dict.fromkeys(MODES, 0)
+    print("%-28s %10s %10s %10s %10s %8s" % ("case", "full", "trimmed", "structured", "sections",
+                                              "saved"))
+    for case in cases:
+        truth = sl.analyze(case["age"], case["checklists"], CHECKLIST_OPTIONS, DOMAIN_TABLE)
+        sizes = {mode: prompt_tokens(mode, case, truth) for mode in MODES}
+        for mode in MODES:
+            totals[mode] += sizes[mode]
+        print("%-28s %10d %10d %10d %10d %7.0f%%" % (
+            case["id"], sizes["full"], sizes["trimmed"], sizes["structured"], sizes["sections"],
+            100.0 * (sizes["full"] - sizes["trimmed"]) / sizes["full"]))
+    print("%-28s %10d %10d %10d %10d %7.0f%%" % (
+        "total", totals["full"], totals["trimmed"], totals["structured"], totals["sections"],
+        100.0 * (totals["full"] - totals["trimmed"]) / totals["full"]))
+    try:
+        import tiktoken  # noqa: F401
+    except ImportError:
+        print("(estimated at 4 characters per token; install tiktoken for exact counts)")
+
+
 # ---------------------------------------------------------------- run
 
-def run(label):
+def run(label, mode=None):
     os.chdir(PROJECT_ROOT)
     import main  # noqa: E402
-    import milestone_domains as md  # noqa: E402
 
-    accepts_facts = "facts" in inspect.signature(
-        main.generate_recommendations_new).parameters
+    domains = DOMAIN_TABLE
+
+    params = inspect.signature(main.generate_recommendations_new).parameters
+    accepts_facts = "facts" in params
+    # Structured mode: the model writes the prose, the result renders the rest.
+    accepts_result = "result" in params
+    split = hasattr(main, "SECTION_CACHE")
+    if mode is None:
+        mode = ("sections" if split else "structured") if accepts_result else "full"
+    if mode == "trimmed" and not hasattr(main, "TRIMMED_PROMPT"):
+        sys.exit("this main.py cannot write a trimmed-prompt report")
+    if mode == "sections" and not split:
+        sys.exit("this main.py cannot write a split report")
+    if split:
+        main.SECTION_CACHE = mode == "sections"
+    if hasattr(main, "TRIMMED_PROMPT"):
+        main.TRIMMED_PROMPT = mode == "trimmed"
 
     results = {
         "label": label,
         "openai_version": __import__("openai").__version__,
         "facts_block_wired": accepts_facts,
+        "structured_report": accepts_result and mode in ("structured", "sections"),
+        "mode": mode,
         "age_extraction": [],
         "reports": [],
     }
@@ -268,20 +351,27 @@ def run(label):
         print("  %s  %r -> %s (expected %s) [%ss]"
               % ("PASS" if ok else "FAIL", case["input"], got, case["expected"], elapsed))
 
-    cases = build_report_cases(main.checklist_options)
-    print("=== Reports (%d cases x %d runs, facts_block=%s) ==="
-          % (len(cases), REPORT_ITERATIONS, accepts_facts))
+    cases = build_report_cases(CHECKLIST_OPTIONS)
+    print("=== Reports (%d cases x %d runs, facts_block=%s, mode=%s) ==="
+          % (len(cases), REPORT_ITERATIONS, accepts_facts, mode))
 
     for case in cases:
         truth = sl.analyze(case["age"], case["checklists"],
-                           main.checklist_options, md.MILESTONE_DOMAINS)
-        # The message the bot builds today: a numbered list of achieved milestones.
-        achieved = [m[2] for m in truth.met]
-        message = "\n".join("%d. %s" % (i + 1, m) for i, m in enumerate(achieved))
+                           CHECKLIST_OPTIONS, domains)
+        message = achieved_message(truth)
+        tokens = prompt_tokens(mode, case, truth)
 
         for i in range(REPORT_ITERATIONS):
             t0 = time.time()
-            if accepts_facts:
+            if mode in ("structured", "sections") and accepts_result:
+                text = main.generate_recommendations_new(
+                    message, case["age"], case["observations"],
+                    facts=sl.build_facts_block(truth), result=truth)
+            elif mode == "trimmed":
+                text = main.generate_recommendations_new(
+                    message, case["age"], case["observations"],
+                    facts=sl.build_facts_block(truth), result=truth, structured=False)
+            elif accepts_facts:
                 text = main.generate_recommendations_new(
                     message, case["age"], case["observations"],
                     facts=sl.build_facts_block(truth))
@@ -289,12 +379,12 @@ def run(label):
                 text = main.generate_recommendations_new(
                     message, case["age"], case["observations"])
             elapsed = round(time.time() - t0, 2)
-            checks = score_report(text, case, truth, main.checklist_options)
+            checks = score_report(text, case, truth, CHECKLIST_OPTIONS)
             score = sum(1 for v in checks.values() if v) / float(len(checks))
             failed = sorted(k for k, v in checks.items() if not v)
             results["reports"].append(
                 {"case": case["id"], "iteration": i, "score": round(score, 3),
-                 "checks": checks, "failed": failed, "seconds": elapsed,
+                 "checks": checks, "failed": failed, "seconds": elapsed, "prompt_tokens": tokens,
                  "expected_delay": truth.delay_text, "output": text})
             print("  %s run %d: score=%.2f [%ss]%s"
                   % (case["id"], i, score, elapsed,
@@ -313,6 +403,8 @@ def run(label):
         "clean_reports": "%d/%d" % (perfect, len(reports)),
         "avg_report_seconds": round(
             sum(r["seconds"] for r in reports) / len(reports), 2),
+        "avg_prompt_tokens": round(
+            sum(r["prompt_tokens"] for r in reports) / len(reports)),
     }
     s = results["summary"]
     print("=== Summary: age %s | report score %.3f | checks %s | clean %s | %ss avg ==="
@@ -335,10 +427,11 @@ def compare(a_label, b_label):
 
     a, b = load(a_label), load(b_label)
     rows = ["age_pass_rate", "report_avg_score", "checks_passed", "clean_reports",
-            "avg_report_seconds"]
+            "avg_report_seconds", "avg_prompt_tokens"]
     print("%-28s %14s %14s" % ("", a_label, b_label))
+    print("%-28s %14s %14s" % ("mode", a.get("mode", "-"), b.get("mode", "-")))
     for row in rows:
-        print("%-28s %14s %14s" % (row, a["summary"][row], b["summary"][row]))
+        print("%-28s %14s %14s" % (row, a["summary"].get(row, "-"), b["summary"].get(row, "-")))
 
     def failures_by_case(results):
         out = {}
@@ -373,22 +466,16 @@ def rescore(label):
     stay judged by identical criteria.
     """
     os.chdir(PROJECT_ROOT)
-    import ast
-    import milestone_domains as md
-
-    with open(os.path.join(PROJECT_ROOT, "checklist_options.json"), encoding="utf-8") as f:
-        checklist_options = {int(k): v for k, v in ast.literal_eval(f.read()).items()}
-
+    domains = DOMAIN_TABLE
     path = os.path.join(RESULTS_DIR, "%s.json" % label)
     with open(path, encoding="utf-8") as f:
         results = json.load(f)
 
-    cases = {c["id"]: c for c in build_report_cases(checklist_options)}
+    cases = {c["id"]: c for c in build_report_cases(CHECKLIST_OPTIONS)}
     for r in results["reports"]:
         case = cases[r["case"]]
-        truth = sl.analyze(case["age"], case["checklists"], checklist_options,
-                           md.MILESTONE_DOMAINS)
-        checks = score_report(r["output"], case, truth, checklist_options)
+        truth = sl.analyze(case["age"], case["checklists"], CHECKLIST_OPTIONS, domains)
+        checks = score_report(r["output"], case, truth, CHECKLIST_OPTIONS)
         r["checks"] = checks
         r["failed"] = sorted(k for k, v in checks.items() if not v)
         r["score"] = round(sum(1 for v in checks.values() if v) / float(len(checks)), 3)
@@ -414,13 +501,17 @@ if __name__ == "__main__":
     parser.add_argument("--label")
     parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"))
     parser.add_argument("--rescore", nargs="+", metavar="LABEL")
+    parser.add_argument("--mode", choices=MODES)
+    parser.add_argument("--tokens", action="store_true")
     args = parser.parse_args()
-    if args.rescore:
+    if args.tokens:
+        token_report()
+    elif args.rescore:
         for label in args.rescore:
             rescore(label)
     elif args.compare:
         compare(*args.compare)
     elif args.label:
-        run(args.label)
+        run(args.label, args.mode)
     else:
-        parser.error("pass --label, --rescore or --compare")
+        parser.error("pass --label, --rescore, --compare or --tokens")
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Per-stage timing for the screening flow.
+
+A screening touches Redis, the screening arithmetic, the model, the MarkdownV2
+escaper, Telegram and SMTP, and until now nothing said which of them a slow
+report was waiting on. Wrap a stage in `span()` and, when timing is enabled,
+each exit emits one structured log line and feeds an in-process histogram:
+
+    with span("model.report", chat_id):
+        ...
+
+Timing is off unless TIMING_ENABLED is set. Disabled, `span()` hands back one
+shared no-op context manager, so an instrumented call site costs a function call
+and an attribute check - nothing is allocated, timed or logged.
+
+Chat ids are hashed before they reach a log line: they are stable per family,
+so a raw id in a log aggregator is a join key onto a child's screening.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("TIMING_ENABLED", "").lower() in ("1", "true", "yes")
+_SALT = os.environ.get("TIMING_SALT", "cmsp-b5")
+
+logger = logging.getLogger("timing")
+
+# Seconds. Spans run from a ~1 ms Redis GET to a model call near the 60 s
+# gunicorn timeout, so the buckets cover both ends.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+           20.0, 30.0, 45.0, 60.0)
+
+
+def hash_chat_id(chat_id):
+    """Short, salted, stable digest of a chat id, safe to log."""
+    if chat_id is None:
+        return "-"
+    digest = hashlib.sha256(("%s:%s" % (_SALT, chat_id)).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+class Histogram(object):
+    """Cumulative-bucket histogram keyed by a label set. Thread-safe.
+
+    Shaped like a Prometheus histogram so it can be exported without
+    conversion: per label set, a count per upper bound plus a sum and a count.
+    """
+
+    def __init__(self, name, help_text, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        """{label_tuple: (bucket_counts, sum, count)} - a copy, safe to iterate."""
+        with self._lock:
+            return {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+STAGE_SECONDS = Histogram(
+    "milestones_stage_seconds", "Wall time of each screening stage, by stage and outcome.")
+
+
+class _NoopSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span(object):
+    __slots__ = ("stage", "chat_id", "start")
+
+    def __init__(self, stage, chat_id):
+        self.stage = stage
+        self.chat_id = chat_id
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        outcome = "ok" if exc_type is None else "error"
+        STAGE_SECONDS.observe(elapsed, stage=self.stage, outcome=outcome)
+        logger.info("stage=%s chat=%s ms=%.1f outcome=%s",
+                    self.stage, hash_chat_id(self.chat_id), elapsed * 1000.0, outcome)
+        return False
+
+
+def span(stage, chat_id=None):
+    """Time a block as `stage`. A shared no-op when timing is disabled."""
+    if not ENABLED:
+        return _NOOP
+    return _Span(stage, chat_id)
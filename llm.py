@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+"""Model gateway: which model each kind of call uses, and when to stop calling.
+
+Every call site used to pass the same OPENAI_MODEL, so pulling a number out of
+"2 years 3 months" waited on the same model as writing the report. Calls are
+now named by what they do (age, dev_age, word_age, recommendations, report)
+and ROUTES maps each name to a primary tier and a faster fallback tier:
+
+    MODEL_ROUTE_AGE="gpt-x:none"               primary only
+    MODEL_ROUTE_REPORT="gpt-x:medium,gpt-y:low"  primary, then fallback
+
+Each route keeps a window of its recent primary calls. When the window's p95
+latency passes the route's limit, or its error rate passes MODEL_MAX_ERROR_RATE,
+the route serves from the fallback tier for MODEL_FALLBACK_SECONDS and then
+tries the primary again with a fresh window.
+
+Latency, calls, fallbacks and token use are exported per route and tier, and an
+estimated cost too when MODEL_PRICES ("model=in/out,..." in USD per million
+tokens) is set, so the table can be tuned from /metrics.
+
+Routing handles a slow model; BREAKER handles a sick endpoint. It is one
+circuit breaker for every route, since they all share the endpoint. When at
+least BREAKER_FAILURE_RATE of the last BREAKER_WINDOW calls failed or took
+longer than BREAKER_SLOW_SECONDS, it opens: calls raise CircuitOpen at once
+instead of each handler waiting out a timeout. After BREAKER_OPEN_SECONDS it
+lets BREAKER_TRIAL_CALLS through (half-open); if they all succeed it closes,
+and any failure opens it again.
+
+HEDGER trims the tail that is left. For the routes named in MODEL_HEDGE (e.g.
+"report"), a call still running after the route's recent
+MODEL_HEDGE_PERCENTILE latency (never less than MODEL_HEDGE_MIN_SECONDS) gets
+an identical second request, and the first response wins. At most
+MODEL_HEDGE_BUDGET of a route's recent calls are hedged, which caps the extra
+spend. In the asyncio runtime the losing request is cancelled; a thread blocked
+on the HTTP call cannot be, so there the loser runs to completion and its
+response is dropped. Either way every request's tokens are counted.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent import futures
+
+import deadlines
+import metrics
+
+logger = logging.getLogger(__name__)
+
+OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-5.6-terra")
+# Unless a faster model is configured, the fallback tier is the same model
+# with less reasoning.
+FAST_MODEL = os.environ.get("OPENAI_FAST_MODEL", OPENAI_MODEL)
+
+WINDOW = int(os.environ.get("MODEL_ROUTE_WINDOW", 50))
+MIN_SAMPLES = int(os.environ.get("MODEL_ROUTE_MIN_SAMPLES", 10))
+MAX_ERROR_RATE = float(os.environ.get("MODEL_MAX_ERROR_RATE", 0.2))
+FALLBACK_SECONDS = float(os.environ.get("MODEL_FALLBACK_SECONDS", 120))
+
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", 20))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", 5))
+BREAKER_FAILURE_RATE = float(os.environ.get("BREAKER_FAILURE_RATE", 0.5))
+BREAKER_SLOW_SECONDS = float(os.environ.get("BREAKER_SLOW_SECONDS", 40))
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", 30))
+BREAKER_TRIAL_CALLS = int(os.environ.get("BREAKER_TRIAL_CALLS", 2))
+
+# Per-request ceiling, as the client's default; shortened to the update budget.
+REQUEST_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", 45))
+
+HEDGE_FUNCTIONS = frozenset(f.strip() for f in os.environ.get("MODEL_HEDGE", "").split(",") if f.strip())
+HEDGE_PERCENTILE = float(os.environ.get("MODEL_HEDGE_PERCENTILE", 0.9))
+HEDGE_MIN_SECONDS = float(os.environ.get("MODEL_HEDGE_MIN_SECONDS", 5))
+HEDGE_BUDGET = float(os.environ.get("MODEL_HEDGE_BUDGET", 0.1))
+# Threaded hedging runs both requests off the caller's thread: two per call.
+HEDGE_THREADS = int(os.environ.get("MODEL_HEDGE_THREADS", 8))
+
+PRIMARY, FALLBACK = "primary", "fallback"
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+BREAKER_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+Tier = namedtuple("Tier", ["model", "effort"])
+Route = namedtuple("Route", ["primary", "fallback", "p95_limit"])
+
+# effort None leaves the model's default reasoning in place.
+DEFAULT_ROUTES = {
+    "age": Route(Tier(OPENAI_MODEL, "none"), Tier(FAST_MODEL, "none"), 4.0),
+    "dev_age": Route(Tier(OPENAI_MODEL, "none"), Tier(FAST_MODEL, "none"), 4.0),
+    "word_age": Route(Tier(OPENAI_MODEL, "none"), Tier(FAST_MODEL, "none"), 4.0),
+    "recommendations": Route(Tier(OPENAI_MODEL, "none"), Tier(FAST_MODEL, "none"), 20.0),
+    # The report must finish inside gunicorn's 60 s timeout with sends to spare.
+    "report": Route(Tier(OPENAI_MODEL, None), Tier(FAST_MODEL, "low"), 35.0),
+    # The split report (section_cache.py): shared sections, per-child observations.
+    "sections": Route(Tier(OPENAI_MODEL, None), Tier(FAST_MODEL, "low"), 35.0),
+    "observations": Route(Tier(OPENAI_MODEL, "low"), Tier(FAST_MODEL, "low"), 15.0),
+}
+
+
+def parse_tier(text):
+    model, _, effort = text.strip().partition(":")
+    return Tier(model, effort or None)
+
+
+def routes_from_env(defaults=DEFAULT_ROUTES, environ=os.environ):
+    """DEFAULT_ROUTES with any MODEL_ROUTE_<NAME> / MODEL_P95_<NAME> overrides applied."""
+    routes = {}
+    for name, route in defaults.items():
+        spec = environ.get("MODEL_ROUTE_%s" % name.upper())
+        if spec:
+            tiers = [parse_tier(part) for part in spec.split(",")]
+            route = route._replace(primary=tiers[0], fallback=tiers[1] if len(tiers) > 1 else tiers[0])
+        limit = environ.get("MODEL_P95_%s" % name.upper())
+        if limit:
+            route = route._replace(p95_limit=float(limit))
+        routes[name] = route
+    return routes
+
+
+def parse_prices(text):
+    """'model=in/out,...' -> {model: (usd per M input tokens, per M output tokens)}."""
+    prices = {}
+    for part in (text or "").split(","):
+        if "=" in part:
+            model, _, pair = part.strip().partition("=")
+            price_in, _, price_out = pair.partition("/")
+            prices[model] = (float(price_in), float(price_out or price_in))
+    return prices
+
+
+PRICES = parse_prices(os.environ.get("MODEL_PRICES"))
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def p95(values):
+    return percentile(values, 0.95)
+
+
+class _Health(object):
+    __slots__ = ("samples", "fallback_until")
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.fallback_until = 0.0
+
+
+class Router(object):
+    """Picks a tier per call and degrades a route on its recent primary calls. Thread-safe."""
+
+    def __init__(self, routes=None, window=WINDOW, min_samples=MIN_SAMPLES,
+                 max_error_rate=MAX_ERROR_RATE, fallback_seconds=FALLBACK_SECONDS,
+                 clock=time.monotonic):
+        self.routes = routes_from_env() if routes is None else routes
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.fallback_seconds = fallback_seconds
+        self.clock = clock
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def route(self, function):
+        route = self.routes.get(function)
+        if route is None:
+            tier = Tier(OPENAI_MODEL, None)
+            route = Route(tier, tier, float("inf"))
+        return route
+
+    def _state(self, function):
+        state = self._health.get(function)
+        if state is None:
+            state = self._health[function] = _Health(self.window)
+        return state
+
+    def pick(self, function):
+        """(tier name, Tier) for the next `function` call."""
+        route = self.route(function)
+        with self._lock:
+            if self.clock() < self._state(function).fallback_until:
+                return FALLBACK, route.fallback
+        return PRIMARY, route.primary
+
+    def record(self, function, tier, seconds, ok):
+        """Feed one call's outcome back; only primary calls judge the route."""
+        if tier != PRIMARY:
+            return
+        route = self.route(function)
+        with self._lock:
+            state = self._state(function)
+            state.samples.append((seconds, ok))
+            if len(state.samples) < self.min_samples:
+                return
+            errors = sum(1 for _, good in state.samples if not good)
+            latency = p95([s for s, _ in state.samples])
+            if latency <= route.p95_limit and errors <= self.max_error_rate * len(state.samples):
+                return
+            state.fallback_until = self.clock() + self.fallback_seconds
+            state.samples.clear()
+        metrics.MODEL_FALLBACKS.inc(function=function)
+        logger.warning("Model route %s degraded (p95 %.1fs, %d errors); using %s for %.0fs",
+                       function, latency, errors, route.fallback.model, self.fallback_seconds)
+
+
+class CircuitOpen(Exception):
+    """The breaker is open: the model endpoint is failing, so don't call it."""
+
+    def __init__(self, retry_in):
+        Exception.__init__(self, "model circuit open, retry in %.0fs" % retry_in)
+        self.retry_in = retry_in
+
+
+class CircuitBreaker(object):
+    """Closed / open / half-open breaker over recent call outcomes. Thread-safe."""
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 failure_rate=BREAKER_FAILURE_RATE, slow_seconds=BREAKER_SLOW_SECONDS,
+                 open_seconds=BREAKER_OPEN_SECONDS, trial_calls=BREAKER_TRIAL_CALLS,
+                 clock=time.monotonic):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.trial_calls = trial_calls
+        self.clock = clock
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+        self._lock = threading.Lock()
+
+    def _move(self, state):
+        self._state = state
+        metrics.MODEL_BREAKER.set(BREAKER_STATES[state])
+        metrics.MODEL_BREAKER_TRANSITIONS.inc(state=state)
+        if state == OPEN:
+            self._opened_at = self.clock()
+            logger.warning("Model circuit open for %.0fs", self.open_seconds)
+        elif state == HALF_OPEN:
+            self._trials = self._trial_successes = 0
+        else:
+            self._outcomes.clear()
+            logger.info("Model circuit closed")
+
+    def _retry_in(self):
+        """Seconds until an open breaker goes half-open; moves it when due."""
+        if self._state != OPEN:
+            return 0.0
+        wait = self._opened_at + self.open_seconds - self.clock()
+        if wait <= 0:
+            self._move(HALF_OPEN)
+            return 0.0
+        return wait
+
+    @property
+    def state(self):
+        with self._lock:
+            self._retry_in()
+            return self._state
+
+    def check(self):
+        """Raise CircuitOpen if the breaker is open. Takes no trial slot."""
+        with self._lock:
+            wait = self._retry_in()
+        if wait > 0:
+            metrics.MODEL_BREAKER_REJECTED.inc()
+            raise CircuitOpen(wait)
+
+    def allow(self):
+        """Admit one call or raise CircuitOpen; half-open admits only the trials."""
+        with self._lock:
+            wait = self._retry_in()
+            if wait == 0 and self._state == HALF_OPEN:
+                if self._trials >= self.trial_calls:
+                    wait = self.open_seconds
+                else:
+                    self._trials += 1
+        if wait > 0:
+            metrics.MODEL_BREAKER_REJECTED.inc()
+            raise CircuitOpen(wait)
+
+    def record(self, seconds, ok):
+        failed = not ok or seconds > self.slow_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if failed:
+                    self._move(OPEN)
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.trial_calls:
+                        self._move(CLOSED)
+                return
+            if self._state == OPEN:
+                return
+            self._outcomes.append(failed)
+            failures = sum(self._outcomes)
+            if (len(self._outcomes) >= self.min_calls
+                    and failures >= self.failure_rate * len(self._outcomes)):
+                self._move(OPEN)
+
+
+class Hedger(object):
+    """When to send a second copy of a slow call, within a spend budget. Thread-safe."""
+
+    def __init__(self, functions=HEDGE_FUNCTIONS, percentile=HEDGE_PERCENTILE,
+                 min_seconds=HEDGE_MIN_SECONDS, budget=HEDGE_BUDGET, window=WINDOW,
+                 min_samples=MIN_SAMPLES):
+        self.functions = frozenset(functions)
+        self.percentile = percentile
+        self.min_seconds = min_seconds
+        self.budget = budget
+        self.window = window
+        self.min_samples = min_samples
+        self._latency = {}
+        self._hedged = {}
+        self._lock = threading.Lock()
+
+    def _window(self, table, function):
+        values = table.get(function)
+        if values is None:
+            values = table[function] = deque(maxlen=self.window)
+        return values
+
+    def delay(self, function):
+        """Seconds to wait before hedging a `function` call, or None not to hedge it."""
+        if function not in self.functions:
+            return None
+        with self._lock:
+            samples = self._window(self._latency, function)
+            if len(samples) < self.min_samples:
+                return None
+            return max(self.min_seconds, percentile(samples, self.percentile))
+
+    def admit(self, function):
+        """Spend one hedge, or refuse when the route's recent share is used up."""
+        with self._lock:
+            hedged = self._window(self._hedged, function)
+            if sum(hedged) >= self.budget * len(hedged):
+                admitted = False
+            else:
+                hedged.append(True)
+                admitted = True
+        metrics.MODEL_HEDGES.inc(function=function, outcome="sent" if admitted else "over_budget")
+        return admitted
+
+    def record(self, function, seconds, hedged):
+        """Feed back a finished call's latency as its caller saw it."""
+        if function not in self.functions:
+            return
+        metrics.MODEL_REQUEST_SECONDS.observe(seconds, function=function)
+        with self._lock:
+            self._window(self._latency, function).append(seconds)
+            if not hedged:
+                self._window(self._hedged, function).append(False)
+
+
+ROUTER = Router()
+BREAKER = CircuitBreaker()
+HEDGER = Hedger()
+
+_hedge_executor = futures.ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="hedge")
+
+
+def request_kwargs(tier, kwargs):
+    """The Responses API arguments for `tier`: its model, and its effort if set."""
+    params = dict(kwargs, model=tier.model)
+    if tier.effort is not None:
+        params["reasoning"] = {"effort": tier.effort}
+    return params
+
+
+def _bounded(function, params):
+    """`params` with a timeout that leaves the update time to send a local report."""
+    if deadlines.current() is None:
+        return params
+    return dict(params, timeout=deadlines.timeout(REQUEST_TIMEOUT, "model." + function,
+                                                  reserve=deadlines.RESERVE))
+
+
+def _account(function, tier_name, tier, response, seconds, ok, router, breaker):
+    router.record(function, tier_name, seconds, ok)
+    breaker.record(seconds, ok)
+    labels = {"function": function, "tier": tier_name}
+    metrics.MODEL_CALLS.inc(outcome="ok" if ok else "error", **labels)
+    metrics.MODEL_SECONDS.observe(seconds, **labels)
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    tokens_in = getattr(usage, "input_tokens", 0) or 0
+    tokens_out = getattr(usage, "output_tokens", 0) or 0
+    metrics.MODEL_TOKENS.inc(tokens_in, direction="input", model=tier.model, **labels)
+    metrics.MODEL_TOKENS.inc(tokens_out, direction="output", model=tier.model, **labels)
+    price = PRICES.get(tier.model)
+    if price is not None:
+        cost = (tokens_in * price[0] + tokens_out * price[1]) / 1e6
+        metrics.MODEL_COST.inc(cost, model=tier.model, **labels)
+
+
+def _attempt(client, function, tier_name, tier, params, router, breaker):
+    response, start = None, time.perf_counter()
+    try:
+        response = client.responses.create(**params)
+        return response
+    finally:
+        _account(function, tier_name, tier, response, time.perf_counter() - start,
+                 response is not None, router, breaker)
+
+
+def _hedge_allowed(function, hedger, breaker):
+    if not hedger.admit(function):
+        return False
+    try:
+        breaker.allow()
+    except CircuitOpen:
+        return False
+    return True
+
+
+def _settle(function, primary, hedge, winner):
+    if hedge is not None:
+        metrics.MODEL_HEDGES.inc(function=function, outcome="won" if winner is hedge else "lost")
+    for attempt in (primary, hedge):
+        if attempt is not None and attempt is not winner:
+            attempt.cancel()
+
+
+def call(client, function, router=None, breaker=None, hedger=None, **kwargs):
+    """One Responses API call on the route for `function`, hedged if the route is.
+
+    Raises CircuitOpen, without calling, while the breaker is open, and
+    DeadlineExceeded when the update has no time left for it.
+    """
+    breaker = breaker or BREAKER
+    router = router or ROUTER
+    hedger = hedger or HEDGER
+    tier_name, tier = router.pick(function)
+    params = _bounded(function, request_kwargs(tier, kwargs))
+    breaker.allow()
+    attempt = (_attempt, client, function, tier_name, tier, params, router, breaker)
+    delay = hedger.delay(function)
+    start, hedge = time.perf_counter(), None
+    try:
+        if delay is None:
+            return _attempt(*attempt[1:])
+        primary = _hedge_executor.submit(*attempt)
+        if not futures.wait([primary], timeout=delay).done and _hedge_allowed(function, hedger, breaker):
+            hedge = _hedge_executor.submit(*attempt)
+        pending = [f for f in (primary, hedge) if f is not None]
+        while True:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            winner = next((f for f in done if f.exception() is None), None)
+            if winner is not None or not pending:
+                winner = winner or done.pop()
+                _settle(function, primary, hedge, winner)
+                return winner.result()
+    finally:
+        hedger.record(function, time.perf_counter() - start, hedge is not None)
+
+
+async def _aattempt(client, function, tier_name, tier, params, router, breaker):
+    start = time.perf_counter()
+    try:
+        response = await client.responses.create(**params)
+    except asyncio.CancelledError:
+        # The other copy of a hedged call won; this one says nothing about the route.
+        metrics.MODEL_CALLS.inc(function=function, tier=tier_name, outcome="cancelled")
+        raise
+    except Exception:
+        _account(function, tier_name, tier, None, time.perf_counter() - start, False, router, breaker)
+        raise
+    _account(function, tier_name, tier, response, time.perf_counter() - start, True, router, breaker)
+    return response
+
+
+async def acall(client, function, router=None, breaker=None, hedger=None, **kwargs):
+    """`call` for an async client."""
+    breaker = breaker or BREAKER
+    router = router or ROUTER
+    hedger = hedger or HEDGER
+    tier_name, tier = router.pick(function)
+    params = _bounded(function, request_kwargs(tier, kwargs))
+    breaker.allow()
+    attempt = (client, function, tier_name, tier, params, router, breaker)
+    delay = hedger.delay(function)
+    start, hedge = time.perf_counter(), None
+    try:
+        if delay is None:
+            return await _aattempt(*attempt)
+        primary = asyncio.ensure_future(_aattempt(*attempt))
+        pending = [primary]
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and _hedge_allowed(function, hedger, breaker):
+                hedge = asyncio.ensure_future(_aattempt(*attempt))
+                pending.append(hedge)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((f for f in done if f.exception() is None), None)
+                if winner is not None or not pending:
+                    winner = winner or done.pop()
+                    _settle(function, primary, hedge, winner)
+                    return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+    finally:
+        hedger.record(function, time.perf_counter() - start, hedge is not None)
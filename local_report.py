@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""The screening report rendered locally, from the ScreeningResult alone.
+
+analyze() already settles everything the report states as fact - the two age
+ranges, the delay, which milestones were met and which were not - yet the user
+saw nothing until the model had finished writing prose around those facts. This
+module renders the same sections from the result, the catalog's domains and its
+parent-activity suggestions, in well under a millisecond and with no model
+call. It is used three ways:
+
+- `render_preview()`: a few lines sent the moment the checklist is analyzed,
+  while the model is still writing;
+- `render()` in place of the model's report when the model is unavailable
+  (breaker open, pool full, or the call failed), so the screening still ends in
+  a report the clinician can send;
+- `render()` on request, for clinicians who opt in with /fast;
+- `render(..., prose=...)` for the normal report: the model writes only the
+  Observations bullets and the two Recommendations sections, as JSON
+  (prompts.PROSE_SCHEMA), and everything it used to re-type from the FACTS
+  block - the milestone lists, the ranges, the delay - is rendered here. The
+  Recommendations sections are usually shared ones (section_cache.py).
+
+The output follows the model report's headings and Markdown shape, so the
+MarkdownV2 escaper, the chunker, the archive and the email all take it as they
+are. Without prose it contains no narrative: parent observations are quoted,
+not interpreted.
+"""
+
+import json
+from collections import OrderedDict
+
+import prompts
+import screening_logic
+from catalog import CATALOG
+from screening_logic import DELAY_AT_LEAST, DELAY_RANGE, DOMAIN_ORDER
+
+# Parent activities listed per report, taken in catalog order.
+MAX_SUGGESTIONS = 6
+
+LOCAL_NOTE = ("_This report was generated from the screening checklist alone. "
+              "It lists the results without a written interpretation._")
+
+
+def age_text(months):
+    years, rest = divmod(months, 12)
+    if not years:
+        return "%d months" % rest
+    return "%d year%s, %d month%s" % (years, "" if years == 1 else "s", rest, "" if rest == 1 else "s")
+
+
+def delay_sentence(result):
+    if result.delay_state == DELAY_RANGE:
+        return ("The child presents with a delay of approximately %s in communication development "
+                "based on their chronological age of %s and their developmental age range of %s."
+                % (result.delay_text, age_text(result.age_months), result.dev_band_label))
+    if result.delay_state == DELAY_AT_LEAST:
+        return ("The child presents with a delay of %s in communication development based on "
+                "their chronological age of %s." % (result.delay_text, age_text(result.age_months)))
+    return None
+
+
+def _by_domain(entries):
+    grouped = OrderedDict((d, []) for d in DOMAIN_ORDER)
+    for _band, _idx, text, domain in entries:
+        grouped.setdefault(domain, []).append(text)
+    return [(domain, texts) for domain, texts in grouped.items() if texts]
+
+
+def _milestone_lines(entries):
+    lines = []
+    for domain, texts in _by_domain(entries):
+        lines.append("  - **%s:**" % domain)
+        lines.extend("    - %s" % text.strip() for text in texts)
+    return lines
+
+
+def _scope_line(result):
+    labels = [screening_logic.BAND_BY_KEY[k].label for k in result.presumed_keys]
+    return ("Milestones for the %s through %s ranges were not administered during this screening "
+            "and are presumed to have been met; the developmental age range and percentage of "
+            "delay are calculated on that basis." % (labels[0], labels[-1]))
+
+
+def parse_prose(text):
+    """The model's JSON prose, checked against the shape render() needs."""
+    prose = json.loads(text)
+    if not isinstance(prose.get("observations"), list):
+        raise ValueError("prose has no observations list")
+    for key in ("parent_recommendations", "clinical_recommendations"):
+        groups = prose.get(key)
+        if not isinstance(groups, list) or not all(
+                isinstance(g, dict) and isinstance(g.get("points"), list) for g in groups):
+            raise ValueError("prose %s is malformed" % key)
+    return prose
+
+
+def _prose_groups(groups):
+    lines = []
+    for group in groups:
+        lines.append("  - **%s:**" % group.get("heading", "").strip().rstrip(":"))
+        lines.extend("    - %s" % point.strip() for point in group["points"] if point.strip())
+    return lines
+
+
+def render(result, observations="", catalog=CATALOG, max_suggestions=MAX_SUGGESTIONS, prose=None):
+    """The full report, section by section, as Markdown.
+
+    With `prose` (parse_prose output) the Observations bullets and both
+    Recommendations sections are the model's; the rest is always rendered here.
+    """
+    age = age_text(result.age_months)
+    out = ["## SPEECH AND LANGUAGE THERAPY REPORT", "",
+           "## Child's Age:", age, "",
+           "## Overview:", prompts.OVERVIEW, "",
+           "## Observations:",
+           "Child is %s old at the time of screening, which falls within the %s ASHA age range. "
+           "Based on the ASHA Developmental Milestones, the child's speech and language abilities "
+           "are functioning at the developmental range of %s according to their milestones."
+           % (age, result.chrono_band.label, result.dev_band_label), ""]
+    if result.disclosure_needed and result.presumed_keys:
+        out.append("  - %s" % _scope_line(result))
+    if prose is not None:
+        out.extend("  - %s" % point.strip() for point in prose["observations"] if point.strip())
+    elif observations:
+        out.append("  - Parent/clinician observations (as reported): %s" % observations.strip())
+    if result.inconsistent:
+        out.append("  - Every milestone for the current age range was met, but an earlier age "
+                   "range is incomplete; those responses should be reviewed.")
+    if result.all_met_for_age:
+        out.append("")
+        out.append("The child has met all the milestones for the current age range.")
+    out.append("")
+
+    out.append("## Milestones Achieved:")
+    if result.met:
+        out.append("At the %s developmental level, the child has demonstrated the following abilities:"
+                   % result.dev_band_label)
+        out.append("")
+        out.extend(_milestone_lines(result.met))
+    else:
+        out.append("No milestones were marked as achieved.")
+    out.append("")
+
+    if not result.all_met_for_age:
+        out.append("## Milestones Expected but Not Met :")
+        out.extend(_milestone_lines(result.unmet))
+        sentence = delay_sentence(result)
+        if sentence:
+            out.append("")
+            out.append(sentence)
+        out.append("")
+
+    out.append("## Recommendations for Parents:")
+    if prose is not None:
+        out.extend(_prose_groups(prose["parent_recommendations"]))
+    else:
+        suggestions = catalog.targeted_suggestions(
+            result.chrono_band.key, catalog.ids(result.unmet))[:max_suggestions]
+        out.append("  - **Speech and Language Enrichment:**")
+        out.extend("    - %s" % s.text for s in suggestions)
+    out.append("")
+
+    out.append("## Recommendations for the Clinical Team:")
+    if prose is not None:
+        out.extend(_prose_groups(prose["clinical_recommendations"]))
+    elif result.all_met_for_age:
+        out.append("  - **Ongoing Monitoring:**")
+        out.append("    - Continue routine developmental monitoring at the next screening interval.")
+    else:
+        out.append("  - **Further Evaluation:**")
+        out.append("    - Consider a comprehensive speech and language evaluation for the milestones not met.")
+        out.append("  - **Ongoing Monitoring:**")
+        out.append("    - Re-screen the %s milestones at the next visit." % result.chrono_band.label)
+    if result.inconsistent:
+        out.append("    - Review the earlier-range responses for accuracy.")
+    if prose is None:
+        out.append("")
+        out.append(LOCAL_NOTE)
+    return "\n".join(out)
+
+
+def render_preview(result):
+    """A few lines to send while the full report is being written."""
+    lines = ["📋 Screening summary (the full report follows shortly):",
+             "- Age range: %s" % result.chrono_band.label,
+             "- Developmental range: %s" % result.dev_band_label]
+    lines.append("- Delay: %s" % (result.delay_text or "none"))
+    if result.all_met_for_age:
+        lines.append("- All milestones for the current age range were met.")
+    else:
+        lines.append("- Milestones not yet met for this age range: %d" % len(result.unmet))
+    return "\n".join(lines)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Log helpers for session state and report bodies.
+
+A session holds the child's name, the clinician's observations and the full
+report, so logging it verbatim is both the largest string the bot formats and
+a PII leak into the log drain. The helpers here are lazy: they are passed as
+%-style arguments and only render when a handler actually emits the record, and
+what they render is a size-capped, redacted summary.
+
+Full dumps are still available for debugging a single chat, but only when
+LOG_FULL_PAYLOADS is set AND the logger is at DEBUG - one flag alone never
+puts a report in the logs.
+"""
+
+import logging
+import os
+
+from instrumentation import hash_chat_id
+
+FULL_PAYLOADS = os.environ.get("LOG_FULL_PAYLOADS", "").lower() in ("1", "true", "yes")
+
+DEFAULT_CAP = 200
+
+# Free text a parent or clinician typed, or that was generated about the child.
+REDACTED_FIELDS = ("name", "observations", "recommendations", "email_body",
+                   "email_subject", "formatted_checklist", "achieved_milestones")
+
+
+class Capped(object):
+    """`text`, cut to `limit` characters with the dropped length noted."""
+
+    __slots__ = ("text", "limit")
+
+    def __init__(self, text, limit=DEFAULT_CAP):
+        self.text = text
+        self.limit = limit
+
+    def __str__(self):
+        text = "" if self.text is None else str(self.text)
+        if len(text) <= self.limit:
+            return text
+        return "%s...(+%d chars)" % (text[:self.limit], len(text) - self.limit)
+
+
+class SessionSummary(object):
+    """A session dict as field names, sizes and the non-identifying values.
+
+    Redacted fields appear as their length only; checklists appear as ticked
+    counts per band. Enough to follow a chat through the flow, never enough to
+    reconstruct who the child is or what the report said.
+    """
+
+    __slots__ = ("user_data",)
+
+    def __init__(self, user_data):
+        self.user_data = user_data
+
+    def __str__(self):
+        data = self.user_data or {}
+        parts = []
+        for key in sorted(data, key=str):
+            value = data[key]
+            if key in REDACTED_FIELDS:
+                parts.append("%s=<%d chars>" % (key, len(str(value))))
+            elif key == "checklists":
+                bands = ",".join("%s:%d/%d" % (k, sum(1 for t in v if t), len(v))
+                                 for k, v in sorted(value.items(), key=lambda kv: int(kv[0])))
+                parts.append("checklists={%s}" % bands)
+            else:
+                parts.append("%s=%s" % (key, Capped(value, 40)))
+        return "{%s}" % " ".join(parts)
+
+
+class HashedChat(object):
+    """A chat id, hashed at render time."""
+
+    __slots__ = ("chat_id",)
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+
+    def __str__(self):
+        return hash_chat_id(self.chat_id)
+
+
+def dump(logger, label, payload):
+    """Log `payload` in full - only in debug-dump mode, and only at DEBUG."""
+    if FULL_PAYLOADS and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s: %r", label, payload)
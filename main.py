@@ -1,21 +1,34 @@
 import os
-import openai
-from flask import Flask, request
-from telebot import TeleBot, types
-from redis import Redis, ConnectionPool
+from flask import Flask, Response, request
+from telebot import types
 from datetime import datetime
-from markdownmail import MarkdownMail
-import markdown
 import logging
 import time
-import ast
+import hmac
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import re
-import smtplib
-from email.mime.text import MIMEText
-from urllib.parse import urlparse
 import screening_logic
-from milestone_domains import MILESTONE_DOMAINS
+import prompts
+import clients
+import deadlines
+import outbound
+import sessions
+import modelpool
+import llm
+import local_report
+import section_cache
+import speculation
+from report_archive import ReportArchive
+from catalog import DOMAIN_TABLE, checklist_options
+from instrumentation import span
+import metrics
+import logsafe
+from logsafe import HashedChat, SessionSummary
+# Flags, texts, formatting and email, shared with aio.py (see common.py).
+from common import (BUSY_TEXT, METRICS_SECRET, PAUSED_TEXT, REPORT_PREVIEW, SECTION_CACHE,
+                    SPECULATIVE_REPORTS, TRIMMED_PROMPT, WEBHOOK_SECRET, escape_markdown_v2,
+                    format_years_months, send_email, send_email_new, split_message)
 load_dotenv()
 
 logging.basicConfig(
@@ -24,238 +37,184 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
-
-pool = ConnectionPool.from_url(redis_url)
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-5.6-terra")
+OPENAI_MODEL = llm.OPENAI_MODEL
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
 URL = os.environ.get("URL")
-WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
-TO_EMAIL = ast.literal_eval(os.environ.get("TO_EMAIL"))
 
-bot = TeleBot(BOT_TOKEN, threaded=True)
+# Built on first use (see clients.py), so importing this module for tooling
+# needs neither a bot token nor a reachable Redis. Sends and edits are paced
+# against Telegram's rate limits (see outbound.py).
+bot = outbound.PacedBot(clients.bot, outbound.Outbound())
 # bot.remove_webhook()
 # time.sleep(1)
 # bot.set_webhook(url=f"{URL}/{WEBHOOK_SECRET}")
 # print(bot.get_webhook_info())
 # print(WEBHOOK_SECRET)
 # print(URL)
-redis_url = urlparse(redis_url)
-r = Redis(host=redis_url.hostname, port=redis_url.port, password=redis_url.password, ssl=(redis_url.scheme == "rediss"), ssl_cert_reqs=None)
-# r = Redis(connection_pool=pool)
-
-AGE_GROUPS = [3, 6, 9, 12, 18, 24, 36, 48, 60]
-
-with open("checklist_options.json", "r", encoding="utf-8") as f:
-    checklist_options = ast.literal_eval(f.read())
-checklist_options = {int(k): v for k, v in checklist_options.items()}
-
-with open("suggestions.json", "r", encoding="utf-8") as f:
-    suggestions = ast.literal_eval(f.read())
-suggestions = {int(k): v for k, v in suggestions.items()}
-
-def escape_markdown_v2(text):
-    """Escape characters for Telegram MarkdownV2."""
-    escape_chars = r'_*[]()~`>#+-=|{}.!'
-    return re.sub(r'([%s])' % re.escape(escape_chars), r'\\\1', text)
-
-def split_message(text, max_length=4000):
+r = clients.redis
+archive = ReportArchive(r)
+
+# Side work that can overlap a handler's own Telegram sends (see
+# proceed_with_recommendations). Small: it only ever holds Redis writes.
+background = ThreadPoolExecutor(max_workers=4, thread_name_prefix="background")
+
+# Every model call runs here: at most MODEL_CONCURRENCY at once, the rest queued.
+model_pool = modelpool.ModelPool()
+
+# Speculative reports run on their own threads, at most one per pool slot.
+speculator = speculation.Speculator(
+    ThreadPoolExecutor(max_workers=model_pool.concurrency, thread_name_prefix="speculative"))
+
+# The shared Recommendations sections, used when SECTION_CACHE is on.
+sections = section_cache.SectionCache(r)
+
+AGE_GROUPS = prompts.AGE_GROUPS
+
+# Format the FACTS block milestone fragments once, at boot, not per report.
+screening_logic.compile_templates(checklist_options, DOMAIN_TABLE)
+
+def load_session(chat_id):
+    """Read a chat's session dict from Redis."""
+    deadlines.timeout(None, "redis.get")
+    metrics.REDIS_OPS.inc(op="get")
+    with span("redis.get", chat_id):
+        raw = r.get(chat_id)
+    if raw is None:
+        raise sessions.SessionExpired(chat_id)
+    return sessions.decode(raw)
+
+def save_session(chat_id, user_data):
+    """Write a chat's session dict to Redis, expiring per its phase."""
+    deadlines.timeout(None, "redis.set")
+    metrics.REDIS_OPS.inc(op="set")
+    with span("redis.set", chat_id):
+        r.set(chat_id, sessions.encode(user_data), ex=sessions.ttl_for(user_data))
+
+def tracked(handler):
+    """Count every update a handler processes, and run it under the update's deadline.
+
+    Handlers re-raise DeadlineExceeded ahead of their generic error reply: a
+    spent budget is not an error to tell the user about, and replying would
+    only raise it again. This wrapper is where it ends.
     """
-    Splits a long message into smaller chunks to comply with Telegram's message length limits.
-    
-    Args:
-        text (str): The original message text to split.
-        max_length (int): The maximum length of each chunk. Default is 4000 to provide a buffer below Telegram's 4096 limit.
-    
-    Returns:
-        List[str]: A list of message chunks.
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        metrics.UPDATES.inc(handler=handler.__name__)
+        with deadlines.budget():
+            try:
+                return handler(*args, **kwargs)
+            except deadlines.DeadlineExceeded as e:
+                # Queued sends still go out; the handler just stopped waiting.
+                logger.warning("%s: %s", handler.__name__, e)
+    return wrapper
+
+def create_response(function, chat_id=None, **kwargs):
+    """One Responses API call on the model pool, routed and counted under `function`.
+
+    When the call has to queue, `chat_id` (if given) is told its position.
+    Raises one of MODEL_UNAVAILABLE, without waiting, when the pool's queue is
+    full or the breaker is open.
     """
-    messages = []
-    paragraphs = text.split('\n\n')  # Split text by double newlines (paragraphs)
-    
-    current_message = ""
-    for para in paragraphs:
-        # Check if adding the next paragraph exceeds the max_length
-        if len(current_message) + len(para) + 2 <= max_length:
-            current_message += para + '\n\n'
-        else:
-            if current_message:
-                messages.append(current_message.strip())
-            current_message = para + '\n\n'
-    
-    # Append any remaining text
-    if current_message:
-        messages.append(current_message.strip())
-    
-    return messages
+    llm.BREAKER.check()
 
-def send_email(subject, message, to_email):
-    smtp_server = os.environ.get("SMTP_SERVER")
-    smtp_port = int(os.environ.get("SMTP_PORT"))
-    smtp_login = os.environ.get("SMTP_LOGIN")
-    smtp_password = os.environ.get("SMTP_PASSWORD")
-    from_email = os.environ.get("FROM_EMAIL")
+    def on_queued(position):
+        if chat_id is not None:
+            announce_queue_position(chat_id, position)
+    return model_pool.run(_call_model, function, kwargs, on_queued=on_queued)
 
-    from_name = "Milestones Bot"
-    from_addr = f"{from_name} <{from_email}>"
+def _call_model(function, kwargs):
+    with span("model." + function):
+        return llm.call(clients.openai_client(), function, **kwargs)
 
-    email = MarkdownMail(
-        from_addr=from_addr, to_addr=to_email, subject=subject, content=markdown.markdown(message)
-    )
-    logger.info(f"Email sent successfully"+ markdown.markdown(message))
-    try:
-        email.send(
-            smtp_server, login=smtp_login, password=smtp_password, port=smtp_port
-        )
-        print("Email sent successfully")
+def announce_queue_position(chat_id, position):
+    bot.send_message(chat_id, f"⏳ We're busy right now - you're in the queue, position {position}. "
+                              "We'll carry on as soon as it's your turn.")
 
-    except Exception as e:
-        print("Error sending email:", e)
-
-def send_email_new(subject, message, to_email):
-       """
-       Sends an email with the given subject and message to the specified recipient.
-
-       Args:
-           subject (str): The subject of the email.
-           message (str): The body of the email. Supports plain text and HTML content.
-           to_email (str): The recipient's email address.
-       """
-       # Retrieve SMTP configuration from environment variables
-       smtp_server = os.environ.get("SMTP_SERVER")
-       smtp_port = int(os.environ.get("SMTP_PORT", 587))  # Default to 587 if not set
-       smtp_login = os.environ.get("SMTP_LOGIN")
-       smtp_password = os.environ.get("SMTP_PASSWORD")
-       from_email = os.environ.get("FROM_EMAIL")
-
-       from_name = "Milestones Bot"
-       from_addr = f"{from_name} <{from_email}>"
-
-       # Create MIMEText object for the email content
-       html = markdown.markdown(message)
-       logger.info(f"Email html:"+ html)
-       msg = MIMEText(html, 'html')  # Use 'plain' for plain text emails
-       msg['Subject'] = subject
-       msg['From'] = from_addr
-       msg['To'] = to_email
-
-       try:
-           # Establish connection with the SMTP server
-           with smtplib.SMTP(smtp_server, smtp_port) as server:
-               server.starttls()  # Secure the connection
-               server.login(smtp_login, smtp_password)  # Log in to the SMTP server
-               server.sendmail(from_addr, [to_email], msg.as_string())  # Send the email
-
-           logger.info("Email sent successfully to %s", to_email)
-       except Exception as e:
-           logger.error("Error sending email: %s", e)
-           print("Error sending email:", e)
+# Raised by create_response instead of waiting; callers tell the user, not the log.
+MODEL_UNAVAILABLE = (modelpool.Saturated, llm.CircuitOpen)
+
+def reply_unavailable(chat_id, exc, markup=None):
+    text = PAUSED_TEXT if isinstance(exc, llm.CircuitOpen) else BUSY_TEXT
+    bot.send_message(chat_id, text, reply_markup=markup)
 
 @bot.message_handler(commands=["start", "restart"])
+@tracked
 def start(message):
     """Handle /start and /restart commands."""
     try:
         message_to_send = "Hello! Please enter the child's name"
         
-        r.set(message.chat.id, str({}))
+        save_session(message.chat.id, {})
 
         msg = bot.send_message(message.chat.id, message_to_send, parse_mode="Markdown")
         bot.register_next_step_handler(msg, get_child_name)
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error starting the bot: {e}")
 
+@tracked
 def get_child_name(message):
     """Handler to get and store the child's name."""
     try:
         user_data = {"name": message.text}
-        r.set(message.chat.id, str(user_data))
+        save_session(message.chat.id, user_data)
         
         message_to_send = "Thanks! Now, please enter the child's age (e.g., 2 years, 3 months)."
         msg = bot.send_message(message.chat.id, message_to_send, parse_mode="Markdown")
         bot.register_next_step_handler(msg, get_child_age)
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error getting child name: {e}")
 
 
-def get_age_from_gpt(message):
+def get_age_from_gpt(message, chat_id=None):
+    """The age in months, or None when the model's answer is not a number.
+
+    Only the parse is caught: a failed or timed-out call (DeadlineExceeded,
+    MODEL_UNAVAILABLE) reaches get_child_age, which must not call it an
+    invalid age.
+    """
+    response = create_response(
+        "age",
+        chat_id=chat_id,
+        instructions=prompts.AGE_INSTRUCTIONS,
+        input=message,
+    )
     try:
-        openai_client = openai.OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),
-        )
-        response = openai_client.responses.create(
-            model=OPENAI_MODEL,
-            instructions=(
-                "You have to strictly respond with a number referring to the age in months."
-                "Do not add any other text to the response."
-                "If the unit is not strictly mentioned, it is referring to years and convert it to months."
-                "If it is not possible to extract the age, return 'None'."
-            ),
-            input=message,
-            reasoning={"effort": "none"}
-        )
-        report = response.output_text.strip()
-        return int(report)
-    except Exception as e:
+        return int(response.output_text.strip())
+    except (ValueError, TypeError) as e:
         logger.error(f"Error generating age from chatGPT: {e}")
         return None
 
 
 def get_dev_age_from_gpt(message, age_group):
     try:
-        openai_client = openai.OpenAI(
-                    api_key=os.environ.get("OPENAI_API_KEY"),
-                )
-        age_group_idx = AGE_GROUPS.index(age_group)
-        prev_age_group = AGE_GROUPS[age_group_idx - 1] if age_group_idx > 0 else None
-        prev_age_group_2 = AGE_GROUPS[age_group_idx - 2] if age_group_idx > 1 else None
-
-        system_content = (
-            f"You have to strictly respond with a number referring to the age in months.\n"
-            f"Do not add any other text to the response.\n"
-            f"These are the expected milestones of a {prev_age_group_2} months old: {str(checklist_options.get(prev_age_group_2, 'N/A'))}\n"
-            f"These are the expected milestones of a {prev_age_group} months old: {str(checklist_options.get(prev_age_group, 'N/A'))}\n"
-            f"These are the expected milestones of a {age_group} months old: {str(checklist_options.get(age_group, 'N/A'))}\n"
-            f"You will receive a list of milestones and a corresponding boolean, showing whether the patient is successfully able to do them.\n"
-            f"If the milestones are much more advanced than the previous ones it's known the previous milestones are met. E.g. a child who is talking most likely babbled as a baby."
-            f"Return an estimated development age for the child in months.\n"
-            f"If the estimated age is less than 3 months, return 0."
-        )
-
-        response = openai_client.responses.create(
-            model=OPENAI_MODEL,
-            instructions=system_content,
+        response = create_response(
+            "dev_age",
+            instructions=prompts.dev_age_instructions(age_group),
             input=message,
-            reasoning={"effort": "none"}
         )
         report = response.output_text.strip()
         return int(report)
+    except MODEL_UNAVAILABLE:
+        raise
     except Exception as e:
         logger.error(f"Error generating development age from chatGPT: {e}")
         return None
 
 
-def generate_recommendations(message, age_group):
+def generate_recommendations(message, age_group, unmet_ids=None):
     try:
-        openai_client = openai.OpenAI(
-                    api_key=os.environ.get("OPENAI_API_KEY"),
-                )
-        system_content = (
-            "You will receive a list of tuples, where the True/False value indicates whether the child has hit a milestone or not."
-            "Return a list of recommendations so that the user can improve."
-            "Do not return recommendations where the user has already hit a milestone."
-            f"Strictly stick to the following recommendations {str(suggestions[age_group])}."
-            "The recommendations should be in Markdown format."
-        )
-
-        response = openai_client.responses.create(
-            model=OPENAI_MODEL,
-            instructions=system_content,
+        response = create_response(
+            "recommendations",
+            instructions=prompts.recommendations_instructions(age_group, unmet_ids),
             input=message,
-            reasoning={"effort": "none"}
         )
         report = response.output_text.strip()
         return report
@@ -263,276 +222,109 @@ def generate_recommendations(message, age_group):
         logger.error(f"Error generating recommendations from chatGPT: {e}")
         return None
 
-def generate_recommendations_new(message, age, observations, facts=None):
+def generate_recommendations_new(message, age, observations, facts=None, chat_id=None, result=None,
+                                 structured=True, speculative=False):
+    """The report text. Given the ScreeningResult, the model writes only the prose
+    (as JSON; the Recommendations sections shared through section_cache when
+    SECTION_CACHE is on) and local_report renders the rest; without it, or with
+    structured=False, the model writes all - against a reference list trimmed
+    to the result's bands when there is one and TRIMMED_PROMPT is on. A
+    `speculative` report does not count its shape for the warm-up."""
     try:
-        openai_client = openai.OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),
-        )
-        logger.info(f"Observations: {observations}")
-       
-        system_content = (
-            "1. BASE INSTRUCTIONS:\n"
-            "You are the world's leading expert on ASHA communication development milestones screening.\n"
-            "You will receive:\n"
-            "- The child's chronological age.\n"
-            "- A list of communication milestones met by the child.\n"
-            "- Additional observations provided by the parent.\n"
-
-            "Using this information, you will generate a comprehensive report titled **`SPEECH AND LANGUAGE THERAPY REPORT`** following the specified format."
-
-            "**Important:**\n"
-            "- Do **not** include recommendations for milestones the child has already met.\n"
-            "- If the child meets all milestones for their current chronological age range, omit the Milestones Expected but Not Met section (and omit delay).\n"
-            "- Ensure all recommendations are relevant to the areas of need identified.\n"
-            "- The Milestones reported for a particular child may be from more than one age group. For example, a 12 month old child may have achieved the 6 month age group milestones and some of the 9 month age group milestones. So check for the milestone in the appropriate age group and calculate the delay and development age accordingly.\n"
-            
-            "\n\n2. ASHA Communication development milestones based on chronological age (FOR YOUR CONTEXT):\n"
-
-            "[Birth to 3 Months:]\n"
-            "Alerts to sound.\n"
-            "Quiets or smiles when you talk.\n"
-            "Makes sounds back and forth with you.\n"
-            "Makes sounds that differ depending on whether they are happy or upset.\n"
-            "Coos, makes sounds like ooooo, aahh, and mmmmm.\n"
-            "Recognizes loved ones and some common objects.\n"
-            "Turns or looks toward voices or people talking.\n\n"
-
-            "[4 to 6 Months:]\n"
-            "Giggles and laughs.\n"
-            "Responds to facial expressions.\n"
-            "Looks at objects of interest and follows objects with their eyes.\n"
-            "Reacts to toys that make sounds, like those with bells or music.\n"
-            "Vocalizes during play or with objects in mouth.\n"
-            "Vocalizes different vowel sounds—sometimes combined with a consonant—like uuuuuummm, aaaaaaagoo, or daaaaaaaaaa.\n"
-            "Blows “raspberries.”\n\n"
-
-            "[7 to 9 Months:]\n"
-            "Looks at you when you call their name.\n"
-            "Stops for a moment when you say, “No.”\n"
-            "Babbles long strings of sounds, like mamamama, upup, or babababa.\n"
-            "Looks for loved ones when upset.\n"
-            "Raises arms to be picked up.\n"
-            "Recognizes the names of some people and objects.\n"
-            "Pushes away unwanted objects.\n\n"
-
-            "[10 to 12 Months:]\n"
-            "By age 10 months, reaches for objects.\n"
-            "Points, waves, and shows or gives objects.\n"
-            "Imitates and initiates gestures for engaging in social interactions and playing games, like blowing kisses or playing peek-a-boo.\n"
-            "Tries to copy sounds that you make.\n"
-            "Enjoys dancing.\n"
-            "Responds to simple words and phrases like “Go bye-bye” and “Look at Mommy.”\n"
-            "Says one or two words—like mama, dada, hi, and bye.\n\n"
-
-            "[13 to 18 months:]\n"
-            "Looks around when asked “where” questions—like “Where’s your blanket?”\n"
-            "Follows directions—like “Give me the ball,” “Hug the teddy bear,” “Come here,” or “Show me your nose.”\n"
-            "Points to make requests, to comment, or to get information.\n"
-            "Shakes head for “no” and nods head for “yes.”\n"
-            "Understands and uses words for common objects, some actions, and people in their lives.\n"
-            "Identifies one or more body parts.\n"
-            "Uses gestures when excited, like clapping or giving a high-five, or when being silly, like sticking out their tongue or making funny faces.\n"
-            "Uses a combination of long strings of sounds, syllables, and real words with speech-like inflection.\n\n"
-
-            "[19 to 24 months:]\n"
-            "Uses and understands at least 50 different words for food, toys, animals, and body parts. Speech may not always be clear—like du for “shoe” or dah for “dog.”\n"
-            "Puts two or more words together—like more water or go outside.\n"
-            "Follows two-step directions—like “Get the spoon, and put it on the table.”\n"
-            "Uses words like me, mine, and you.\n"
-            "Uses words to ask for help.\n"
-            "Uses possessives, like Daddy’s sock.\n\n"
-
-            "[2 to 3 years:]\n"
-            "Uses word combinations often but may occasionally repeat some words or phrases, like baby – baby – baby sit down or I want – I want juice.\n"
-            "Tries to get your attention by saying, Look at me!\n"
-            "Says their name when asked.\n"
-            "Uses some plural words like birds or toys.\n"
-            "Uses –ing verbs like eating or running. Adds –ed to the end of words to talk about past actions, like looked or played.\n"
-            "Gives reasons for things and events, like saying that they need a coat when it’s cold outside.\n"
-            "Asks why and how.\n"
-            "Answers questions like “What do you do when you are sleepy?” or “Which one can you wear?”\n"
-            "Correctly produces p, b, m, h, w, d, and n in words.\n"
-            "Correctly produces most vowels in words.\n"
-            "Speech is becoming clearer but may not be understandable to unfamiliar listeners or to people who do not know your child.\n\n"
-
-            "[3 to 4 years:]\n"
-            "Compares things, with words like bigger or shorter.\n"
-            "Tells you a story from a book or a video.\n"
-            "Understands and uses more location words, like inside, on, and under.\n"
-            "Uses words like a or the when talking, like a book or the dog.\n"
-            "Pretends to read alone or with others.\n"
-            "Recognizes signs and logos like STOP.\n"
-            "Pretends to write or spell and can write some letters.\n"
-            "Correctly produces t, k, g, f, y, and –ing in words.\n"
-            "Says all the syllables in a word.\n"
-            "Says the sounds at the beginning, middle, and end of words.\n"
-            "By age 4 years, your child talks smoothly. Does not repeat sounds, words, or phrases most of the time.\n"
-            "By age 4 years, your child speaks so that people can understand most of what they say. Child may make mistakes on sounds that are later to develop—like l, j, r, sh, ch, s, v, z, and th.\n"
-            "By age 4 years, your child says all sounds in a consonant cluster containing two or more consonants in a row—like the tw in tweet or the –nd in sand. May not produce all sounds correctly—for example, spway for “spray.\n\n"
-
-            "[4 to 5 years:]\n"
-            "Produces grammatically correct sentences. Sentences are longer and more complex.\n"
-            "Includes (1) main characters, settings, and words like and to connect information and (2) ideas to tell stories.\n"
-            "Uses at least one irregular plural form, like feet or men.\n"
-            "Understands and uses location words, like behind, beside, and between.\n"
-            "Uses more words for time—like yesterday and tomorrow—correctly.\n"
-            "Follows simple directions and rules to play games.\n"
-            "Locates the front of a book and its title.\n"
-            "Recognizes and names 10 or more letters and can usually write their own name.\n"
-            "Imitates reading and writing from left to right.\n"
-            "Blends word parts, like cup + cake = cupcake. Identifies some rhyming words, like cat and hat.\n"
-            "Produces most consonants correctly, and speech is understandable in conversation.\n\n\n"
-            
-            "3. DERIVED VALUES (DO NOT COMPUTE THESE):\n"
-            "The chronological age range, the developmental age range, the unmet milestone list and the\n"
-            "delay percentage are all computed for you by the screening software and supplied in the\n"
-            "VERIFIED FACTS block at the end of the user message. You must not derive, recalculate or\n"
-            "second-guess any of them. See section 5.\n\n"
-
-            "4. OUTPUT INSTRUCTIONS:\n"
-            "Use the provided information about the child to fill in the dynamic sections.\n\n"
-            
-            "**Follow these instructions for the output:**\n"
-            "- **Format:** Ensure the report strictlyfollows the exact Markdown format, including headings, Main Bullets and nested sub-bullet points. No additions or explanations whatsoever.\n"
-            "- **Developmental Age Range:** Use DEVELOPMENTAL_AGE_RANGE from the FACTS block verbatim.\n"
-            "- **Milestones Achieved:** Use the MILESTONES_MET list from the FACTS block.\n"
-            "- **Milestones Expected but Not Met:** Use the MILESTONES_NOT_MET list from the FACTS block, exactly and completely. Do **not** add milestones from any other age range.\n"
-            "- **Delay Percentage:** Use DELAY_PERCENTAGE from the FACTS block verbatim. Never print a percentage that does not appear there, and never show a formula.\n"
-            "- **Recommendations:** Provide recommendations solely based on the unmet milestones, unless MILESTONES_NOT_MET is NONE, in which case base them on enrichment and continued growth.\n"
-            "- Do not say that the child has a delay if the FACTS block reports no delay.\n\n"
-            "- Mention Additional observations if provided by parent in the Observations section by blending them in the bullet points.\n\n"
-            "- If child has met all the milestones for the current age range, then donot mention the 'child has a delay' line in the report instead write 'The child has met all the milestones for the current age range.'."
-            "\n\n- Always include the 'Recommendations for Parents' and 'Recommendations for the Clinical Team' sections, even when the child has met all milestones for the current age range. In that case, provide general age-appropriate enrichment activities for parents and routine monitoring guidance for the clinical team.\n\n"
-
-
-            "\n\n5. AUTHORITATIVE DERIVED FACTS\n"
-            "The user message ends with a \"VERIFIED FACTS\" block computed deterministically by the\n"
-            "screening software from the clinician's checklist responses. Those values are\n"
-            "authoritative and already correct.\n\n"
-            "- Use them verbatim. Do NOT recalculate the delay percentage, the developmental age\n"
-            "  range, the current chronological age range, or the unmet milestone list.\n"
-            "- Never contradict the FACTS block anywhere in the report, including in prose.\n"
-            "- The unmet milestone list is exhaustive. Never introduce a milestone from a higher age band.\n"
-            "- Reproduce each milestone in the \"Milestones Achieved\" and \"Milestones Expected but Not\n"
-            "  Met\" sections VERBATIM as written in the FACTS block, including its examples. These are\n"
-            "  the official ASHA milestone descriptors and the report must remain traceable to them, so\n"
-            "  do not paraphrase, abbreviate, merge, or drop any of them. Your own clinical wording\n"
-            "  belongs in the Observations and Recommendations sections.\n"
-            "- If ALL_MILESTONES_MET_FOR_CURRENT_RANGE is YES, the child has NO delay per the\n"
-            "  checklist: omit the \"Milestones Expected but Not Met\" section and print no percentage.\n"
-            "  This reflects the checklist only - see the SAFETY OVERRIDE in the FACTS block: a concern\n"
-            "  described in the parent or clinician narrative (not speaking, not responding to their\n"
-            "  name, lost skills, no eye contact, hearing concerns) must still be surfaced and followed\n"
-            "  up. An all-met checklist never overrides a reported red flag.\n"
-            "- Produce BOTH Recommendations sections in full in every report, including when there is\n"
-            "  no delay and nothing unmet.\n"
-            "- The FACTS block is internal plumbing. Never print its field names (DELAY_PERCENTAGE,\n"
-            "  ALL_MILESTONES_MET_FOR_CURRENT_RANGE, MILESTONES_NOT_MET and the like) or refer to \"the\n"
-            "  FACTS block\" in the report. This report is read by parents and clinicians.\n"
-            "- \"Omit a section\" means the heading itself must not appear at all. Do not print the\n"
-            "  heading followed by \"omitted\", \"none\", or an explanation.\n"
-            "- The Expressive / Receptive / Social Communication grouping is a template, not a quota.\n"
-            "  If a domain has no milestones in a given section, leave that domain out of that section\n"
-            "  entirely. Never write \"none reported\" or explain that a domain was empty.\n\n"
-
-            "## SPEECH AND LANGUAGE THERAPY REPORT\n"
-
-            "## Child's Age:\n"
-            "[CHRONOLOGICAL_AGE from the FACTS block, which is stated in MONTHS. Convert to years and months for readability if you wish, but never treat the number as years.]"
-
-            "## Overview:\n"
-            "The Communication Milestone Screening Protocol: Birth to 5 (CMSP: B-5) was given based on parent report and/or clinical observation.\n\n"
-            "The CMSP: B-5 is a criterion-based speech and language screening tool for children from birth to age 5. It incorporates parent reports, observations in natural environments, and session documentation, systematically comparing findings to the ASHA Developmental Milestones for speech and language. This tool is designed to identify early signs of potential communication delays and to inform decisions regarding the need for further comprehensive assessment.\n\n"
-
-            "## Observations:\n"
-            "Child is [Child’s Current Age] old at the time of screening, which falls within the [CURRENT_CHRONOLOGICAL_AGE_RANGE] ASHA age range. Based on the ASHA Developmental Milestones, the child’s speech and language abilities are functioning at the developmental range of [DEVELOPMENTAL_AGE_RANGE] according to their milestones. Clinical observations and parent reports indicate the following:\n\n"
-            "  - [Main Bullet Point 1]\n"
-            "  - [Main Bullet Point 2]\n"
-            "  - [Main Bullet Point 3]\n"
-
-            "These observations indicate a potential delay in expressive and receptive language development compared to the expected developmental milestones for a child of Child’s age.\n"
-
-            "## Milestones Achieved:\n"
-            "At the [Developmental Age Range] developmental level, Child has demonstrated the following abilities:\n\n"
-            "  - **Expressive Language:** [Main Bullet Point 1]\n"
-            "    - [Sub-Bullet Point 1]\n"
-            "    - [Sub-Bullet Point 2]\n"
-            "  - **Receptive Language:** [Main Bullet Point 2]\n"
-            "    - [Sub-Bullet Point 1]\n"
-            "  - **Social Communication:** [Main Bullet Point 3]\n"
-            "    - [Sub-Bullet Point 1]\n"
-            "    - [Sub-Bullet Point 2]\n"
-            "    - [Sub-Bullet Point 3]\n\n\n"
-
-            "## Milestones Expected but Not Met :\n"
-            "  - **Expressive Language:** [Main Bullet Point 1]\n"
-            "    - [Sub-Bullet Point 1]\n"
-            "    - [Sub-Bullet Point 2]\n"
-            "    - [Sub-Bullet Point 3]\n"
-            "  - **Receptive Language:** [Main Bullet Point 2]\n"
-            "    - [Sub-Bullet Point 1]\n"
-            "    - [Sub-Bullet Point 2]\n"
-            "    - [Sub-Bullet Point 3]\n"
-            "  - **Social Communication:** [Main Bullet Point 3]\n"
-            "    - [Sub-Bullet Point 1]\n"
-            "    - [Sub-Bullet Point 2]\n"  
-            "    - [Sub-Bullet Point 3]\n"
-
-            "The child presents with a delay of approximately [Minimum Percentage]% to [Maximum Percentage]% in communication development based on their chronological age of [Child’s Age] and their estimated developmental age range of [Estimated Developmental Age Range according to the milestones met].\n"
-
-            "## Recommendations for Parents:[Dynamic]\n"
-            "  - **Speech and Language Enrichment:** [Main Bullet Point 1]\n"
-            "    - [Sub Bullet]\n"
-            "    - [Sub Bullet]\n"
-            "    - [Sub Bullet]\n"
-            "    - [Sub Bullet]\n"
-            "    - [Sub Bullet]\n"
-            "  - **Books and Songs:** [Main Bullet Point 2]\n"
-            "    - [Sub Bullet]\n"  
-            "    - [Sub Bullet]\n"
-
-            "## Recommendations for the Clinical Team:[Dynamic]\n"
-            "  - **Further Evaluation:** [Main Bullet Point 1]\n"
-            "    - [Sub Bullet]\n"
-            "  - **Early Intervention Services:** [Main Bullet Point 2]\n"
-            "    - [Sub Bullet]\n"
-            "    - [Sub Bullet]\n"
-            "  - **Ongoing Monitoring:** [Main Bullet Point 3]\n"
-            "    - [Sub Bullet]\n"
-        )
-
-        response = openai_client.responses.create(
-            model=OPENAI_MODEL,
-            instructions=system_content,
-            input=(
-                f"Current age of the child: {age}, \n\nMilestones met by child: {message},"
-                f"\n\n Additional observations: {observations}"
-                + (facts or "")
-            ),
-            # reasoning={"effort": "none"}
+        logger.info("Observations: %d chars", len(observations or ""))
+        logsafe.dump(logger, "Observations", observations)
+
+        if result is not None and structured and SECTION_CACHE:
+            return write_split_report(message, age, observations, facts, chat_id, result, speculative)
+        if result is not None and structured:
+            response = create_response(
+                "report",
+                chat_id=chat_id,
+                instructions=prompts.PROSE_INSTRUCTIONS,
+                input=prompts.prose_input(message, age, observations, facts, result),
+                text=prompts.PROSE_FORMAT,
+            )
+            prose = local_report.parse_prose(response.output_text)
+            return local_report.render(result, observations, prose=prose)
+
+        response = create_response(
+            "report",
+            chat_id=chat_id,
+            instructions=prompts.report_instructions(
+                prompts.prompt_bands(result) if result is not None and TRIMMED_PROMPT else None),
+            input=prompts.report_input(message, age, observations, facts),
         )
         report = response.output_text.strip()
         return report
+    except MODEL_UNAVAILABLE:
+        raise
     except Exception as e:
         logger.error(f"Error generating recommendations from chatGPT: {e}")
         return None
 
+def write_split_report(message, age, observations, facts, chat_id, result, speculative=False):
+    """The structured report with shared Recommendations sections: on a cache
+    hit one small call for the observations; on a miss the sections call runs
+    alongside it on the model pool.
+
+    Only the first call announces a queue position: the observations call may
+    be queued behind this report's own sections call, and a position that
+    counts it would mislead the user. If the observations
+    fail, the sections call is left to finish and its result is stored for the
+    next report of the same shape.
+    """
+    shape = section_cache.shape_of(result)
+    deadlines.timeout(None, "redis.sections")
+    metrics.REDIS_OPS.inc(op="sections")
+    with span("redis.sections", chat_id):
+        shared = sections.get(shape, count=not speculative)
+    pending = None
+    if shared is None:
+        llm.BREAKER.check()
+        pending, position = model_pool.submit(_call_model, "sections", section_cache.request(shape))
+        if position and chat_id is not None:
+            try:
+                announce_queue_position(chat_id, position)
+            except Exception as e:  # noqa: BLE001 - as in ModelPool.run
+                logger.error("Error announcing queue position: %s", e)
+    try:
+        response = create_response(
+            "observations",
+            chat_id=chat_id if pending is None else None,
+            instructions=prompts.OBSERVATIONS_INSTRUCTIONS,
+            input=prompts.report_input(message, age, observations, facts),
+            text=prompts.OBSERVATIONS_FORMAT,
+        )
+        personal = section_cache.parse_observations(response.output_text)
+    except Exception:
+        if pending is not None:
+            pending.add_done_callback(lambda done: keep_sections(shape, done))
+        raise
+    if pending is not None:
+        shared = section_cache.parse_sections(model_pool.wait(pending, "model.sections").output_text)
+        metrics.REDIS_OPS.inc(op="sections")
+        with span("redis.sections", chat_id):
+            sections.put(shape, shared)
+    return local_report.render(result, observations, prose=section_cache.stitch(personal, shared))
+
+def keep_sections(shape, done):
+    """Store the sections from a call whose report gave up on it."""
+    if done.cancelled() or done.exception() is not None:
+        return
+    try:
+        shared = section_cache.parse_sections(done.result().output_text)
+    except ValueError as e:
+        logger.warning("Abandoned sections call returned bad JSON: %s", e)
+        return
+    metrics.REDIS_OPS.inc(op="sections")
+    sections.put(shape, shared)
+
 def get_word_age(dev_age):
     try:
-        openai_client = openai.OpenAI(
-                    api_key=os.environ.get("OPENAI_API_KEY"),
-                )        
-        response = openai_client.responses.create(
-            model=OPENAI_MODEL,
-            instructions=(
-                "You have to strictly respond with age."
-                "Do not add any other text to the response."
-                "You will receive an age in months; you have to reply in this format: years, months."
-                "Ignore the years part if the input is less than 12."
-                "For example, 15: 1 year, 3 months."
-            ),
+        response = create_response(
+            "word_age",
+            instructions=prompts.WORD_AGE_INSTRUCTIONS,
             input=str(dev_age),
-            reasoning={"effort": "none"}
         )
         report = response.output_text.strip()
         return report
@@ -543,12 +335,12 @@ def get_word_age(dev_age):
 
 def create_checklist_markup(user_id, checklist_options):
     """Create a checklist markup with current selections and additional options."""
-    user_data = ast.literal_eval(r.get(user_id).decode("utf-8"))
+    user_data = load_session(user_id)
     
     age_group = user_data['age_group']
     if 'checklists' not in user_data:
         user_data['checklists'] = {age_group: [False] * len(checklist_options)}
-        r.set(user_id, str(user_data))
+        save_session(user_id, user_data)
 
     checklist = user_data['checklists'].get(age_group, [False] * len(checklist_options))
 
@@ -578,16 +370,19 @@ def checklist(message, checklist_options):
             full_message,
             reply_markup=create_checklist_markup(message.chat.id, checklist_options)
         )
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error in sending checklist: {e}")
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("toggle_"))
+@tracked
 def toggle_checklist(call):
     """Toggle the checked/unchecked state of an option."""
     try:
         user_id = call.message.chat.id
         option_idx = int(call.data.split("_")[1])
-        user_data = ast.literal_eval(r.get(user_id).decode("utf-8"))
+        user_data = load_session(user_id)
         age_group = user_data['age_group']
 
         if 'checklists' not in user_data:
@@ -599,24 +394,28 @@ def toggle_checklist(call):
         checklist = user_data['checklists'][age_group]
         checklist[option_idx] = not checklist[option_idx]
         user_data['checklists'][age_group] = checklist
-        r.set(user_id, str(user_data))
+        save_session(user_id, user_data)
 
-        bot.edit_message_reply_markup(
-            call.message.chat.id,
-            call.message.message_id,
-            reply_markup=create_checklist_markup(user_id, checklist_options[age_group])
-        )
+        with span("telegram.edit_markup", user_id):
+            bot.edit_message_reply_markup(
+                call.message.chat.id,
+                call.message.message_id,
+                reply_markup=create_checklist_markup(user_id, checklist_options[age_group])
+            )
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error toggling checklist: {e}")
 
 
 @bot.callback_query_handler(func=lambda call: call.data == "previous_milestones")
+@tracked
 def show_previous_milestones(call):
     """Display the previous age group's milestones."""
     try:
         user_id = call.message.chat.id
-        user_data = ast.literal_eval(r.get(user_id).decode("utf-8"))
+        user_data = load_session(user_id)
         current_age_group = user_data['age_group']
         current_index = AGE_GROUPS.index(current_age_group)
 
@@ -625,7 +424,7 @@ def show_previous_milestones(call):
             user_data['age_group'] = previous_age_group
             if previous_age_group not in user_data['checklists']:
                 user_data['checklists'][previous_age_group] = [False] * len(checklist_options[previous_age_group])
-            r.set(user_id, str(user_data))
+            save_session(user_id, user_data)
             numbered_list = "\n".join([f"{idx + 1}. {option}" for idx, option in enumerate(checklist_options[previous_age_group])])
             full_message = f"Showing milestones for {previous_age_group} months:\n\n{numbered_list}"
             
@@ -637,17 +436,20 @@ def show_previous_milestones(call):
         else:
             bot.send_message(call.message.chat.id, "No previous milestones available.")
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error showing previous milestones: {e}")
 
 # ... existing code ...
 
 @bot.callback_query_handler(func=lambda call: call.data == "submit_checklist")
+@tracked
 def submit_checklist(call):
     """Handle checklist submission."""
     try:
         user_id = call.message.chat.id
-        user_data = ast.literal_eval(r.get(user_id).decode("utf-8"))
+        user_data = load_session(user_id)
 
         # Collect milestones from all age groups
         achieved_milestones = []
@@ -679,7 +481,7 @@ def submit_checklist(call):
             if current_index < len(AGE_GROUPS) - 1:
                 next_age_group = AGE_GROUPS[current_index + 1]
                 user_data['age_group'] = next_age_group
-                r.set(user_id, str(user_data))
+                save_session(user_id, user_data)
 
                 # Notify the user and display next milestones
                 bot.send_message(
@@ -724,121 +526,190 @@ def submit_checklist(call):
 
         # Temporarily store the formatted checklist to use in the next step
         user_data['formatted_checklist'] = formatted_checklist
-        r.set(user_id, str(user_data))
+        save_session(user_id, user_data)
+        speculate_report(user_id, user_data)
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error submitting checklist: {e}")
         bot.send_message(call.message.chat.id, "An error occurred while submitting the checklist. Please try again later.")
 
+def speculate_report(chat_id, user_data):
+    """Start writing the no-observations report before the user asks for it."""
+    if not SPECULATIVE_REPORTS or user_data.get('fast_report'):
+        return
+    try:
+        result = analyze_session(user_data, chat_id)
+    except screening_logic.OutOfScope:
+        return
+    # On a section-cache miss the report takes two pool slots at once (the
+    # sections and the observations), so it waits for two free ones.
+    slots = 1
+    if SECTION_CACHE:
+        metrics.REDIS_OPS.inc(op="sections")
+        with span("redis.sections", chat_id):
+            if not sections.contains(section_cache.shape_of(result)):
+                slots = 2
+    running, queued = model_pool.depth()
+    if running + queued + slots > model_pool.concurrency:
+        metrics.SPECULATIONS.inc(outcome="skipped")
+        return
+    speculator.start(chat_id, speculation.report_key(user_data),
+                     write_report, dict(user_data, observations=""), result, speculative=True)
+
 @bot.callback_query_handler(func=lambda call: call.data == "add_observations")
+@tracked
 def add_observations(call):
     """Prompt the user to add additional observations."""
     try:
+        speculator.discard(call.message.chat.id)
         msg = bot.send_message(call.message.chat.id, "Please enter any additional observations you'd like to add:")
         bot.register_next_step_handler(msg, save_observations)
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error prompting for observations: {e}")
 
+@tracked
 def save_observations(message):
     """Save the user's additional observations."""
     try:
         user_id = message.chat.id
         observations = message.text.strip()
 
-        user_data = ast.literal_eval(r.get(user_id).decode("utf-8"))
+        user_data = load_session(user_id)
         user_data['observations'] = observations
-        r.set(user_id, str(user_data))
+        save_session(user_id, user_data)
 
         bot.send_message(message.chat.id, "Observations saved successfully.")
         bot.send_message(message.chat.id, "Generating recommendations...")
         
         # Proceed with recommendations
         proceed_with_recommendations(message, user_data)
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error saving observations: {e}")
         bot.send_message(message.chat.id, "An error occurred while saving your observations. Please try again.")
 
 @bot.callback_query_handler(func=lambda call: call.data == "skip_observations")
+@tracked
 def skip_observations(call):
     """Skip adding additional observations and proceed."""
     try:
         user_id = call.message.chat.id
-        user_data = ast.literal_eval(r.get(user_id).decode("utf-8"))
+        user_data = load_session(user_id)
         user_data['observations'] = ""
-        r.set(user_id, str(user_data))
+        save_session(user_id, user_data)
 
         bot.send_message(call.message.chat.id, "No additional observations added.")
         bot.send_message(call.message.chat.id, "Generating recommendations...")
 
         # Proceed with recommendations
         proceed_with_recommendations(call.message, user_data)
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error skipping observations: {e}")
         bot.send_message(call.message.chat.id, "An error occurred. Please try again.")
 
+def analyze_session(user_data, chat_id=None):
+    """The ScreeningResult for a session's age and checklists."""
+    with span("screening.analyze", chat_id):
+        return screening_logic.analyze(
+            user_data["age"],
+            {int(k): v for k, v in user_data.get('checklists', {}).items()},
+            checklist_options,
+            DOMAIN_TABLE,
+        )
+
+def write_report(user_data, result, chat_id=None, speculative=False):
+    """The model's report for a session, or None; raises MODEL_UNAVAILABLE."""
+    with span("screening.facts_block", chat_id):
+        facts = screening_logic.build_facts_block(result)
+    return generate_recommendations_new(
+        user_data.get('formatted_checklist', ''), user_data["age"], user_data.get('observations', ''),
+        facts=facts, chat_id=chat_id, result=result, speculative=speculative,
+    )
+
 def proceed_with_recommendations(message, user_data):
     """Generate and send recommendations based on milestones and observations."""
     try:
-        formatted_checklist = user_data.get('formatted_checklist', '')
-
         # Every number in the report is computed here, not by the model. If this
         # fails we must not fall back to letting the model do the arithmetic - an
         # unverified clinical report is worse than no report.
         try:
-            result = screening_logic.analyze(
-                user_data["age"],
-                {int(k): v for k, v in user_data.get('checklists', {}).items()},
-                checklist_options,
-                MILESTONE_DOMAINS,
-            )
+            result = analyze_session(user_data, message.chat.id)
         except screening_logic.OutOfScope as e:
             logger.error(f"Screening out of scope: {e}")
             age_more_than_range(message)
             return
 
-        facts = screening_logic.build_facts_block(result)
         logger.info(
             "Screening computed: chrono=%s dev=%s delay=%s administered=%s presumed=%s unmet=%d",
             result.chrono_band.label, result.dev_band_label, result.delay_text,
             result.administered_keys, result.presumed_keys, len(result.unmet),
         )
 
-        recommendations = generate_recommendations_new(
-            formatted_checklist, user_data["age"], user_data.get('observations', ''),
-            facts=facts,
-        )
-        if not recommendations:
-            bot.send_message(message.chat.id, "An error occurred while generating the report. Please try again.")
-            return
-        escaped_recommendations = escape_markdown_v2(recommendations)
-
-        user_data['recommendations'] = recommendations
-        r.set(message.chat.id, str(user_data))
-
-        # Split the recommendations message
-        recommendations_chunks = split_message(
-            f"📝 Based on the screening, here are the recommendations for the child:\n\n{escaped_recommendations}",
-            max_length=4000
-        )
-            
-        # Send each chunk sequentially
-        for chunk in recommendations_chunks:
-            bot.send_message(
-                message.chat.id, 
-                chunk, 
-                parse_mode="MarkdownV2"
-            )
-
+        # The facts are settled before the model writes a word: show them now,
+        # and fall back to the locally rendered report if the model can't help.
+        fast = user_data.get('fast_report', False)
+        recommendations = None
+        draft = None
+        if fast or user_data.get('observations'):
+            speculator.discard(message.chat.id)
+        else:
+            draft = speculator.take(message.chat.id, speculation.report_key(user_data))
+        if not fast:
+            if REPORT_PREVIEW and not (draft and draft.done()):
+                bot.send_message(message.chat.id, local_report.render_preview(result), priority=outbound.INTERACTIVE)
+            out_of_time = False
+            if draft is not None:
+                # The draft runs outside any deadline; wait only as long as
+                # leaves time to send the local report instead.
+                try:
+                    with span("report.speculative_wait", message.chat.id):
+                        recommendations = outbound.wait(draft, "report.speculative_wait",
+                                                        reserve=deadlines.RESERVE)
+                    if recommendations and SECTION_CACHE:
+                        # The draft did not count its shape; count it now it is used.
+                        background.submit(sections.seen, section_cache.shape_of(result))
+                except deadlines.DeadlineExceeded as e:
+                    draft.cancel()
+                    metrics.SPECULATIONS.inc(outcome="discarded")
+                    logger.warning("Speculative report not ready in time, sending the local report: %s", e)
+                    out_of_time = True
+                except Exception as e:
+                    logger.warning("Speculative report failed, writing it now: %s", e)
+            try:
+                if not recommendations and not out_of_time:
+                    with span("report.generate", message.chat.id):
+                        recommendations = write_report(user_data, result, chat_id=message.chat.id)
+            except MODEL_UNAVAILABLE as e:
+                logger.warning("Model unavailable, sending the local report: %s", e)
+        local = not recommendations
+        if local:
+            with span("report.local", message.chat.id):
+                recommendations = local_report.render(result, user_data.get('observations', ''))
+            if not fast:
+                bot.send_message(message.chat.id, "The written report isn't available right now, so here is "
+                                                  "the report built from the checklist results.")
+        user_data['report_mode'] = "local" if local else "model"
         default_subject = f"Milestones Report - {user_data['name']} - {datetime.now().strftime('%d/%m/%y %H:%M')}"
+        user_data['recommendations'] = recommendations
         user_data['email_subject'] = default_subject
         user_data['email_body'] = recommendations
-        r.set(message.chat.id, str(user_data))
-        logger.info(f"User id: {message.chat.id}")
-        logger.info(f"UserId data type: {type(message.chat.id)}")
-        logger.info(f"User data saved before redis: {user_data}")
 
-        u_data = ast.literal_eval(r.get(message.chat.id).decode("utf-8"))
-        logger.info(f"User data saved from redis: {u_data}")
+        # Persisting and sending are independent: write Redis on a background
+        # thread while the chunks go out in order, and wait for it only before
+        # offering the buttons that read the session back.
+        saved = background.submit(persist_report, message.chat.id, user_data)
+        send_report(message.chat.id, recommendations)
+        with span("redis.persist_wait", message.chat.id):
+            outbound.wait(saved, "redis.persist")
+        logger.info("Report saved for chat %s: %s",
+                    HashedChat(message.chat.id), SessionSummary(user_data))
 
         # Ask if user wants to generate a report
         markup = types.InlineKeyboardMarkup()
@@ -847,28 +718,141 @@ def proceed_with_recommendations(message, user_data):
         send_button = types.InlineKeyboardButton("Send Email", callback_data="send_email")
         no_button = types.InlineKeyboardButton("Restart", callback_data="restart")
         markup.add(send_button, subject_button, no_button)
+        if local and not fast:
+            markup.add(types.InlineKeyboardButton("Write Full Report", callback_data="retry_report"))
         bot.send_message(message.chat.id, "Email Subject: "+default_subject+"\n\nWould you like to email the report?", reply_markup=markup)
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error proceeding with recommendations: {e}")
         bot.send_message(message.chat.id, "An error occurred while generating recommendations. Please try again later.")
+@bot.callback_query_handler(func=lambda call: call.data == "retry_report")
+@tracked
+def retry_report(call):
+    """Ask the model for the written report after a local one was sent instead."""
+    try:
+        user_data = load_session(call.message.chat.id)
+        user_data.pop('fast_report', None)
+        bot.send_message(call.message.chat.id, "Generating recommendations...")
+        proceed_with_recommendations(call.message, user_data)
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrying the report: {e}")
+        bot.send_message(call.message.chat.id, "An error occurred. Please try again.")
+
 # ... existing code ...
-def format_years_months(months):
-    years = months // 12
-    remaining_months = months % 12
-    
-    result = f"{years} years, {remaining_months} months" if years else f"{remaining_months} months"
-    
-    return result
+def persist_report(chat_id, user_data):
+    """Archive a freshly generated report and save the session once."""
+    metrics.REDIS_OPS.inc(op="archive")
+    with span("redis.archive", chat_id):
+        user_data['report_id'] = archive.append(
+            chat_id, user_data['recommendations'],
+            subject=user_data['email_subject'], age=user_data["age"])
+    save_session(chat_id, user_data)
+
+
+def send_report(chat_id, recommendations):
+    """Send a report as MarkdownV2 chunks, in order."""
+    with span("markdown.escape", chat_id):
+        escaped_recommendations = escape_markdown_v2(recommendations)
 
+    # Split the recommendations message
+    recommendations_chunks = split_message(
+        f"📝 Based on the screening, here are the recommendations for the child:\n\n{escaped_recommendations}",
+        max_length=4000
+    )
+
+    # Queue every chunk as bulk work (other chats' interactive replies go
+    # first), then wait for all of them; the queue sends one chat's calls in
+    # order, so anything sent after this follows the last chunk.
+    # Out of time, leave them to the queue: they are delivered after we return.
+    with span("telegram.send_report", chat_id):
+        sent = [bot.submit("send_message", chat_id, chunk, parse_mode="MarkdownV2")
+                for chunk in recommendations_chunks]
+        if deadlines.nearly_spent("telegram.send_report"):
+            return
+        for future in sent:
+            outbound.wait(future, "telegram.send_report")
+
+
+@bot.message_handler(commands=["fast"])
+@tracked
+def fast_report(message):
+    """Toggle the checklist-only report for the screening in progress."""
+    try:
+        user_data = load_session(message.chat.id)
+        user_data['fast_report'] = not user_data.get('fast_report', False)
+        save_session(message.chat.id, user_data)
+        if user_data['fast_report']:
+            bot.send_message(message.chat.id, "Fast report on: this screening's report will be built from the "
+                                              "checklist results right away, without the written interpretation. "
+                                              "Send /fast again to turn it off.")
+        else:
+            bot.send_message(message.chat.id, "Fast report off: this screening will get the full written report.")
+    except sessions.SessionExpired:
+        bot.send_message(message.chat.id, "Press /start to begin a screening, then send /fast.")
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error toggling fast report: {e}")
+
+
+@bot.message_handler(commands=["history"])
+@tracked
+def history(message):
+    """List this chat's archived reports, newest first."""
+    try:
+        metrics.REDIS_OPS.inc(op="archive")
+        with span("redis.archive", message.chat.id):
+            entries = archive.entries(message.chat.id)
+        if not entries:
+            bot.send_message(message.chat.id, "No saved reports yet. Press /start to run a screening.")
+            return
+
+        markup = types.InlineKeyboardMarkup()
+        for entry in entries:
+            label = entry.subject or datetime.fromtimestamp(entry.created).strftime('%d/%m/%y %H:%M')
+            markup.add(types.InlineKeyboardButton(label, callback_data=f"history_{entry.report_id}"))
+        bot.send_message(message.chat.id, "Saved reports - choose one to see it again:", reply_markup=markup)
+
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error listing report history: {e}")
+        bot.send_message(message.chat.id, "An error occurred while loading your reports. Please try again later.")
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("history_"))
+@tracked
+def resend_report(call):
+    """Re-send an archived report as it was generated - no model call."""
+    try:
+        chat_id = call.message.chat.id
+        metrics.REDIS_OPS.inc(op="archive")
+        with span("redis.archive", chat_id):
+            record = archive.get(chat_id, int(call.data.split("_", 1)[1]))
+        if record is None:
+            bot.send_message(chat_id, "That report is no longer stored.")
+            return
+        bot.send_message(chat_id, record["subject"] or "Saved report")
+        send_report(chat_id, record["report"])
+
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error re-sending archived report: {e}")
+        bot.send_message(call.message.chat.id, "An error occurred while loading the report. Please try again later.")
 
 
 @bot.callback_query_handler(func=lambda call: call.data == "generate_report")
+@tracked
 def generate_report(call):
     """Generate the report and display email options."""
     try:
         user_id = call.message.chat.id
-        user_data = ast.literal_eval(r.get(user_id).decode("utf-8"))
+        user_data = load_session(user_id)
 
         default_subject = f"Milestones Report - {user_data['name']} - {datetime.now().strftime('%d/%m/%y %H:%M')}"
         default_body = f"""
@@ -886,7 +870,7 @@ Milestones Bot
 
         user_data['email_subject'] = default_subject
         user_data['email_body'] = default_body
-        r.set(user_id, str(user_data))
+        save_session(user_id, user_data)
 
         bot.send_message(call.message.chat.id, f"Subject: {default_subject}")
         bot.send_message(call.message.chat.id, f"Body:\n{default_body}")
@@ -902,31 +886,37 @@ Milestones Bot
 
         bot.send_message(call.message.chat.id, "You can change the subject or body, or send the email.", reply_markup=markup)
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error generating report: {e}")
         bot.send_message(call.message.chat.id, "An error occurred while generating the report. Please try again.")
 
 
 @bot.callback_query_handler(func=lambda call: call.data == "change_subject")
+@tracked
 def change_subject(call):
     """Prompt the user to enter a new subject."""
     try:
         msg = bot.send_message(call.message.chat.id, "Please enter a new subject:")
         bot.register_next_step_handler(msg, set_new_subject)
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error changing subject: {e}")
 
 
+@tracked
 def set_new_subject(message):
     """Update the subject with user input."""
     try:
         user_id = message.chat.id
         new_subject = message.text
 
-        user_data = ast.literal_eval(r.get(user_id).decode("utf-8"))
+        user_data = load_session(user_id)
         user_data['email_subject'] = new_subject
-        r.set(user_id, str(user_data))
+        save_session(user_id, user_data)
 
         bot.send_message(message.chat.id, f"Subject updated to: {new_subject}")
         markup = types.InlineKeyboardMarkup()
@@ -936,30 +926,36 @@ def set_new_subject(message):
         markup.add(subject_button, body_button, send_button)
         bot.send_message(message.chat.id, "You can now change the subject or body, or send the email.", reply_markup=markup)
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error setting new subject: {e}")
 
 
 @bot.callback_query_handler(func=lambda call: call.data == "change_body")
+@tracked
 def change_body(call):
     """Prompt the user to enter a new body."""
     try:
         msg = bot.send_message(call.message.chat.id, "Please enter a new body for the email:")
         bot.register_next_step_handler(msg, set_new_body)
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error changing body: {e}")
 
 
+@tracked
 def set_new_body(message):
     """Update the body with user input."""
     try:
         user_id = message.chat.id
         new_body = message.text
 
-        user_data = ast.literal_eval(r.get(user_id).decode("utf-8"))
+        user_data = load_session(user_id)
         user_data['email_body'] = new_body
-        r.set(user_id, str(user_data))
+        save_session(user_id, user_data)
 
         bot.send_message(message.chat.id, "Email body updated successfully.")
         markup = types.InlineKeyboardMarkup()
@@ -969,28 +965,43 @@ def set_new_body(message):
         markup.add(subject_button, body_button, send_button)
         bot.send_message(message.chat.id, "You can now change the subject or body, or send the email.", reply_markup=markup)
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error setting new body: {e}")
 
 
 @bot.callback_query_handler(func=lambda call: call.data == "send_email")
+@tracked
 def send_email_action(call):
     """Send the email using the stored subject and body."""
     try:
         user_id = call.message.chat.id
-        user_data = ast.literal_eval(r.get(user_id).decode("utf-8"))
-        logger.info(f"User id in send email: {user_id}")
-        logger.info(f"UserId data type in send email: {type(user_id)}")
-        logger.info(f"User data in Send Email: {user_data}")
+        user_data = load_session(user_id)
+        logger.info("Sending report email for chat %s: %s",
+                    HashedChat(user_id), SessionSummary(user_data))
+        logsafe.dump(logger, "User data in Send Email", user_data)
 
+        if sessions.is_compacted(user_data):
+            bot.send_message(call.message.chat.id, "This report has been archived. Use /history to see it again, or restart to run a new screening.")
+            return
 
         subject = user_data['email_subject']
         body = user_data['email_body']
 
-        for to_email in TO_EMAIL:
-            send_email(subject, body, to_email)
+        # SMTP can be slow; with little of the update left, send from the
+        # background pool rather than risk the worker timeout mid-send.
+        if deadlines.nearly_spent("email.send_all"):
+            background.submit(email_report, user_id, subject, body)
+            sent_text = "Your email is on its way."
+        else:
+            email_report(user_id, subject, body)
+            sent_text = "Email sent successfully!"
 
-        bot.send_message(call.message.chat.id, "Email sent successfully!")
+        user_data['emailed_at'] = int(time.time())
+        save_session(user_id, user_data)
+
+        bot.send_message(call.message.chat.id, sent_text)
         
         markup = types.InlineKeyboardMarkup()
         restart_button = types.InlineKeyboardButton("Restart", callback_data="restart")
@@ -998,11 +1009,19 @@ def send_email_action(call):
 
         bot.send_message(call.message.chat.id, "Would you like to restart?", reply_markup=markup)
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error sending email: {e}")
         bot.send_message(call.message.chat.id, "An error occurred while sending the email. Please try again later.")
 
 
+def email_report(chat_id, subject, body):
+    # send_email_new: MarkdownMail takes no timeout, smtplib takes the budget's.
+    with span("email.send_all", chat_id):
+        for to_email in clients.to_emails():
+            send_email_new(subject, body, to_email)
+
 def age_more_than_range(message):
     """Handler for children over 5 years old."""
     try:
@@ -1017,45 +1036,60 @@ def age_more_than_range(message):
 
         bot.send_message(message.chat.id, "You can restart the process.", reply_markup=markup)
 
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error handling age more than 60: {e}")
 
 
 @bot.callback_query_handler(func=lambda call: call.data == "restart")
+@tracked
 def handle_restart_callback(call):
     """Callback handler for the restart button."""
     try:
         start(call.message)
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error handling restart callback: {e}")
 
 
+@tracked
 def get_child_age(message):
     """Handler to get and store the child's age."""
     try:
-        age = int(get_age_from_gpt(message.text))
-        user_data = ast.literal_eval(r.get(message.chat.id).decode("utf-8"))
+        age = int(get_age_from_gpt(message.text, chat_id=message.chat.id))
+        user_data = load_session(message.chat.id)
         user_data["age"] = age
         
-        r.set(message.chat.id, str(user_data))
+        save_session(message.chat.id, user_data)
         # bot.send_message(message.chat.id, f"Child's name and age saved: {user_data}", parse_mode="Markdown")
 
         # Single source of truth for band boundaries; raises above 5 years rather
         # than clamping an out-of-scope child into the top band.
         age_group = screening_logic.band_for_age(age).key
 
-        user_data = ast.literal_eval(r.get(message.chat.id).decode("utf-8"))
+        user_data = load_session(message.chat.id)
         user_data["age_group"] = age_group
-        r.set(message.chat.id, str(user_data))
+        save_session(message.chat.id, user_data)
 
         checklist(message, checklist_options[age_group])
     except screening_logic.OutOfScope:
         age_more_than_range(message)
+    except MODEL_UNAVAILABLE as e:
+        reply_unavailable(message.chat.id, e)
+        bot.register_next_step_handler(message, get_child_age)
     except (ValueError, TypeError):
         # get_age_from_gpt returns None when it cannot parse the input, which
         # made int(None) raise TypeError and leave the user with no reply.
         msg = bot.send_message(message.chat.id, "Invalid age. Please enter a valid age.")
         bot.register_next_step_handler(msg, get_child_age)
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error reading the child's age: {e}")
+        msg = bot.send_message(message.chat.id, "An error occurred. Please enter the age again.")
+        bot.register_next_step_handler(msg, get_child_age)
 
 
 @app.route(f"/{WEBHOOK_SECRET}", methods=["POST"])
@@ -1069,5 +1103,15 @@ def webhook():
         logger.error(f"Error processing webhook: {e}")
         return "error", 500
 
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus scrape target. Hidden unless METRICS_SECRET is set and sent as
+    a bearer token, so the route does not advertise itself to scanners."""
+    supplied = request.headers.get("Authorization", "")
+    if not METRICS_SECRET or not hmac.compare_digest(supplied, f"Bearer {METRICS_SECRET}"):
+        return "not found", 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     app.run()
\ No newline at end of file
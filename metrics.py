@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""Process-wide counters and histograms, exported in Prometheus text format.
+
+The bot runs as a single gunicorn worker, so an in-process registry is the
+whole picture for a dyno; scraping /metrics replaces grepping logs for load and
+saturation. Counters are always on - an increment is a dict update under a
+lock - while the per-stage histogram in `instrumentation` only fills when
+TIMING_ENABLED is set.
+
+No prometheus_client dependency: the exposition format is a few lines of text
+and the bot needs nothing else from the library.
+"""
+
+import threading
+
+from instrumentation import Histogram, STAGE_SECONDS
+
+
+class Counter(object):
+    """Monotonic counter keyed by a label set. Thread-safe."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(Counter):
+    """A value that goes up and down, keyed by a label set. Thread-safe."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+UPDATES = register(Counter(
+    "milestones_updates_total", "Telegram updates processed, by handler."))
+MODEL_CALLS = register(Counter(
+    "milestones_model_calls_total", "Model calls, by route, tier and outcome."))
+MODEL_SECONDS = register(Histogram(
+    "milestones_model_seconds", "Model call latency, by route and tier."))
+MODEL_FALLBACKS = register(Counter(
+    "milestones_model_fallbacks_total", "Times a route switched to its fallback tier, by route."))
+MODEL_TOKENS = register(Counter(
+    "milestones_model_tokens_total", "Model tokens, by route, tier, model and direction."))
+MODEL_COST = register(Counter(
+    "milestones_model_cost_usd_total", "Estimated model spend from MODEL_PRICES, by route, tier and model."))
+MODEL_HEDGES = register(Counter(
+    "milestones_model_hedges_total", "Hedged model requests, by route and outcome (sent/won/lost/over_budget)."))
+MODEL_REQUEST_SECONDS = register(Histogram(
+    "milestones_model_request_seconds", "Latency of hedged routes as the caller saw it, hedges included."))
+REDIS_OPS = register(Counter(
+    "milestones_redis_ops_total", "Redis round trips, by operation."))
+CACHE_LOOKUPS = register(Counter(
+    "milestones_cache_lookups_total", "Cache lookups, by cache and result (hit/miss)."))
+SMTP_SENDS = register(Counter(
+    "milestones_smtp_sends_total", "Emails handed to SMTP, by outcome."))
+TELEGRAM_SENDS = register(Counter(
+    "milestones_telegram_sends_total", "Paced Telegram calls, by priority and outcome."))
+TELEGRAM_THROTTLED = register(Counter(
+    "milestones_telegram_throttled_total", "Telegram 429 responses retried, by priority."))
+MODEL_BREAKER = register(Gauge(
+    "milestones_model_breaker_state", "Model circuit breaker: 0 closed, 1 half-open, 2 open."))
+MODEL_BREAKER_TRANSITIONS = register(Counter(
+    "milestones_model_breaker_transitions_total", "Model circuit breaker state changes, by new state."))
+MODEL_BREAKER_REJECTED = register(Counter(
+    "milestones_model_breaker_rejected_total", "Model calls failed fast while the breaker was open."))
+MODEL_POOL = register(Gauge(
+    "milestones_model_pool_calls", "Model calls in the pool, by state (running/queued)."))
+MODEL_POOL_REJECTED = register(Counter(
+    "milestones_model_pool_rejected_total", "Model calls refused because the pool queue was full."))
+MODEL_QUEUE_SECONDS = register(Histogram(
+    "milestones_model_queue_seconds", "Time model calls waited for a pool thread."))
+DEADLINES = register(Counter(
+    "milestones_deadlines_total", "Update budget events, by step and outcome (exceeded/degraded)."))
+SPECULATIONS = register(Counter(
+    "milestones_speculations_total", "Speculative reports, by outcome (started/used/stale/discarded/...)."))
+register(STAGE_SECONDS)
+
+
+# --------------------------------------------------------------------------
+# Exposition
+# --------------------------------------------------------------------------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, _escape(v)) for k, v in pairs)
+
+
+def _fmt_bound(bound):
+    return "%g" % bound
+
+
+def _fmt_value(value):
+    return "%d" % value if isinstance(value, int) else repr(float(value))
+
+
+def render(registry=None):
+    """The registry as Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in (REGISTRY if registry is None else registry):
+        if isinstance(metric, Histogram):
+            lines.append("# HELP %s %s" % (metric.name, metric.help_text))
+            lines.append("# TYPE %s histogram" % metric.name)
+            for key, (counts, total, count) in sorted(metric.snapshot().items()):
+                for bound, n in zip(metric.buckets, counts):
+                    lines.append("%s_bucket%s %d" % (
+                        metric.name, _labels(key + (("le", _fmt_bound(bound)),)), n))
+                lines.append("%s_bucket%s %d" % (
+                    metric.name, _labels(key + (("le", "+Inf"),)), count))
+                lines.append("%s_sum%s %.6f" % (metric.name, _labels(key), total))
+                lines.append("%s_count%s %d" % (metric.name, _labels(key), count))
+        else:
+            lines.append("# HELP %s %s" % (metric.name, metric.help_text))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            for key, value in sorted(metric.snapshot().items()):
+                lines.append("%s%s %s" % (metric.name, _labels(key), _fmt_value(value)))
+    return "\n".join(lines) + "\n"
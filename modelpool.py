@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""A bounded pool for model calls, with queue positions and backpressure.
+
+Handlers called the model directly from whatever thread TeleBot gave them, so
+nothing capped how many model calls were in flight: a burst of submissions
+became a burst of concurrent requests against the OpenAI rate limit, each
+holding a thread and a response buffer until it finished or timed out.
+
+Every model call now runs on a ModelPool of MODEL_CONCURRENCY threads. Calls
+beyond that wait in FIFO order; a caller that has to wait is told its position
+(the bot turns that into a "you're in the queue" message), and once
+MODEL_MAX_QUEUE calls are already waiting, `run()` refuses with Saturated
+instead of queueing work that would only time out. Inside an update the wait
+is bounded by its deadline: a call still queued when the update has no more
+than deadlines.RESERVE left is cancelled, and the caller gets
+DeadlineExceeded in time to fall back to the local report.
+
+AsyncModelPool is the same pool for the asyncio runtime (aio.py): the calls
+are coroutines, and a semaphore of MODEL_CONCURRENCY slots stands in for the
+threads. Limits, positions, Saturated and the gauges are shared.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import deadlines
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MODEL_CONCURRENCY = int(os.environ.get("MODEL_CONCURRENCY", 4))
+MODEL_MAX_QUEUE = int(os.environ.get("MODEL_MAX_QUEUE", 20))
+
+
+class Saturated(Exception):
+    """The pool's queue is full; the caller should ask the user to retry."""
+
+
+class ModelPool(object):
+
+    def __init__(self, concurrency=MODEL_CONCURRENCY, max_queue=MODEL_MAX_QUEUE):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="model")
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+
+    def depth(self):
+        """(running, queued) right now."""
+        with self._lock:
+            return self._running, self._queued
+
+    def _publish(self):
+        metrics.MODEL_POOL.set(self._running, state="running")
+        metrics.MODEL_POOL.set(self._queued, state="queued")
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue `fn` and return (future, position); position 0 means it starts now.
+
+        Raises Saturated, without queueing, when max_queue calls are waiting.
+        """
+        with self._lock:
+            if self._running + self._queued < self.concurrency:
+                position = 0
+            elif self._queued >= self.max_queue:
+                metrics.MODEL_POOL_REJECTED.inc()
+                raise Saturated("%d model calls already queued" % self._queued)
+            else:
+                position = self._queued + 1
+            self._queued += 1
+            self._publish()
+        # The call runs in the submitter's context, so its update deadline
+        # (deadlines.py) still bounds it on the pool thread.
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._call, time.perf_counter(), fn, args, kwargs), position
+
+    def _call(self, queued_at, fn, args, kwargs):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._publish()
+        metrics.MODEL_QUEUE_SECONDS.observe(time.perf_counter() - queued_at)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._publish()
+
+    def run(self, fn, *args, on_queued=None, **kwargs):
+        """Call `fn` on the pool and wait for its result.
+
+        `on_queued(position)` runs in the caller's thread when the call has to
+        wait behind others, before the wait begins.
+        """
+        future, position = self.submit(fn, *args, **kwargs)
+        if position and on_queued is not None:
+            try:
+                on_queued(position)
+            except Exception as e:  # noqa: BLE001 - a missed notice must not lose the call
+                logger.error("Error announcing queue position: %s", e)
+        return self.wait(future)
+
+    def wait(self, future, step="model.queue"):
+        """A submitted call's result, waiting no longer than the update's budget.
+
+        Past it, the call is cancelled if it has not started (one that has is
+        bounded by its own timeout) and DeadlineExceeded is raised.
+        """
+        try:
+            return future.result(deadlines.timeout(None, step, deadlines.RESERVE))
+        except TimeoutError:
+            metrics.DEADLINES.inc(step=step, outcome="exceeded")
+            self._cancel(future)
+            raise deadlines.DeadlineExceeded(step)
+        except deadlines.DeadlineExceeded:
+            # Raised before waiting, or by the call itself once it has run.
+            self._cancel(future)
+            raise
+
+    def _cancel(self, future):
+        if future.cancel():
+            with self._lock:
+                self._queued -= 1
+                self._publish()
+
+
+class AsyncModelPool(object):
+
+    def __init__(self, concurrency=MODEL_CONCURRENCY, max_queue=MODEL_MAX_QUEUE):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._slots = asyncio.Semaphore(concurrency)
+        self._running = 0
+        self._queued = 0
+
+    def depth(self):
+        """(running, queued) right now."""
+        return self._running, self._queued
+
+    def _publish(self):
+        metrics.MODEL_POOL.set(self._running, state="running")
+        metrics.MODEL_POOL.set(self._queued, state="queued")
+
+    async def run(self, fn, *args, on_queued=None, step="model.queue", **kwargs):
+        """Await `fn(*args, **kwargs)` once a slot is free, as ModelPool.run.
+
+        Raises Saturated, without queueing, when max_queue calls are waiting;
+        `on_queued(position)` is awaited when the call has to wait. The wait
+        for a slot is bounded by the update's budget.
+        """
+        if self._running + self._queued < self.concurrency:
+            position = 0
+        elif self._queued >= self.max_queue:
+            metrics.MODEL_POOL_REJECTED.inc()
+            raise Saturated("%d model calls already queued" % self._queued)
+        else:
+            position = self._queued + 1
+        self._queued += 1
+        self._publish()
+        queued_at = time.perf_counter()
+        try:
+            if position and on_queued is not None:
+                try:
+                    await on_queued(position)
+                except Exception as e:  # noqa: BLE001 - a missed notice must not lose the call
+                    logger.error("Error announcing queue position: %s", e)
+            await asyncio.wait_for(self._slots.acquire(), deadlines.timeout(None, step, deadlines.RESERVE))
+        except asyncio.TimeoutError:
+            metrics.DEADLINES.inc(step=step, outcome="exceeded")
+            raise deadlines.DeadlineExceeded(step)
+        finally:
+            self._queued -= 1
+            self._publish()
+        self._running += 1
+        self._publish()
+        metrics.MODEL_QUEUE_SECONDS.observe(time.perf_counter() - queued_at)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            self._running -= 1
+            self._slots.release()
+            self._publish()
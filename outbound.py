@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""Paced outbound Telegram calls: token buckets, retry_after and priorities.
+
+Handlers used to call bot.send_message directly, with no notion of Telegram's
+limits (roughly one message per second per chat, bursts tolerated, and about
+thirty per second per bot). A busy clinic or a few reports landing together
+would start drawing 429s, which surfaced only as logged exceptions and a
+missing message.
+
+Every send and edit now goes through one Outbound queue:
+
+- a global token bucket and one per chat decide when a call may go out;
+- a 429 holds that chat for the `retry_after` Telegram asks for and puts the
+  call back at the head of its chat's line, up to MAX_ATTEMPTS;
+- each chat's calls go out in submission order, so a report's chunks, and
+  the keyboard sent after them, arrive in the order they were sent;
+- between chats, ready work is taken by priority - INTERACTIVE (checklist
+  toggles, callback answers) before NORMAL replies before BULK report chunks -
+  so one chat's long report does not hold up another chat's button press;
+- a chat has at most one call in flight, so per-chat order holds across the
+  small pool of sender threads;
+- every SWEEP_EVERY seconds the buckets of chats with nothing queued, in
+  flight or held, and whose bucket has refilled, are dropped: a new bucket
+  would be the same, and otherwise every chat ever seen keeps one.
+
+Callers are unchanged: PacedBot wraps the bot, and its send/edit methods block
+until the queued call has run and return its result. `submit()` returns the
+Future instead, for fire-then-wait batches like a report's chunks. Inside an
+update the wait is bounded by its deadline (deadlines.py): past it the caller
+gets DeadlineExceeded, and the call stays queued and is still delivered.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+import deadlines
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, NORMAL, BULK = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BULK: "bulk"}
+
+GLOBAL_RATE = float(os.environ.get("TELEGRAM_GLOBAL_RATE", 25))
+CHAT_RATE = float(os.environ.get("TELEGRAM_CHAT_RATE", 1))
+CHAT_BURST = int(os.environ.get("TELEGRAM_CHAT_BURST", 4))
+SENDERS = int(os.environ.get("TELEGRAM_SENDERS", 4))
+MAX_ATTEMPTS = 5
+SWEEP_EVERY = 60.0
+
+# Bot methods that hit Telegram's send limits, and their default priority.
+PACED_METHODS = {
+    "send_message": NORMAL,
+    "send_document": NORMAL,
+    "edit_message_text": INTERACTIVE,
+    "edit_message_reply_markup": INTERACTIVE,
+    "answer_callback_query": INTERACTIVE,
+}
+
+
+class TokenBucket(object):
+    """`rate` tokens per second, holding at most `burst`. Not thread-safe."""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = now
+
+    def _refill(self, now):
+        if now > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def wait(self, now):
+        """Seconds until a token is available (0 if one is now)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+def retry_after(exc):
+    """The retry_after of a Telegram 429, or None for any other error."""
+    if getattr(exc, "error_code", None) != 429:
+        return None
+    params = (getattr(exc, "result_json", None) or {}).get("parameters") or {}
+    return float(params.get("retry_after", 1))
+
+
+class _Job(object):
+    __slots__ = ("priority", "seq", "chat_id", "fn", "args", "kwargs", "future", "attempts")
+
+    def __init__(self, priority, seq, chat_id, fn, args, kwargs):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.attempts = 0
+
+
+class Outbound(object):
+    """The queue. Sender threads start on the first submit."""
+
+    def __init__(self, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, chat_burst=CHAT_BURST,
+                 senders=SENDERS, clock=time.monotonic):
+        self.clock = clock
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.senders = senders
+        self._global = TokenBucket(global_rate, max(1, int(global_rate)), clock())
+        self._chats = {}
+        self._held = {}
+        self._busy = set()
+        self._pending = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._swept = clock()
+
+    def submit(self, chat_id, fn, args=(), kwargs=None, priority=NORMAL):
+        job = _Job(priority, next(self._seq), chat_id, fn, args, kwargs or {})
+        with self._cond:
+            self._pending.append(job)
+            if not self._threads:
+                self._start()
+            self._cond.notify()
+        return job.future
+
+    def depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _start(self):
+        for i in range(self.senders):
+            t = threading.Thread(target=self._run, name="outbound-%d" % i, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def _sweep(self, now, queued):
+        """Drop the buckets of idle chats. Call under the lock."""
+        if now - self._swept < SWEEP_EVERY:
+            return
+        self._swept = now
+        for chat_id, bucket in list(self._chats.items()):
+            if (chat_id not in queued and chat_id not in self._busy and chat_id not in self._held
+                    and bucket.full(now)):
+                del self._chats[chat_id]
+
+    def next_job(self, now):
+        """Pick the job to run now, or return how long to wait. Call under the lock.
+
+        Each chat offers only its oldest job, and only if nothing of that
+        chat's is in flight, held or rate-limited; priority picks between chats.
+        """
+        heads = {}
+        for job in self._pending:
+            head = heads.get(job.chat_id)
+            if head is None or job.seq < head.seq:
+                heads[job.chat_id] = job
+        self._sweep(now, heads)
+        best, wait = None, None
+        for chat_id, job in heads.items():
+            if chat_id in self._busy:
+                continue
+            delay = max(self._held.get(chat_id, 0) - now, self._bucket(chat_id, now).wait(now))
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+            elif best is None or (job.priority, job.seq) < (best.priority, best.seq):
+                best = job
+        if best is not None:
+            delay = self._global.wait(now)
+            if delay > 0:
+                return None, delay
+            self._global.take(now)
+            self._bucket(best.chat_id, now).take(now)
+            self._pending.remove(best)
+            self._busy.add(best.chat_id)
+            self._held.pop(best.chat_id, None)
+        return best, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job, wait = self.next_job(self.clock())
+                while job is None:
+                    self._cond.wait(wait)
+                    job, wait = self.next_job(self.clock())
+            self._execute(job)
+
+    def _execute(self, job):
+        job.attempts += 1
+        outcome = "ok"
+        try:
+            result = job.fn(*job.args, **job.kwargs)
+        except Exception as exc:  # noqa: BLE001 - handed to the caller via the future
+            delay = retry_after(exc)
+            if delay is not None and job.attempts < MAX_ATTEMPTS:
+                outcome = "throttled"
+                metrics.TELEGRAM_THROTTLED.inc(priority=PRIORITY_NAMES[job.priority])
+                logger.warning("Telegram 429, retrying in %.1fs (attempt %d)", delay, job.attempts)
+                with self._cond:
+                    self._held[job.chat_id] = self.clock() + delay
+                    self._pending.append(job)
+                    self._busy.discard(job.chat_id)
+                    self._cond.notify_all()
+                return
+            outcome = "error"
+            job.future.set_exception(exc)
+        else:
+            job.future.set_result(result)
+        finally:
+            metrics.TELEGRAM_SENDS.inc(priority=PRIORITY_NAMES[job.priority], outcome=outcome)
+        with self._cond:
+            self._busy.discard(job.chat_id)
+            self._cond.notify_all()
+
+
+def _chat_of(args, kwargs):
+    return kwargs.get("chat_id", args[0] if args else None)
+
+
+def wait(future, step, reserve=0.0):
+    """The queued call's result, waiting no longer than the update's budget
+    (less `reserve`, for what the caller still has to do afterwards)."""
+    try:
+        return future.result(deadlines.timeout(None, step, reserve))
+    except TimeoutError:
+        raise deadlines.DeadlineExceeded(step)
+
+
+async def await_queued(future, step, reserve=0.0):
+    """`wait` for the asyncio runtime; the queued call is never cancelled."""
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), deadlines.timeout(None, step, reserve))
+    except asyncio.TimeoutError:
+        raise deadlines.DeadlineExceeded(step)
+
+
+class PacedBot(object):
+    """The bot, with PACED_METHODS routed through an Outbound queue.
+
+    Everything else - handler decorators, register_next_step_handler,
+    process_new_updates - passes straight through.
+    """
+
+    def __init__(self, bot, queue):
+        self._bot = bot
+        self._queue = queue
+
+    def submit(self, method, *args, priority=BULK, **kwargs):
+        """Queue a call and return its Future without waiting."""
+        fn = getattr(self._bot, method)
+        return self._queue.submit(_chat_of(args, kwargs), fn, args, kwargs, priority)
+
+    def __getattr__(self, name):
+        attr = getattr(self._bot, name)
+        default = PACED_METHODS.get(name)
+        if default is None:
+            return attr
+
+        def paced(*args, priority=default, **kwargs):
+            return wait(self._queue.submit(_chat_of(args, kwargs), attr, args, kwargs, priority),
+                        "telegram." + name)
+        return paced
+
+
+class AsyncPacedBot(PacedBot):
+    """PacedBot for AsyncTeleBot: the same queue, awaited from the event loop.
+
+    A sender thread runs each paced coroutine on `loop` and waits for it, so
+    buckets, priorities and retry_after behave exactly as for the threaded bot;
+    the handler awaits the queued call instead of blocking a thread on it.
+    """
+
+    def __init__(self, bot, queue, loop=None):
+        PacedBot.__init__(self, bot, queue)
+        self._loop = loop
+
+    def _on_loop(self, fn):
+        loop = self._loop or asyncio.get_running_loop()
+
+        def run(*args, **kwargs):
+            return asyncio.run_coroutine_threadsafe(fn(*args, **kwargs), loop).result()
+        return loop, run
+
+    def submit(self, method, *args, priority=BULK, **kwargs):
+        loop, run = self._on_loop(getattr(self._bot, method))
+        future = self._queue.submit(_chat_of(args, kwargs), run, args, kwargs, priority)
+        return asyncio.wrap_future(future, loop=loop)
+
+    def __getattr__(self, name):
+        attr = getattr(self._bot, name)
+        default = PACED_METHODS.get(name)
+        if default is None:
+            return attr
+
+        async def paced(*args, priority=default, **kwargs):
+            loop, run = self._on_loop(attr)
+            future = self._queue.submit(_chat_of(args, kwargs), run, args, kwargs, priority)
+            return await await_queued(asyncio.wrap_future(future, loop=loop), "telegram." + name)
+        return paced
@@ -14,8 +14,8 @@ import sys
 import openai
 
 import main
-import milestone_domains as md
 import screening_logic as sl
+from catalog import CATALOG, DOMAIN_TABLE, checklist_options
 
 FAILURES = []
 
@@ -39,18 +39,20 @@ check("set/get", main.r.get("prod_check").decode(), "ok")
 main.r.delete("prod_check")
 
 print("screening arithmetic")
-opts = main.checklist_options
-check("domains mapped", len(md.MILESTONE_DOMAINS), 77)
+opts = checklist_options
+check("catalog milestones", len(CATALOG.milestones), 77)
+domains = DOMAIN_TABLE
+check("domain table bands", len(domains), 9)
 
 res = sl.analyze(14, {18: [False] * 8, 12: [False] * 7, 9: [False] * 7,
-                      6: [True] * 7, 3: [True] * 7}, opts, md.MILESTONE_DOMAINS)
+                      6: [True] * 7, 3: [True] * 7}, opts, domains)
 check("14mo dev band", res.dev_band_label, "4 to 6 months")
 check("14mo delay", res.delay_text, "57.14% to 71.43%")
 
-res = sl.analyze(4, {6: [False] * 7, 3: [True] * 7}, opts, md.MILESTONE_DOMAINS)
+res = sl.analyze(4, {6: [False] * 7, 3: [True] * 7}, opts, domains)
 check("4mo delay", res.delay_text, "at least 25.00%")
 
-res = sl.analyze(24, {24: [True] * 6}, opts, md.MILESTONE_DOMAINS)
+res = sl.analyze(24, {24: [True] * 6}, opts, domains)
 check("24mo all met", res.delay_text is None, True)
 
 try:
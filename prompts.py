@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""Model instructions and inputs, shared by the threaded and asyncio runtimes.
+
+The prompt text used to be assembled inline in each main.py model function, on
+every call. It lives here so both runtimes send byte-identical prompts, and so
+the large report instructions are assembled once rather than per report.
+"""
+
+import hashlib
+import json
+
+from catalog import CATALOG, checklist_options, suggestions
+from screening_logic import BAND_BY_KEY
+
+AGE_GROUPS = [3, 6, 9, 12, 18, 24, 36, 48, 60]
+
+AGE_INSTRUCTIONS = (
+    "You have to strictly respond with a number referring to the age in months."
+    "Do not add any other text to the response."
+    "If the unit is not strictly mentioned, it is referring to years and convert it to months."
+    "If it is not possible to extract the age, return 'None'."
+)
+
+WORD_AGE_INSTRUCTIONS = (
+    "You have to strictly respond with age."
+    "Do not add any other text to the response."
+    "You will receive an age in months; you have to reply in this format: years, months."
+    "Ignore the years part if the input is less than 12."
+    "For example, 15: 1 year, 3 months."
+)
+
+
+def dev_age_instructions(age_group):
+    age_group_idx = AGE_GROUPS.index(age_group)
+    prev_age_group = AGE_GROUPS[age_group_idx - 1] if age_group_idx > 0 else None
+    prev_age_group_2 = AGE_GROUPS[age_group_idx - 2] if age_group_idx > 1 else None
+    return (
+        f"You have to strictly respond with a number referring to the age in months.\n"
+        f"Do not add any other text to the response.\n"
+        f"These are the expected milestones of a {prev_age_group_2} months old: {str(checklist_options.get(prev_age_group_2, 'N/A'))}\n"
+        f"These are the expected milestones of a {prev_age_group} months old: {str(checklist_options.get(prev_age_group, 'N/A'))}\n"
+        f"These are the expected milestones of a {age_group} months old: {str(checklist_options.get(age_group, 'N/A'))}\n"
+        f"You will receive a list of milestones and a corresponding boolean, showing whether the patient is successfully able to do them.\n"
+        f"If the milestones are much more advanced than the previous ones it's known the previous milestones are met. E.g. a child who is talking most likely babbled as a baby."
+        f"Return an estimated development age for the child in months.\n"
+        f"If the estimated age is less than 3 months, return 0."
+    )
+
+
+def recommendations_instructions(age_group, unmet_ids=None):
+    """Given the unmet milestone ids, only the band's suggestions aimed at them."""
+    if unmet_ids is not None:
+        options = [s.text for s in CATALOG.targeted_suggestions(age_group, unmet_ids)]
+    else:
+        options = suggestions[age_group]
+    return (
+        "You will receive a list of tuples, where the True/False value indicates whether the child has hit a milestone or not."
+        "Return a list of recommendations so that the user can improve."
+        "Do not return recommendations where the user has already hit a milestone."
+        f"Strictly stick to the following recommendations {str(options)}."
+        "The recommendations should be in Markdown format."
+    )
+
+
+# Fixed wording, shared with the locally rendered report (local_report.py).
+OVERVIEW = (
+    "The Communication Milestone Screening Protocol: Birth to 5 (CMSP: B-5) was given based on parent report and/or clinical observation.\n\n"
+    "The CMSP: B-5 is a criterion-based speech and language screening tool for children from birth to age 5. It incorporates parent reports, observations in natural environments, and session documentation, systematically comparing findings to the ASHA Developmental Milestones for speech and language. This tool is designed to identify early signs of potential communication delays and to inform decisions regarding the need for further comprehensive assessment."
+)
+
+_REPORT_INSTRUCTIONS = {}
+
+
+def prompt_bands(result):
+    """The bands a report's reference list needs: chronological, developmental, administered.
+
+    The FACTS block already carries every met and unmet milestone; the other
+    bands' lists only cost input tokens.
+    """
+    keys = set(result.administered_keys)
+    keys.add(result.chrono_band.key)
+    if result.dev_band is not None:
+        keys.add(result.dev_band.key)
+    return tuple(sorted(keys))
+
+
+def report_instructions(band_keys=None):
+    """The report system prompt, listing `band_keys` (default: every band).
+
+    Built once per band selection, then reused.
+    """
+    key = None if band_keys is None else tuple(sorted(band_keys))
+    if key not in _REPORT_INSTRUCTIONS:
+        _REPORT_INSTRUCTIONS[key] = (
+            "1. BASE INSTRUCTIONS:\n"
+            "You are the world's leading expert on ASHA communication development milestones screening.\n"
+            "You will receive:\n"
+            "- The child's chronological age.\n"
+            "- A list of communication milestones met by the child.\n"
+            "- Additional observations provided by the parent.\n"
+
+            "Using this information, you will generate a comprehensive report titled **`SPEECH AND LANGUAGE THERAPY REPORT`** following the specified format."
+
+            "**Important:**\n"
+            "- Do **not** include recommendations for milestones the child has already met.\n"
+            "- If the child meets all milestones for their current chronological age range, omit the Milestones Expected but Not Met section (and omit delay).\n"
+            "- Ensure all recommendations are relevant to the areas of need identified.\n"
+            "- The Milestones reported for a particular child may be from more than one age group. For example, a 12 month old child may have achieved the 6 month age group milestones and some of the 9 month age group milestones. So check for the milestone in the appropriate age group and calculate the delay and development age accordingly.\n"
+        
+            "\n\n2. ASHA Communication development milestones based on chronological age (FOR YOUR CONTEXT):\n"
+            + CATALOG.reference_text(key) + "\n" +
+
+            "3. DERIVED VALUES (DO NOT COMPUTE THESE):\n"
+            "The chronological age range, the developmental age range, the unmet milestone list and the\n"
+            "delay percentage are all computed for you by the screening software and supplied in the\n"
+            "VERIFIED FACTS block at the end of the user message. You must not derive, recalculate or\n"
+            "second-guess any of them. See section 5.\n\n"
+
+            "4. OUTPUT INSTRUCTIONS:\n"
+            "Use the provided information about the child to fill in the dynamic sections.\n\n"
+        
+            "**Follow these instructions for the output:**\n"
+            "- **Format:** Ensure the report strictlyfollows the exact Markdown format, including headings, Main Bullets and nested sub-bullet points. No additions or explanations whatsoever.\n"
+            "- **Developmental Age Range:** Use DEVELOPMENTAL_AGE_RANGE from the FACTS block verbatim.\n"
+            "- **Milestones Achieved:** Use the MILESTONES_MET list from the FACTS block.\n"
+            "- **Milestones Expected but Not Met:** Use the MILESTONES_NOT_MET list from the FACTS block, exactly and completely. Do **not** add milestones from any other age range.\n"
+            "- **Delay Percentage:** Use DELAY_PERCENTAGE from the FACTS block verbatim. Never print a percentage that does not appear there, and never show a formula.\n"
+            "- **Recommendations:** Provide recommendations solely based on the unmet milestones, unless MILESTONES_NOT_MET is NONE, in which case base them on enrichment and continued growth.\n"
+            "- Do not say that the child has a delay if the FACTS block reports no delay.\n\n"
+            "- Mention Additional observations if provided by parent in the Observations section by blending them in the bullet points.\n\n"
+            "- If child has met all the milestones for the current age range, then donot mention the 'child has a delay' line in the report instead write 'The child has met all the milestones for the current age range.'."
+            "\n\n- Always include the 'Recommendations for Parents' and 'Recommendations for the Clinical Team' sections, even when the child has met all milestones for the current age range. In that case, provide general age-appropriate enrichment activities for parents and routine monitoring guidance for the clinical team.\n\n"
+
+
+            "\n\n5. AUTHORITATIVE DERIVED FACTS\n"
+            "The user message ends with a \"VERIFIED FACTS\" block computed deterministically by the\n"
+            "screening software from the clinician's checklist responses. Those values are\n"
+            "authoritative and already correct.\n\n"
+            "- Use them verbatim. Do NOT recalculate the delay percentage, the developmental age\n"
+            "  range, the current chronological age range, or the unmet milestone list.\n"
+            "- Never contradict the FACTS block anywhere in the report, including in prose.\n"
+            "- The unmet milestone list is exhaustive. Never introduce a milestone from a higher age band.\n"
+            "- Reproduce each milestone in the \"Milestones Achieved\" and \"Milestones Expected but Not\n"
+            "  Met\" sections VERBATIM as written in the FACTS block, including its examples. These are\n"
+            "  the official ASHA milestone descriptors and the report must remain traceable to them, so\n"
+            "  do not paraphrase, abbreviate, merge, or drop any of them. Your own clinical wording\n"
+            "  belongs in the Observations and Recommendations sections.\n"
+            "- If ALL_MILESTONES_MET_FOR_CURRENT_RANGE is YES, the child has NO delay per the\n"
+            "  checklist: omit the \"Milestones Expected but Not Met\" section and print no percentage.\n"
+            "  This reflects the checklist only - see the SAFETY OVERRIDE in the FACTS block: a concern\n"
+            "  described in the parent or clinician narrative (not speaking, not responding to their\n"
+            "  name, lost skills, no eye contact, hearing concerns) must still be surfaced and followed\n"
+            "  up. An all-met checklist never overrides a reported red flag.\n"
+            "- Produce BOTH Recommendations sections in full in every report, including when there is\n"
+            "  no delay and nothing unmet.\n"
+            "- The FACTS block is internal plumbing. Never print its field names (DELAY_PERCENTAGE,\n"
+            "  ALL_MILESTONES_MET_FOR_CURRENT_RANGE, MILESTONES_NOT_MET and the like) or refer to \"the\n"
+            "  FACTS block\" in the report. This report is read by parents and clinicians.\n"
+            "- \"Omit a section\" means the heading itself must not appear at all. Do not print the\n"
+            "  heading followed by \"omitted\", \"none\", or an explanation.\n"
+            "- The Expressive / Receptive / Social Communication grouping is a template, not a quota.\n"
+            "  If a domain has no milestones in a given section, leave that domain out of that section\n"
+            "  entirely. Never write \"none reported\" or explain that a domain was empty.\n\n"
+
+            "## SPEECH AND LANGUAGE THERAPY REPORT\n"
+
+            "## Child's Age:\n"
+            "[CHRONOLOGICAL_AGE from the FACTS block, which is stated in MONTHS. Convert to years and months for readability if you wish, but never treat the number as years.]"
+
+            "## Overview:\n"
+            + OVERVIEW + "\n\n"
+
+            "## Observations:\n"
+            "Child is [Child’s Current Age] old at the time of screening, which falls within the [CURRENT_CHRONOLOGICAL_AGE_RANGE] ASHA age range. Based on the ASHA Developmental Milestones, the child’s speech and language abilities are functioning at the developmental range of [DEVELOPMENTAL_AGE_RANGE] according to their milestones. Clinical observations and parent reports indicate the following:\n\n"
+            "  - [Main Bullet Point 1]\n"
+            "  - [Main Bullet Point 2]\n"
+            "  - [Main Bullet Point 3]\n"
+
+            "These observations indicate a potential delay in expressive and receptive language development compared to the expected developmental milestones for a child of Child’s age.\n"
+
+            "## Milestones Achieved:\n"
+            "At the [Developmental Age Range] developmental level, Child has demonstrated the following abilities:\n\n"
+            "  - **Expressive Language:** [Main Bullet Point 1]\n"
+            "    - [Sub-Bullet Point 1]\n"
+            "    - [Sub-Bullet Point 2]\n"
+            "  - **Receptive Language:** [Main Bullet Point 2]\n"
+            "    - [Sub-Bullet Point 1]\n"
+            "  - **Social Communication:** [Main Bullet Point 3]\n"
+            "    - [Sub-Bullet Point 1]\n"
+            "    - [Sub-Bullet Point 2]\n"
+            "    - [Sub-Bullet Point 3]\n\n\n"
+
+            "## Milestones Expected but Not Met :\n"
+            "  - **Expressive Language:** [Main Bullet Point 1]\n"
+            "    - [Sub-Bullet Point 1]\n"
+            "    - [Sub-Bullet Point 2]\n"
+            "    - [Sub-Bullet Point 3]\n"
+            "  - **Receptive Language:** [Main Bullet Point 2]\n"
+            "    - [Sub-Bullet Point 1]\n"
+            "    - [Sub-Bullet Point 2]\n"
+            "    - [Sub-Bullet Point 3]\n"
+            "  - **Social Communication:** [Main Bullet Point 3]\n"
+            "    - [Sub-Bullet Point 1]\n"
+            "    - [Sub-Bullet Point 2]\n"  
+            "    - [Sub-Bullet Point 3]\n"
+
+            "The child presents with a delay of approximately [Minimum Percentage]% to [Maximum Percentage]% in communication development based on their chronological age of [Child’s Age] and their estimated developmental age range of [Estimated Developmental Age Range according to the milestones met].\n"
+
+            "## Recommendations for Parents:[Dynamic]\n"
+            "  - **Speech and Language Enrichment:** [Main Bullet Point 1]\n"
+            "    - [Sub Bullet]\n"
+            "    - [Sub Bullet]\n"
+            "    - [Sub Bullet]\n"
+            "    - [Sub Bullet]\n"
+            "    - [Sub Bullet]\n"
+            "  - **Books and Songs:** [Main Bullet Point 2]\n"
+            "    - [Sub Bullet]\n"  
+            "    - [Sub Bullet]\n"
+
+            "## Recommendations for the Clinical Team:[Dynamic]\n"
+            "  - **Further Evaluation:** [Main Bullet Point 1]\n"
+            "    - [Sub Bullet]\n"
+            "  - **Early Intervention Services:** [Main Bullet Point 2]\n"
+            "    - [Sub Bullet]\n"
+            "    - [Sub Bullet]\n"
+            "  - **Ongoing Monitoring:** [Main Bullet Point 3]\n"
+            "    - [Sub Bullet]\n"
+        )
+    return _REPORT_INSTRUCTIONS[key]
+
+
+# Structured report: the model writes only the prose; local_report renders the
+# headings, milestone lists, bands and delay from the ScreeningResult.
+_POINT_GROUP = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["heading", "points"],
+    "properties": {
+        "heading": {"type": "string"},
+        "points": {"type": "array", "items": {"type": "string"}},
+    },
+}
+
+PROSE_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["observations", "parent_recommendations", "clinical_recommendations"],
+    "properties": {
+        "observations": {"type": "array", "items": {"type": "string"}},
+        "parent_recommendations": {"type": "array", "items": _POINT_GROUP},
+        "clinical_recommendations": {"type": "array", "items": _POINT_GROUP},
+    },
+}
+
+PROSE_FORMAT = {"format": {"type": "json_schema", "name": "report_prose",
+                           "schema": PROSE_SCHEMA, "strict": True}}
+
+PROSE_INSTRUCTIONS = (
+    "You are the world's leading expert on ASHA communication development milestones screening.\n"
+    "You will receive the child's chronological age, the milestones they met, any observations\n"
+    "from the parent or clinician, a VERIFIED FACTS block computed by the screening software, and\n"
+    "parent activities aimed at the unmet milestones.\n"
+    "The FACTS are authoritative and already correct; never contradict them.\n\n"
+    "The report's headings, age ranges, milestone lists and delay percentage are produced by the\n"
+    "screening software. You write ONLY the prose, as JSON matching the schema:\n"
+    "- observations: 2 to 4 bullet points for the Observations section, in plain clinical English\n"
+    "  for parents and clinicians. Blend in the parent or clinician observations, if any.\n"
+    "- parent_recommendations: groups such as \"Speech and Language Enrichment\" (about five\n"
+    "  points) and \"Books and Songs\" (about two points). Draw on the parent activities.\n"
+    "- clinical_recommendations: groups such as \"Further Evaluation\", \"Early Intervention\n"
+    "  Services\" and \"Ongoing Monitoring\" (one or two points each).\n\n"
+    "Rules:\n"
+    "- Do not list or restate the milestones, the age ranges or the delay percentage, and never\n"
+    "  write any percentage. Those appear elsewhere in the report.\n"
+    "- Base recommendations on the unmet milestones. If MILESTONES_NOT_MET is NONE, base both\n"
+    "  recommendation lists on enrichment and continued growth, and do not claim a delay.\n"
+    "- Never name the FACTS fields (such as DELAY_PERCENTAGE or MILESTONES_NOT_MET) or refer to\n"
+    "  \"the FACTS block\".\n"
+    "- No Markdown headings, bold or bullets inside the strings; the software formats them.\n"
+    "- SAFETY OVERRIDE: if the narrative describes not speaking, not responding to their name,\n"
+    "  loss of previously held skills, no eye contact or a hearing concern, say so in the\n"
+    "  observations and recommend appropriate follow-up (such as audiological or developmental\n"
+    "  evaluation) in clinical_recommendations, whatever the checklist shows."
+)
+
+
+def report_input(milestones, age, observations, facts=None):
+    return (
+        f"Current age of the child: {age}, \n\nMilestones met by child: {milestones},"
+        f"\n\n Additional observations: {observations}"
+        + (facts or "")
+    )
+
+
+def parent_activities(band, unmet_ids, catalog=CATALOG):
+    """The PARENT_ACTIVITIES block: the band's suggestions aimed at the unmet
+    milestones (the whole band's when none are linked)."""
+    return "PARENT_ACTIVITIES:\n%s" % "\n".join(
+        "- %s" % s.text for s in catalog.targeted_suggestions(band, unmet_ids))
+
+
+def prose_input(milestones, age, observations, facts, result, catalog=CATALOG):
+    """The structured report's input: report_input() and the parent activities
+    for the result's band and unmet milestones."""
+    return "%s\n\n%s" % (report_input(milestones, age, observations, facts),
+                         parent_activities(result.chrono_band.key, catalog.ids(result.unmet), catalog))
+
+
+# Split report (see section_cache.py): the two Recommendations sections depend
+# only on the band and the unmet milestones, so they are written without the
+# child's details and shared; a small per-child call writes the observations.
+SECTIONS_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["parent_recommendations", "clinical_recommendations"],
+    "properties": {
+        "parent_recommendations": {"type": "array", "items": _POINT_GROUP},
+        "clinical_recommendations": {"type": "array", "items": _POINT_GROUP},
+    },
+}
+
+SECTIONS_FORMAT = {"format": {"type": "json_schema", "name": "report_sections",
+                              "schema": SECTIONS_SCHEMA, "strict": True}}
+
+SECTIONS_INSTRUCTIONS = (
+    "You are the world's leading expert on ASHA communication development milestones screening.\n"
+    "You will receive an ASHA age range, the milestones from that range a child has not met, and\n"
+    "parent activities aimed at them. You write the two Recommendations sections of the child's\n"
+    "screening report, as JSON matching the schema:\n"
+    "- parent_recommendations: groups such as \"Speech and Language Enrichment\" (about five\n"
+    "  points) and \"Books and Songs\" (about two points). Draw on the parent activities.\n"
+    "- clinical_recommendations: groups such as \"Further Evaluation\", \"Early Intervention\n"
+    "  Services\" and \"Ongoing Monitoring\" (one or two points each).\n\n"
+    "Rules:\n"
+    "- The same sections are given to every child with these unmet milestones: do not refer to a\n"
+    "  name, an age, observations or anything else about one child.\n"
+    "- Base recommendations on the unmet milestones. If MILESTONES_NOT_MET is NONE, base both\n"
+    "  recommendation lists on enrichment and continued growth, and do not claim a delay.\n"
+    "- Do not list or restate the milestones, and never write any percentage.\n"
+    "- Never name the input fields (such as MILESTONES_NOT_MET).\n"
+    "- No Markdown headings, bold or bullets inside the strings; the software formats them."
+)
+
+OBSERVATIONS_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["observations", "concerns"],
+    "properties": {
+        "observations": {"type": "array", "items": {"type": "string"}},
+        "concerns": {"type": "array", "items": {"type": "string"}},
+    },
+}
+
+OBSERVATIONS_FORMAT = {"format": {"type": "json_schema", "name": "report_observations",
+                                  "schema": OBSERVATIONS_SCHEMA, "strict": True}}
+
+OBSERVATIONS_INSTRUCTIONS = (
+    "You are the world's leading expert on ASHA communication development milestones screening.\n"
+    "You will receive the child's chronological age, the milestones they met, any observations\n"
+    "from the parent or clinician, and a VERIFIED FACTS block computed by the screening software.\n"
+    "The FACTS are authoritative and already correct; never contradict them.\n\n"
+    "The rest of the report, recommendations included, is produced elsewhere. You write ONLY, as\n"
+    "JSON matching the schema:\n"
+    "- observations: 2 to 4 bullet points for the Observations section, in plain clinical English\n"
+    "  for parents and clinicians. Blend in the parent or clinician observations, if any.\n"
+    "- concerns: follow-up for the clinical team prompted by the parent or clinician\n"
+    "  observations alone, one point each. Usually empty.\n\n"
+    "Rules:\n"
+    "- Do not list or restate the milestones, the age ranges or the delay percentage, and never\n"
+    "  write any percentage. Those appear elsewhere in the report.\n"
+    "- Never name the FACTS fields (such as DELAY_PERCENTAGE or MILESTONES_NOT_MET) or refer to\n"
+    "  \"the FACTS block\".\n"
+    "- No Markdown headings, bold or bullets inside the strings; the software formats them.\n"
+    "- SAFETY OVERRIDE: if the narrative describes not speaking, not responding to their name,\n"
+    "  loss of previously held skills, no eye contact or a hearing concern, say so in the\n"
+    "  observations and recommend appropriate follow-up (such as audiological or developmental\n"
+    "  evaluation) in concerns, whatever the checklist shows."
+)
+
+def catalog_digest(catalog=CATALOG):
+    """What sections_input() reads from the catalog: milestone text and each
+    band's suggestions with their links, as one string."""
+    return json.dumps([
+        [[m.id, m.band, m.text] for m in catalog.by_id.values()],
+        [[band, [[s.id, s.text, list(s.addresses)] for s in linked]]
+         for band, linked in catalog.band_suggestions.items()],
+    ], sort_keys=True)
+
+
+# Part of every cached section's key: editing the prompt, its schema or the
+# catalog text it is given retires the sections written from the old one.
+SECTIONS_VERSION = hashlib.sha1(
+    (SECTIONS_INSTRUCTIONS + json.dumps(SECTIONS_SCHEMA, sort_keys=True)
+     + catalog_digest()).encode("utf-8")
+).hexdigest()[:10]
+
+
+def sections_input(shape, catalog=CATALOG):
+    """Everything the shared sections depend on: the band and its unmet milestones
+    (a section_cache.Shape)."""
+    unmet = sorted((catalog.by_id[mid] for mid in shape.unmet), key=lambda m: (m.band, m.index))
+    return (
+        "AGE_RANGE: %s\n\nMILESTONES_NOT_MET:\n%s\n\n%s"
+        % (BAND_BY_KEY[shape.band].label,
+           "\n".join("- %s" % m.text.strip() for m in unmet) or "NONE",
+           parent_activities(shape.band, shape.unmet, catalog))
+    )
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Append-only archive of generated reports, per chat, gzip-compressed in Redis.
+
+A report used to exist only inside the session, which /restart overwrites and
+compaction slims, so a clinician who wanted last week's report back had to
+re-run the screening and pay for a new generation. Each generated report is
+now appended here when it is produced and can be listed and re-sent with
+/history.
+
+Layout, per chat:
+
+    reports:<chat_id>        sorted set: report id -> generation time
+    reports:<chat_id>:body   hash: report id -> gzip(JSON record)
+
+Report ids are the generation time in milliseconds, so they are unique per chat
+and sort chronologically. Records are never rewritten. Storage is bounded by
+`retain()`, which runs on every append: at most ARCHIVE_MAX_REPORTS per chat,
+none older than ARCHIVE_RETENTION_DAYS, and both keys expire when a chat has
+been silent for the retention period.
+"""
+
+import gzip
+import json
+import os
+import time
+from collections import namedtuple
+
+MAX_REPORTS = int(os.environ.get("ARCHIVE_MAX_REPORTS", 10))
+RETENTION_DAYS = int(os.environ.get("ARCHIVE_RETENTION_DAYS", 180))
+
+INDEX_KEY = "reports:%s"
+BODY_KEY = "reports:%s:body"
+
+ReportEntry = namedtuple("ReportEntry", ["report_id", "created", "subject"])
+
+
+def compress(record):
+    return gzip.compress(json.dumps(record, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decompress(blob):
+    return json.loads(gzip.decompress(blob).decode("utf-8"))
+
+
+class ReportArchive(object):
+
+    def __init__(self, redis, max_reports=MAX_REPORTS, retention_days=RETENTION_DAYS):
+        self.redis = redis
+        self.max_reports = max_reports
+        self.retention = retention_days * 24 * 3600
+
+    @staticmethod
+    def _record(report, subject, age, now):
+        report_id = int(now * 1000)
+        return report_id, {"id": report_id, "created": int(now), "subject": subject,
+                           "age": age, "report": report}
+
+    def _limit(self, limit):
+        return (limit or self.max_reports) - 1
+
+    @staticmethod
+    def _entries(blobs):
+        out = []
+        for blob in blobs:
+            if blob is not None:
+                record = decompress(blob)
+                out.append(ReportEntry(record["id"], record["created"], record.get("subject")))
+        return out
+
+    def append(self, chat_id, report, subject=None, age=None, now=None):
+        """Store a report and return its id."""
+        now = time.time() if now is None else now
+        report_id, record = self._record(report, subject, age, now)
+        pipe = self.redis.pipeline()
+        pipe.hset(BODY_KEY % chat_id, report_id, compress(record))
+        pipe.zadd(INDEX_KEY % chat_id, {report_id: now})
+        pipe.execute()
+        self.retain(chat_id, now)
+        return report_id
+
+    def retain(self, chat_id, now=None):
+        """Drop reports beyond the count and age limits; refresh key expiry."""
+        now = time.time() if now is None else now
+        index, bodies = INDEX_KEY % chat_id, BODY_KEY % chat_id
+        expired = self.redis.zrangebyscore(index, "-inf", now - self.retention)
+        surplus = self.redis.zrange(index, 0, -(self.max_reports + 1))
+        dropped = sorted(set(expired) | set(surplus))
+        pipe = self.redis.pipeline()
+        if dropped:
+            pipe.zrem(index, *dropped)
+            pipe.hdel(bodies, *dropped)
+        pipe.expire(index, self.retention)
+        pipe.expire(bodies, self.retention)
+        pipe.execute()
+        return len(dropped)
+
+    def entries(self, chat_id, limit=None):
+        """Newest first, without decompressing more than the subjects."""
+        ids = self.redis.zrevrange(INDEX_KEY % chat_id, 0, self._limit(limit))
+        if not ids:
+            return []
+        return self._entries(self.redis.hmget(BODY_KEY % chat_id, ids))
+
+    def get(self, chat_id, report_id):
+        blob = self.redis.hget(BODY_KEY % chat_id, report_id)
+        return decompress(blob) if blob is not None else None
+
+
+class AsyncReportArchive(ReportArchive):
+    """The same archive over redis.asyncio, for the asyncio runtime."""
+
+    async def append(self, chat_id, report, subject=None, age=None, now=None):
+        now = time.time() if now is None else now
+        report_id, record = self._record(report, subject, age, now)
+        pipe = self.redis.pipeline()
+        pipe.hset(BODY_KEY % chat_id, report_id, compress(record))
+        pipe.zadd(INDEX_KEY % chat_id, {report_id: now})
+        await pipe.execute()
+        await self.retain(chat_id, now)
+        return report_id
+
+    async def retain(self, chat_id, now=None):
+        now = time.time() if now is None else now
+        index, bodies = INDEX_KEY % chat_id, BODY_KEY % chat_id
+        expired = await self.redis.zrangebyscore(index, "-inf", now - self.retention)
+        surplus = await self.redis.zrange(index, 0, -(self.max_reports + 1))
+        dropped = sorted(set(expired) | set(surplus))
+        pipe = self.redis.pipeline()
+        if dropped:
+            pipe.zrem(index, *dropped)
+            pipe.hdel(bodies, *dropped)
+        pipe.expire(index, self.retention)
+        pipe.expire(bodies, self.retention)
+        await pipe.execute()
+        return len(dropped)
+
+    async def entries(self, chat_id, limit=None):
+        ids = await self.redis.zrevrange(INDEX_KEY % chat_id, 0, self._limit(limit))
+        if not ids:
+            return []
+        return self._entries(await self.redis.hmget(BODY_KEY % chat_id, ids))
+
+    async def get(self, chat_id, report_id):
+        blob = await self.redis.hget(BODY_KEY % chat_id, report_id)
+        return decompress(blob) if blob is not None else None
@@ -18,7 +18,7 @@ from collections import OrderedDict, namedtuple
 
 Band = namedtuple("Band", ["key", "lo", "hi", "label"])
 
-# Inclusive month bounds. `key` matches the keys of checklist_options.json.
+# Inclusive month bounds. `key` matches the band keys of milestones_catalog.json.
 BANDS = [
     Band(3, 0, 3, "Birth to 3 months"),
     Band(6, 4, 6, "4 to 6 months"),
@@ -72,7 +72,8 @@ class ScreeningResult(object):
 
     def __init__(self, age_months, chrono_band, dev_band, administered_keys,
                  presumed_keys, met, unmet, delay_state, delay_lo, delay_hi,
-                 disclosure_needed, inconsistent):
+                 disclosure_needed, inconsistent, met_masks=None, unmet_mask=0,
+                 templates=None):
         self.age_months = age_months
         self.chrono_band = chrono_band
         self.dev_band = dev_band
@@ -85,6 +86,11 @@ class ScreeningResult(object):
         self.delay_hi = delay_hi
         self.disclosure_needed = disclosure_needed
         self.inconsistent = inconsistent
+        # Bitmask views of met/unmet (bit i = milestone index i), in
+        # administered band order, for rendering from precompiled fragments.
+        self.met_masks = met_masks if met_masks is not None else OrderedDict()
+        self.unmet_mask = unmet_mask
+        self.templates = templates
 
     @property
     def all_met_for_age(self):
@@ -104,13 +110,40 @@ class ScreeningResult(object):
         return self.dev_band.label if self.dev_band else "Below Birth to 3 months"
 
 
+class DomainTable(dict):
+    """{band_key: (domain, ...)} - one domain per milestone index, dense."""
+
+
+_LENIENT_TABLES = {}
+
+
+def _domain_table(checklist_options, milestone_domains):
+    """The dense table analyze() indexes. A DomainTable is used as is;
+    a raw {(band, idx): domain} map (tests, ad-hoc callers) is densified once,
+    with unmapped milestones defaulting to Social Communication."""
+    if isinstance(milestone_domains, DomainTable):
+        return milestone_domains
+    key = (id(checklist_options), id(milestone_domains))
+    hit = _LENIENT_TABLES.get(key)
+    if hit is None or hit[0] is not checklist_options or hit[1] is not milestone_domains:
+        table = DomainTable(
+            (band_key, tuple(milestone_domains.get((band_key, idx), DEFAULT_DOMAIN)
+                             for idx in range(len(options))))
+            for band_key, options in checklist_options.items())
+        hit = _LENIENT_TABLES[key] = (checklist_options, milestone_domains, table)
+    return hit[2]
+
+
 def analyze(age_months, checklists, checklist_options, milestone_domains):
     """Compute the full screening result.
 
     checklists: {band_key: [bool, ...]} - a key exists only for a band that was
         actually shown to the clinician. That is the administered set.
+    milestone_domains: a DomainTable (catalog.DOMAIN_TABLE), or a raw
+        {(band_key, idx): domain} map.
     """
     chrono = band_for_age(age_months)
+    domain_table = _domain_table(checklist_options, milestone_domains)
 
     administered = sorted(int(k) for k in checklists.keys() if int(k) in BAND_BY_KEY)
     administered_set = set(administered)
@@ -142,20 +175,29 @@ def analyze(age_months, checklists, checklist_options, milestone_domains):
 
     def entries(band_key, want_met):
         flags = ticks(band_key)
+        domains = domain_table.get(band_key, ())
         out = []
+        mask = 0
         for idx, text in enumerate(checklist_options.get(band_key, [])):
             is_met = flags[idx] if idx < len(flags) else False
             if is_met == want_met:
-                domain = milestone_domains.get((band_key, idx), "Social Communication")
-                out.append((band_key, idx, text, domain))
-        return out
+                out.append((band_key, idx, text, domains[idx]))
+                mask |= 1 << idx
+        return out, mask
 
     met = []
+    met_masks = OrderedDict()
     for band_key in administered:
-        met.extend(entries(band_key, True))
+        band_met, mask = entries(band_key, True)
+        met.extend(band_met)
+        if mask:
+            met_masks[band_key] = mask
 
     # Unmet is the chronological band only - never any other band.
-    unmet = entries(chrono.key, False) if chrono.key in administered_set else []
+    if chrono.key in administered_set:
+        unmet, unmet_mask = entries(chrono.key, False)
+    else:
+        unmet, unmet_mask = [], 0
     all_met = len(unmet) == 0
 
     delay_state, delay_lo, delay_hi = _compute_delay(age_months, dev_band, all_met)
@@ -180,7 +222,8 @@ def analyze(age_months, checklists, checklist_options, milestone_domains):
         administered_keys=administered, presumed_keys=presumed,
         met=met, unmet=unmet, delay_state=delay_state, delay_lo=delay_lo,
         delay_hi=delay_hi, disclosure_needed=disclosure_needed,
-        inconsistent=inconsistent,
+        inconsistent=inconsistent, met_masks=met_masks, unmet_mask=unmet_mask,
+        templates=compile_templates(checklist_options, domain_table),
     )
 
 
@@ -213,6 +256,73 @@ def _compute_delay(age_months, dev_band, all_met):
 # --------------------------------------------------------------------------
 
 DOMAIN_ORDER = ["Expressive Language", "Receptive Language", "Social Communication"]
+DEFAULT_DOMAIN = "Social Communication"
+
+
+class FactsTemplates(object):
+    """Milestone fragments for the FACTS block, compiled once per data set.
+
+    Every report used to regroup its milestones by band and domain and rebuild
+    each line. The lines only depend on the checklist text and the domain map,
+    so they are formatted once here; a report selects them with the bitmasks
+    analyze() computes, and each distinct (band, mask) block is rendered once
+    and then served from a cache. Output is identical to _render_milestones.
+    """
+
+    def __init__(self, checklist_options, domain_table):
+        self._header = {}
+        self._lines = {}
+        for band_key, options in checklist_options.items():
+            band = BAND_BY_KEY.get(band_key)
+            if band is None:
+                continue
+            self._header[band_key] = "  [%s]" % band.label
+            by_domain = OrderedDict((d, []) for d in DOMAIN_ORDER)
+            domains = domain_table[band_key]
+            for idx, text in enumerate(options):
+                domain = domains[idx]
+                by_domain.setdefault(domain, []).append((1 << idx, "      - %s" % text))
+            self._lines[band_key] = [
+                ("    %s:" % domain, sum(bit for bit, _ in lines), lines)
+                for domain, lines in by_domain.items() if domain in DOMAIN_ORDER and lines
+            ]
+        self._cache = {}
+
+    def band_block(self, band_key, mask):
+        key = (band_key, mask)
+        block = self._cache.get(key)
+        if block is None:
+            out = [self._header[band_key]]
+            for domain_line, domain_mask, lines in self._lines[band_key]:
+                if not mask & domain_mask:
+                    continue
+                out.append(domain_line)
+                out.extend(line for bit, line in lines if mask & bit)
+            block = self._cache[key] = "\n".join(out)
+        return block
+
+    def render(self, masks):
+        """masks: [(band_key, mask)] in the order the bands should appear."""
+        return "\n".join(self.band_block(k, m) for k, m in masks if m)
+
+
+_TEMPLATES = {}
+
+
+def compile_templates(checklist_options, milestone_domains):
+    """FactsTemplates for this data set, built on first request and reused.
+
+    Keyed on object identity: the bot passes the same module-level dicts on
+    every call. Mutating those dicts in place after the first report would
+    serve stale fragments - they are treated as read-only.
+    """
+    domain_table = _domain_table(checklist_options, milestone_domains)
+    key = (id(checklist_options), id(domain_table))
+    hit = _TEMPLATES.get(key)
+    if hit is None or hit[0] is not checklist_options or hit[1] is not domain_table:
+        hit = _TEMPLATES[key] = (checklist_options, domain_table,
+                                 FactsTemplates(checklist_options, domain_table))
+    return hit[2]
 
 
 def _group_by_band_and_domain(entries):
@@ -236,11 +346,81 @@ def _render_milestones(entries, indent="  "):
     return "\n".join(lines)
 
 
+# Invariant paragraphs of the FACTS block, built once at import. Only the
+# %-templated ones take per-report values.
+_FACTS_HEAD = "\n===== VERIFIED FACTS (computed by the screening software - authoritative) ====="
+
+_SCOPE_TEMPLATE = (
+    "SCREENING_SCOPE: the following earlier age bands were NOT administered and are "
+    "PRESUMED MET: %s. The developmental age range and delay percentage above are "
+    "calculated on that basis. You MUST state this limitation once, plainly, in the "
+    "Observations section - for example: \"Milestones for the %s through %s ranges were "
+    "not administered during this screening and are presumed to have been met; the "
+    "developmental age range and percentage of delay are calculated on that basis.\" "
+    "Do not present the delay as a fully screened result."
+)
+
+_DELAY_NONE_LINE = (
+    "DELAY_PERCENTAGE: NONE - there is NO delay. Do not state, imply, or print any percentage."
+)
+
+_DELAY_AT_LEAST_TEMPLATE = (
+    "DELAY_PERCENTAGE: %s (pre-computed, use verbatim, do not recalculate). State this as a "
+    "minimum, not a range. Do not print an upper bound and never print 100%%. Write it as "
+    "\"a delay of at least %s\" - drop the word \"approximately\" from the template sentence, "
+    "because \"approximately at least\" does not read as clinical English."
+)
+
+_DELAY_RANGE_TEMPLATE = "DELAY_PERCENTAGE: %s (pre-computed, use verbatim, do not recalculate)"
+
+_INCONSISTENCY_LINE = (
+    "DATA_INCONSISTENCY: the child met every milestone for their current age range, but an "
+    "earlier age range that WAS administered is incomplete. Report no delay, and note in "
+    "Recommendations for the Clinical Team that the earlier-range responses should be "
+    "reviewed for accuracy."
+)
+
+_MET_HEADING = "\nMILESTONES_MET (verbatim from the screening tool, pre-grouped by domain):"
+
+_NOT_MET_NONE = (
+    "MILESTONES_NOT_MET: NONE. Omit the \"Milestones Expected but Not Met\" section "
+    "entirely. Because nothing is unmet, base BOTH Recommendations sections on ENRICHMENT "
+    "and continued growth rather than remediation, and still produce both sections in "
+    "full. Do not invent a delay percentage or claim a delay the checklist does not show."
+)
+
+_NOT_MET_TEMPLATE = (
+    "MILESTONES_NOT_MET (exactly these %d, and ONLY these - all from %s. Do not add "
+    "milestones from any other band):"
+)
+
+_FACTS_TAIL = (
+    "\nSAFETY OVERRIDE: these conclusions reflect the CHECKLIST ONLY. If the parent or clinician "
+    "narrative describes anything that contradicts them - not speaking, not responding to their "
+    "name, loss of previously held skills, no eye contact, or a hearing concern - you MUST "
+    "surface that contradiction in the Observations section and recommend appropriate follow-up "
+    "(such as audiological or developmental evaluation) under Recommendations for the Clinical "
+    "Team. A checklist result must never suppress a reported red flag."
+    "\n===== END VERIFIED FACTS ====="
+)
+
+
+def _render_met(result):
+    if result.templates is not None:
+        return result.templates.render(result.met_masks.items())
+    return _render_milestones(result.met)
+
+
+def _render_unmet(result):
+    if result.templates is not None:
+        return result.templates.render([(result.chrono_band.key, result.unmet_mask)])
+    return _render_milestones(result.unmet)
+
+
 def build_facts_block(result):
     """The VERIFIED FACTS block appended to the model's user message."""
     lines = [
-        "",
-        "===== VERIFIED FACTS (computed by the screening software - authoritative) =====",
+        _FACTS_HEAD,
         "CHRONOLOGICAL_AGE: %s months" % result.age_months,
         "CURRENT_CHRONOLOGICAL_AGE_RANGE: %s" % result.chrono_band.label,
         "DEVELOPMENTAL_AGE_RANGE: %s" % result.dev_band_label,
@@ -249,70 +429,27 @@ def build_facts_block(result):
 
     if result.disclosure_needed and result.presumed_keys:
         labels = [BAND_BY_KEY[k].label for k in result.presumed_keys]
-        lines.append(
-            "SCREENING_SCOPE: the following earlier age bands were NOT administered and are "
-            "PRESUMED MET: %s. The developmental age range and delay percentage above are "
-            "calculated on that basis. You MUST state this limitation once, plainly, in the "
-            "Observations section - for example: \"Milestones for the %s through %s ranges were "
-            "not administered during this screening and are presumed to have been met; the "
-            "developmental age range and percentage of delay are calculated on that basis.\" "
-            "Do not present the delay as a fully screened result."
-            % (", ".join(labels), labels[0], labels[-1])
-        )
+        lines.append(_SCOPE_TEMPLATE % (", ".join(labels), labels[0], labels[-1]))
 
     if result.delay_state == DELAY_NONE:
-        lines.append(
-            "DELAY_PERCENTAGE: NONE - there is NO delay. Do not state, imply, or print any percentage."
-        )
+        lines.append(_DELAY_NONE_LINE)
     elif result.delay_state == DELAY_AT_LEAST:
-        lines.append(
-            "DELAY_PERCENTAGE: %s (pre-computed, use verbatim, do not recalculate). State this as a "
-            "minimum, not a range. Do not print an upper bound and never print 100%%. Write it as "
-            "\"a delay of at least %s\" - drop the word \"approximately\" from the template sentence, "
-            "because \"approximately at least\" does not read as clinical English."
-            % (result.delay_text, _fmt(result.delay_lo))
-        )
+        lines.append(_DELAY_AT_LEAST_TEMPLATE % (result.delay_text, _fmt(result.delay_lo)))
     else:
-        lines.append(
-            "DELAY_PERCENTAGE: %s (pre-computed, use verbatim, do not recalculate)"
-            % result.delay_text
-        )
+        lines.append(_DELAY_RANGE_TEMPLATE % result.delay_text)
 
     if result.inconsistent:
-        lines.append(
-            "DATA_INCONSISTENCY: the child met every milestone for their current age range, but an "
-            "earlier age range that WAS administered is incomplete. Report no delay, and note in "
-            "Recommendations for the Clinical Team that the earlier-range responses should be "
-            "reviewed for accuracy."
-        )
+        lines.append(_INCONSISTENCY_LINE)
 
-    lines.append("")
-    lines.append("MILESTONES_MET (verbatim from the screening tool, pre-grouped by domain):")
-    lines.append(_render_milestones(result.met) if result.met else "  NONE")
+    lines.append(_MET_HEADING)
+    lines.append(_render_met(result) if result.met else "  NONE")
     lines.append("")
 
     if result.all_met_for_age:
-        lines.append(
-            "MILESTONES_NOT_MET: NONE. Omit the \"Milestones Expected but Not Met\" section "
-            "entirely. Because nothing is unmet, base BOTH Recommendations sections on ENRICHMENT "
-            "and continued growth rather than remediation, and still produce both sections in "
-            "full. Do not invent a delay percentage or claim a delay the checklist does not show."
-        )
+        lines.append(_NOT_MET_NONE)
     else:
-        lines.append(
-            "MILESTONES_NOT_MET (exactly these %d, and ONLY these - all from %s. Do not add "
-            "milestones from any other band):" % (len(result.unmet), result.chrono_band.label)
-        )
-        lines.append(_render_milestones(result.unmet))
+        lines.append(_NOT_MET_TEMPLATE % (len(result.unmet), result.chrono_band.label))
+        lines.append(_render_unmet(result))
 
-    lines.append("")
-    lines.append(
-        "SAFETY OVERRIDE: these conclusions reflect the CHECKLIST ONLY. If the parent or clinician "
-        "narrative describes anything that contradicts them - not speaking, not responding to their "
-        "name, loss of previously held skills, no eye contact, or a hearing concern - you MUST "
-        "surface that contradiction in the Observations section and recommend appropriate follow-up "
-        "(such as audiological or developmental evaluation) under Recommendations for the Clinical "
-        "Team. A checklist result must never suppress a reported red flag."
-    )
-    lines.append("===== END VERIFIED FACTS =====")
+    lines.append(_FACTS_TAIL)
     return "\n".join(lines)
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""The two Recommendations sections, written once per band and unmet set.
+
+Nothing about a particular child goes into "Recommendations for Parents" and
+"Recommendations for the Clinical Team". They follow from the age range and
+from which of its milestones were not met. Many children in a band miss the
+same few, yet every report had the model write both sections again, and they
+are most of its output. The report is now split in two:
+
+- the sections, written by the "sections" route from prompts.sections_input()
+  alone and stored here under (band, unmet milestone ids, prompt version);
+- the observations, written per child by the small "observations" route,
+  together with any follow-up its narrative calls for (the safety override),
+  which `stitch()` puts first among the clinical recommendations.
+
+On a hit only the observations call is made. The key carries
+prompts.SECTIONS_VERSION, so editing the prompt - or the catalog's milestone
+text and suggestion links it is built from - retires every stored entry
+without a flush. Entries live SECTION_CACHE_TTL_DAYS in Redis and are shared
+by both runtimes. The cache is an optimisation only: a Redis error counts as
+a miss, and the sections are written fresh.
+
+Every lookup also counts its Shape - the band and unmet ids - in a sorted set,
+in the same round trip. A speculative report's lookup (speculation.py) is not
+counted: the shape is counted with `seen()` only if the report is used, so a
+discarded speculation does not count a screening twice. warmup.py reads the most frequent shapes from it
+off-peak and writes any that are not cached, so peak-time reports mostly hit.
+The warm-up halves the counts after each run, so they follow what is common
+now, and keeps only the SEEN_MAX most frequent. The counts outlive prompt
+versions: after a prompt edit the next warm-up rewrites the common shapes.
+
+Layout:
+
+    sections:<version>:<band>:<sha1 of sorted unmet ids>   JSON sections
+    sections:seen                  sorted set: "<band>:<id>,<id>" -> count
+"""
+
+import hashlib
+import json
+import logging
+import os
+from collections import namedtuple
+
+import metrics
+import prompts
+from catalog import CATALOG
+
+logger = logging.getLogger(__name__)
+
+TTL_DAYS = int(os.environ.get("SECTION_CACHE_TTL_DAYS", 30))
+
+SEEN_MAX = int(os.environ.get("SECTION_CACHE_SEEN_MAX", 5000))
+
+KEY = "sections:%s:%s:%s"
+SEEN_KEY = "sections:seen"
+
+# The heading stitch() gives follow-up raised by this child's observations.
+CONCERNS_HEADING = "Follow-up on Reported Concerns"
+
+
+# What the shared sections depend on: a band key and its unmet milestone ids, sorted.
+Shape = namedtuple("Shape", ["band", "unmet"])
+
+
+def shape_of(result, catalog=CATALOG):
+    return Shape(result.chrono_band.key, tuple(sorted(catalog.ids(result.unmet))))
+
+
+def member(shape):
+    """The shape as its sorted-set member."""
+    return "%d:%s" % (shape.band, ",".join(shape.unmet))
+
+
+def parse_member(text):
+    if isinstance(text, bytes):
+        text = text.decode("utf-8")
+    band, _, ids = text.partition(":")
+    return Shape(int(band), tuple(ids.split(",")) if ids else ())
+
+
+def cache_key(shape, version=None):
+    """(band, unmet milestone ids, prompt version) as a Redis key."""
+    ids = ",".join(shape.unmet)
+    return KEY % (version or prompts.SECTIONS_VERSION, shape.band,
+                  hashlib.sha1(ids.encode("utf-8")).hexdigest()[:16])
+
+
+def request(shape, catalog=CATALOG):
+    """Keyword arguments of the "sections" model call for `shape`."""
+    return dict(instructions=prompts.SECTIONS_INSTRUCTIONS,
+                input=prompts.sections_input(shape, catalog),
+                text=prompts.SECTIONS_FORMAT)
+
+
+def parse_sections(text):
+    """The model's JSON sections, checked against the shape render() needs."""
+    sections = json.loads(text)
+    for key in ("parent_recommendations", "clinical_recommendations"):
+        groups = sections.get(key)
+        if not isinstance(groups, list) or not all(
+                isinstance(g, dict) and isinstance(g.get("points"), list) for g in groups):
+            raise ValueError("sections %s is malformed" % key)
+    return sections
+
+
+def parse_observations(text):
+    personal = json.loads(text)
+    for key in ("observations", "concerns"):
+        if not isinstance(personal.get(key), list):
+            raise ValueError("observations have no %s list" % key)
+    return personal
+
+
+def stitch(personal, sections):
+    """local_report prose: this child's observations around the shared sections."""
+    clinical = list(sections["clinical_recommendations"])
+    concerns = [c for c in personal["concerns"] if c.strip()]
+    if concerns:
+        clinical.insert(0, {"heading": CONCERNS_HEADING, "points": concerns})
+    return {"observations": personal["observations"],
+            "parent_recommendations": sections["parent_recommendations"],
+            "clinical_recommendations": clinical}
+
+
+class SectionCache(object):
+
+    def __init__(self, redis, ttl_days=TTL_DAYS):
+        self.redis = redis
+        self.ttl = ttl_days * 24 * 3600
+
+    @staticmethod
+    def _counted(blob):
+        """The stored sections, or None; an entry that does not parse is a miss."""
+        sections = None
+        if blob is not None:
+            try:
+                sections = parse_sections(blob)
+            except (ValueError, TypeError, AttributeError) as e:
+                logger.warning("section cache entry unreadable: %s", e)
+        metrics.CACHE_LOOKUPS.inc(cache="sections", result="miss" if sections is None else "hit")
+        return sections
+
+    def _lookup(self, shape, count):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(cache_key(shape))
+        if count:
+            pipe.zincrby(SEEN_KEY, 1, member(shape))
+        return pipe
+
+    def get(self, shape, count=True):
+        """The cached sections for `shape`, or None; counts the shape either way
+        unless `count` is false."""
+        try:
+            blob = self._lookup(shape, count).execute()[0]
+        except Exception as e:  # noqa: BLE001 - a cache outage is a miss
+            logger.warning("section cache read failed: %s", e)
+            blob = None
+        return self._counted(blob)
+
+    def put(self, shape, sections):
+        try:
+            self.redis.set(cache_key(shape), json.dumps(sections, separators=(",", ":")), ex=self.ttl)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("section cache write failed: %s", e)
+
+    def seen(self, shape):
+        """Count `shape` without a lookup: for a speculative report that was used."""
+        try:
+            self.redis.zincrby(SEEN_KEY, 1, member(shape))
+        except Exception as e:  # noqa: BLE001
+            logger.warning("section cache count failed: %s", e)
+
+    def contains(self, shape):
+        """Whether `shape` is cached, without counting it; an outage is a miss."""
+        try:
+            return bool(self.redis.exists(cache_key(shape)))
+        except Exception as e:  # noqa: BLE001
+            logger.warning("section cache read failed: %s", e)
+            return False
+
+    # Used by warmup.py, off the request path; Redis errors propagate.
+
+    def common(self, limit):
+        """The `limit` most frequent shapes, most frequent first, as (Shape, count)."""
+        rows = self.redis.zrevrange(SEEN_KEY, 0, limit - 1, withscores=True)
+        return [(parse_member(m), score) for m, score in rows]
+
+    def cached(self, shapes):
+        """Which of `shapes` have sections under the current prompt version."""
+        pipe = self.redis.pipeline(transaction=False)
+        for shape in shapes:
+            pipe.exists(cache_key(shape))
+        return [bool(found) for found in pipe.execute()] if shapes else []
+
+    def decay(self, factor=0.5, keep=SEEN_MAX):
+        """Scale every count by `factor` and keep only the `keep` most frequent."""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zunionstore(SEEN_KEY, {SEEN_KEY: factor})
+        pipe.zremrangebyrank(SEEN_KEY, 0, -(keep + 1))
+        pipe.execute()
+
+
+class AsyncSectionCache(SectionCache):
+    """The same cache over redis.asyncio, for the asyncio runtime."""
+
+    async def get(self, shape, count=True):
+        try:
+            blob = (await self._lookup(shape, count).execute())[0]
+        except Exception as e:  # noqa: BLE001
+            logger.warning("section cache read failed: %s", e)
+            blob = None
+        return self._counted(blob)
+
+    async def put(self, shape, sections):
+        try:
+            await self.redis.set(cache_key(shape), json.dumps(sections, separators=(",", ":")),
+                                 ex=self.ttl)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("section cache write failed: %s", e)
+
+    async def seen(self, shape):
+        try:
+            await self.redis.zincrby(SEEN_KEY, 1, member(shape))
+        except Exception as e:  # noqa: BLE001
+            logger.warning("section cache count failed: %s", e)
+
+    async def contains(self, shape):
+        try:
+            return bool(await self.redis.exists(cache_key(shape)))
+        except Exception as e:  # noqa: BLE001
+            logger.warning("section cache read failed: %s", e)
+            return False
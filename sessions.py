@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Session lifetime: per-phase expiry, compaction and a footprint report.
+
+Sessions are written with a plain SET and used to live forever, so every chat
+that ever pressed /start kept its blob - including the full report text and a
+second copy of it as the email body - in Redis indefinitely. Two things bound
+that now:
+
+- every save sets an expiry chosen by the session's phase (`ttl_for`), so an
+  abandoned intake disappears in a day while a finished report waits long
+  enough for the clinician to come back and email it;
+- `compact()` walks the keyspace and strips the bulky fields from finished
+  sessions nobody has touched recently. The report itself is kept in the
+  report archive (report_archive.py); sessions from before the archive are
+  archived first. It also puts an expiry on sessions written before TTLs
+  existed.
+
+Run it from Heroku Scheduler (or by hand) - it needs only REDIS_URL:
+
+    python sessions.py report
+    python sessions.py compact [--idle-hours 24] [--dry-run]
+
+Every TTL is overridable through the environment (SESSION_TTL_INTAKE, ...,
+in seconds).
+"""
+
+import argparse
+import ast
+import os
+import re
+import sys
+import time
+from collections import OrderedDict, namedtuple
+
+from report_archive import ReportArchive
+
+PHASES = ("intake", "screening", "report", "sent")
+
+DEFAULT_TTLS = {
+    "intake": 24 * 3600,        # name/age typed, no checklist yet
+    "screening": 3 * 24 * 3600,  # ticking milestones, no report yet
+    "report": 14 * 24 * 3600,   # report generated, not emailed
+    "sent": 2 * 24 * 3600,      # emailed; kept briefly for a resend or edit
+}
+
+# Large generated or typed text; the report archive keeps the report itself.
+BULKY_FIELDS = ("recommendations", "email_body", "formatted_checklist", "achieved_milestones")
+
+COMPACT_AFTER = 24 * 3600
+
+# Session keys are bare chat ids; negative ids are group chats.
+SESSION_KEY = re.compile(r"^-?\d+$")
+
+
+class SessionExpired(KeyError):
+    """The chat has no session: it expired, or never pressed /start."""
+
+
+def ttl_for(user_data, phase=None):
+    phase = phase or phase_of(user_data)
+    return int(os.environ.get("SESSION_TTL_%s" % phase.upper(), DEFAULT_TTLS[phase]))
+
+
+def phase_of(user_data):
+    if user_data.get("emailed_at"):
+        return "sent"
+    if user_data.get("recommendations") or user_data.get("compacted"):
+        return "report"
+    if user_data.get("checklists"):
+        return "screening"
+    return "intake"
+
+
+def encode(user_data, now=None):
+    """The stored form: a Python literal, stamped with the write time."""
+    user_data["touched"] = int(now if now is not None else time.time())
+    return str(user_data)
+
+
+def decode(raw):
+    if raw is None:
+        return None
+    return ast.literal_eval(raw.decode("utf-8") if isinstance(raw, bytes) else raw)
+
+
+def is_compacted(user_data):
+    return bool(user_data.get("compacted"))
+
+
+# --------------------------------------------------------------------------
+# Keyspace walk
+# --------------------------------------------------------------------------
+
+def session_keys(redis):
+    for key in redis.scan_iter(count=500):
+        name = key.decode("utf-8") if isinstance(key, bytes) else key
+        if SESSION_KEY.match(name):
+            yield name
+
+
+def _size(redis, key, raw):
+    try:
+        used = redis.memory_usage(key)
+    except Exception:  # noqa: BLE001 - MEMORY is disabled on some managed plans
+        used = None
+    return used if used is not None else len(raw)
+
+
+PhaseFootprint = namedtuple("PhaseFootprint", ["sessions", "bytes"])
+
+
+def footprint(redis):
+    """Sessions and bytes held, by phase."""
+    totals = OrderedDict((p, [0, 0]) for p in PHASES)
+    for key in session_keys(redis):
+        raw = redis.get(key)
+        if raw is None:
+            continue
+        bucket = totals[phase_of(decode(raw))]
+        bucket[0] += 1
+        bucket[1] += _size(redis, key, raw)
+    return OrderedDict((p, PhaseFootprint(*v)) for p, v in totals.items())
+
+
+def format_footprint(fp):
+    lines = ["%-10s %9s %12s %12s" % ("phase", "sessions", "bytes", "bytes/user")]
+    sessions = total = 0
+    for phase, (n, size) in fp.items():
+        lines.append("%-10s %9d %12d %12d" % (phase, n, size, size // n if n else 0))
+        sessions += n
+        total += size
+    lines.append("%-10s %9d %12d %12d" % ("all", sessions, total,
+                                          total // sessions if sessions else 0))
+    return "\n".join(lines)
+
+
+CompactionStats = namedtuple("CompactionStats", ["scanned", "compacted", "expiry_set", "archived"])
+
+
+def compact(redis, archive=None, now=None, idle=COMPACT_AFTER, dry_run=False):
+    """Slim idle finished sessions; give legacy keys an expiry.
+
+    A session is compacted when it holds a report and has not been saved for
+    `idle` seconds. A report that predates the archive (no `report_id`) is
+    archived first; then the bulky fields are dropped and the slim session is
+    written back with the remaining TTL of its phase, measured from its last
+    save.
+
+    Each key is read and written back in one WATCH/MULTI transaction. If the
+    bot saves the session in between, the write is aborted and the key read
+    again - freshly touched, it is then left alone - rather than the user's
+    new state being overwritten with the old copy.
+    """
+    now = time.time() if now is None else now
+    archive = archive or ReportArchive(redis)
+    totals = [0, 0, 0, 0]
+    for key in session_keys(redis):
+        counts = redis.transaction(
+            lambda pipe: _compact_key(pipe, key, archive, now, idle, dry_run), key,
+            value_from_callable=True)
+        totals = [t + n for t, n in zip(totals, counts)]
+    return CompactionStats(*totals)
+
+
+def _compact_key(pipe, key, archive, now, idle, dry_run):
+    """compact() for one key, on a pipeline WATCHing it; returns its counts."""
+    raw = pipe.get(key)
+    if raw is None:
+        return (0, 0, 0, 0)
+    user_data = decode(raw)
+    touched = user_data.get("touched")
+    has_report = any(user_data.get(f) for f in BULKY_FIELDS[:2])
+
+    if has_report and (touched is None or now - touched >= idle):
+        unarchived = not user_data.get("report_id")
+        if not dry_run:
+            if unarchived:
+                archive.append(int(key),
+                               user_data.get("recommendations") or user_data["email_body"],
+                               subject=user_data.get("email_subject"),
+                               age=user_data.get("age"), now=touched or now)
+            for field in BULKY_FIELDS:
+                user_data.pop(field, None)
+            user_data["compacted"] = True
+            last = touched if touched is not None else now
+            remaining = max(int(last + ttl_for(user_data) - now), 60)
+            pipe.multi()
+            pipe.set(key, str(user_data), ex=remaining)
+        return (1, 1, 0, int(unarchived))
+    if pipe.ttl(key) == -1:
+        # Written before expiries existed: start the clock from now.
+        if not dry_run:
+            pipe.multi()
+            pipe.expire(key, ttl_for(user_data))
+        return (1, 0, 1, 0)
+    return (1, 0, 0, 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("report", help="print session footprint by phase")
+    run = sub.add_parser("compact", help="archive and slim idle sessions")
+    run.add_argument("--idle-hours", type=float, default=COMPACT_AFTER / 3600.0)
+    run.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    import clients
+
+    redis = clients.redis
+    before = footprint(redis)
+    print(format_footprint(before))
+    if args.command == "compact":
+        stats = compact(redis, idle=args.idle_hours * 3600, dry_run=args.dry_run)
+        print("\nscanned=%d compacted=%d expiry_set=%d archived=%d%s"
+              % (stats + (" (dry run)" if args.dry_run else "",)))
+        if not args.dry_run:
+            print("\nafter")
+            print(format_footprint(footprint(redis)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Speculative work started before the user has decided they need it.
+
+Once the checklist is submitted the bot asks "add observations?" and, until
+now, waited: the report call only started after the answer. Most screenings
+answer No, and the report for "no observations" depends only on what the
+session already holds. So submit_checklist starts that report straight away,
+and skip_observations picks it up - usually finished, or at least well under
+way. Answering Yes discards it.
+
+A speculation is keyed on the inputs it was started from; `take()` hands it
+over only if the caller's key still matches, so a session that changed in
+between (another band ticked, /restart) never gets a stale report. Entries
+nobody collects are dropped after MAX_AGE seconds. Process-local, like the
+bot's next-step handlers: the app runs as a single worker.
+
+The threaded runtime gives Speculator a ThreadPoolExecutor; aio gives it a
+TaskSpawner, so the job is a Task the handler awaits and discard() really
+cancels it. A thread already waiting on the model cannot be interrupted: a
+discarded threaded speculation still finishes its call, and the result is
+dropped.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+
+import metrics
+
+MAX_AGE = 15 * 60
+
+
+def report_key(user_data):
+    """What a no-observations report depends on, as a comparable value."""
+    return repr((user_data.get("age"),
+                 sorted(user_data.get("checklists", {}).items()),
+                 user_data.get("formatted_checklist", "")))
+
+
+class Speculator(object):
+
+    def __init__(self, executor, max_age=MAX_AGE, clock=time.monotonic):
+        self.executor = executor
+        self.max_age = max_age
+        self.clock = clock
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        for chat_id, (_, started, future) in list(self._jobs.items()):
+            if now - started > self.max_age:
+                del self._jobs[chat_id]
+                future.cancel()
+                metrics.SPECULATIONS.inc(outcome="expired")
+
+    def start(self, chat_id, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) for `chat_id`, replacing any earlier speculation."""
+        now = self.clock()
+        future = self.executor.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._expire(now)
+            previous = self._jobs.pop(chat_id, None)
+            self._jobs[chat_id] = (key, now, future)
+        if previous is not None:
+            previous[2].cancel()
+            metrics.SPECULATIONS.inc(outcome="replaced")
+        metrics.SPECULATIONS.inc(outcome="started")
+        return future
+
+    def take(self, chat_id, key):
+        """The chat's speculative Future if it was started from `key`, else None."""
+        with self._lock:
+            job = self._jobs.pop(chat_id, None)
+        if job is None:
+            return None
+        if job[0] != key:
+            job[2].cancel()
+            metrics.SPECULATIONS.inc(outcome="stale")
+            return None
+        metrics.SPECULATIONS.inc(outcome="used")
+        return job[2]
+
+    def discard(self, chat_id):
+        """Drop the chat's speculation: its inputs are about to change."""
+        with self._lock:
+            job = self._jobs.pop(chat_id, None)
+        if job is not None:
+            job[2].cancel()
+            metrics.SPECULATIONS.inc(outcome="discarded")
+
+
+class TaskSpawner(object):
+    """An executor-shaped front for the event loop: submit() returns a Task."""
+
+    def submit(self, fn, *args, **kwargs):
+        # A fresh context: the job outlives the update that started it, and
+        # must not inherit that update's deadline.
+        return contextvars.Context().run(asyncio.ensure_future, fn(*args, **kwargs))
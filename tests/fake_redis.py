@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""One in-memory Redis for every test that needs one.
+
+Covers the commands the bot uses - strings with expiries, sorted sets, hashes,
+SCAN, pipelines and WATCH/MULTI transactions - with redis-py's return types:
+keys, values and members come back as bytes, scores as floats. Expiries are
+recorded, not enforced. AsyncFakeRedis is the same store shaped like
+redis.asyncio.
+
+Not a test module; the test files import it:
+    from fake_redis import AsyncFakeRedis, FakeRedis
+"""
+
+import fnmatch
+
+
+class WatchError(Exception):
+    """A WATCHed key changed before EXEC; redis-py's transaction() retries."""
+
+
+def _key(key):
+    return key.decode("utf-8") if isinstance(key, bytes) else str(key)
+
+
+def _b(value):
+    if isinstance(value, bytes):
+        return value
+    return (value if isinstance(value, str) else repr(value)).encode("utf-8")
+
+
+def _score(bound):
+    if isinstance(bound, (bytes, str)):
+        bound = _key(bound)
+        if bound in ("-inf", "+inf", "inf"):
+            return float(bound)
+    return float(bound)
+
+
+def _range(items, start, end):
+    """Redis's inclusive, negative-aware index range."""
+    n = len(items)
+    start = max(start + n if start < 0 else start, 0)
+    end = min(end + n if end < 0 else end, n - 1)
+    return items[start:end + 1] if start <= end else []
+
+
+class Pipeline(object):
+    """Commands queue until execute(); after watch() they run at once until multi()."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.watched = {}
+        self.immediate = False
+        self.stack = []
+
+    def watch(self, *keys):
+        self.watched.update((_key(k), self.redis.version(k)) for k in keys)
+        self.immediate = True
+
+    def multi(self):
+        self.immediate = False
+
+    def reset(self):
+        self.watched, self.immediate, self.stack = {}, False, []
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+
+        def call(*args, **kwargs):
+            if self.immediate:
+                return command(*args, **kwargs)
+            self.stack.append((command, args, kwargs))
+            return self
+        return call
+
+    def execute(self):
+        try:
+            if any(self.redis.version(k) != v for k, v in self.watched.items()):
+                raise WatchError("watched key changed")
+            return [command(*args, **kwargs) for command, args, kwargs in self.stack]
+        finally:
+            self.reset()
+
+
+class FakeRedis(object):
+
+    def __init__(self):
+        self.strings = {}
+        self.zsets = {}
+        self.hashes = {}
+        self.ttls = {}
+        self.versions = {}
+
+    def version(self, key):
+        return self.versions.get(_key(key), 0)
+
+    def _touch(self, key):
+        key = _key(key)
+        self.versions[key] = self.versions.get(key, 0) + 1
+        for store in (self.zsets, self.hashes):
+            if key in store and not store[key]:
+                del store[key]
+        if not self._has(key):
+            self.ttls.pop(key, None)
+
+    def _has(self, key):
+        return key in self.strings or key in self.zsets or key in self.hashes
+
+    # Pipelines and transactions
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+    def transaction(self, func, *watches, value_from_callable=False):
+        """redis-py's loop: WATCH, run `func`, EXEC; again if a key changed."""
+        pipe = self.pipeline()
+        while True:
+            try:
+                pipe.watch(*watches)
+                value = func(pipe)
+                result = pipe.execute()
+                return value if value_from_callable else result
+            except WatchError:
+                continue
+
+    # Keys
+
+    def exists(self, *keys):
+        return sum(1 for k in keys if self._has(_key(k)))
+
+    def delete(self, *keys):
+        deleted = 0
+        for key in map(_key, keys):
+            for store in (self.strings, self.zsets, self.hashes):
+                if store.pop(key, None) is not None:
+                    deleted += 1
+            self._touch(key)
+        return deleted
+
+    def expire(self, key, seconds):
+        key = _key(key)
+        if not self._has(key):
+            return False
+        self.ttls[key] = int(seconds)
+        self._touch(key)
+        return True
+
+    def ttl(self, key):
+        key = _key(key)
+        return self.ttls.get(key, -1) if self._has(key) else -2
+
+    def scan_iter(self, match=None, count=None):
+        keys = list(self.strings) + list(self.zsets) + list(self.hashes)
+        return iter([k.encode("utf-8") for k in keys if match is None or fnmatch.fnmatchcase(k, match)])
+
+    def memory_usage(self, key):
+        value = self.strings.get(_key(key))
+        return None if value is None else len(value) + 50
+
+    # Strings
+
+    def get(self, key):
+        return self.strings.get(_key(key))
+
+    def set(self, key, value, ex=None):
+        key = _key(key)
+        self.strings[key] = _b(value)
+        if ex is None:
+            self.ttls.pop(key, None)
+        else:
+            self.ttls[key] = int(ex)
+        self._touch(key)
+        return True
+
+    # Sorted sets
+
+    def _ordered(self, key):
+        return sorted(self.zsets.get(_key(key), {}).items(), key=lambda ms: (ms[1], ms[0]))
+
+    def zadd(self, key, mapping):
+        zset = self.zsets.setdefault(_key(key), {})
+        added = sum(1 for m in mapping if _b(m) not in zset)
+        zset.update((_b(m), float(s)) for m, s in mapping.items())
+        self._touch(key)
+        return added
+
+    def zincrby(self, key, amount, member):
+        zset = self.zsets.setdefault(_key(key), {})
+        score = zset[_b(member)] = zset.get(_b(member), 0.0) + float(amount)
+        self._touch(key)
+        return score
+
+    def zscore(self, key, member):
+        return self.zsets.get(_key(key), {}).get(_b(member))
+
+    def zrange(self, key, start, end, withscores=False):
+        rows = _range(self._ordered(key), start, end)
+        return rows if withscores else [m for m, _ in rows]
+
+    def zrevrange(self, key, start, end, withscores=False):
+        rows = _range(self._ordered(key)[::-1], start, end)
+        return rows if withscores else [m for m, _ in rows]
+
+    def zrangebyscore(self, key, low, high, withscores=False):
+        low, high = _score(low), _score(high)
+        rows = [(m, s) for m, s in self._ordered(key) if low <= s <= high]
+        return rows if withscores else [m for m, _ in rows]
+
+    def zrem(self, key, *members):
+        zset = self.zsets.get(_key(key), {})
+        removed = sum(1 for m in members if zset.pop(_b(m), None) is not None)
+        self._touch(key)
+        return removed
+
+    def zremrangebyrank(self, key, start, end):
+        return self.zrem(key, *self.zrange(key, start, end))
+
+    def zunionstore(self, dest, keys):
+        weights = keys if isinstance(keys, dict) else dict.fromkeys(keys, 1)
+        union = {}
+        for key, weight in weights.items():
+            for member, score in self.zsets.get(_key(key), {}).items():
+                union[member] = union.get(member, 0.0) + score * weight
+        self.zsets[_key(dest)] = union
+        self._touch(dest)
+        return len(union)
+
+    # Hashes
+
+    def hset(self, key, field, value):
+        fields = self.hashes.setdefault(_key(key), {})
+        added = int(_b(field) not in fields)
+        fields[_b(field)] = _b(value)
+        self._touch(key)
+        return added
+
+    def hget(self, key, field):
+        return self.hashes.get(_key(key), {}).get(_b(field))
+
+    def hmget(self, key, fields):
+        return [self.hget(key, f) for f in fields]
+
+    def hdel(self, key, *fields):
+        stored = self.hashes.get(_key(key), {})
+        removed = sum(1 for f in fields if stored.pop(_b(f), None) is not None)
+        self._touch(key)
+        return removed
+
+
+class AsyncPipeline(Pipeline):
+    async def execute(self):
+        return Pipeline.execute(self)
+
+
+class AsyncFakeRedis(object):
+    """FakeRedis shaped like redis.asyncio: commands are awaited, pipelines queue."""
+
+    def __init__(self, store=None):
+        self.sync = store if store is not None else FakeRedis()
+
+    def pipeline(self, transaction=True):
+        return AsyncPipeline(self.sync)
+
+    def __getattr__(self, name):
+        command = getattr(self.sync, name)
+
+        async def call(*args, **kwargs):
+            return command(*args, **kwargs)
+        return call
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""The milestone catalog: validation, stable ids and the derived views.
+
+No network - run with:
+    python tests/test_catalog.py
+"""
+
+import copy
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog  # noqa: E402
+import prompts  # noqa: E402
+import screening_logic as sl  # noqa: E402
+import section_cache  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+def raw_catalog():
+    with open(catalog.CATALOG_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def rejects(raw):
+    try:
+        catalog.Catalog(raw)
+    except catalog.CatalogError as exc:
+        return str(exc)
+    return None
+
+
+def test_01_ids_unique_and_every_band_present():
+    cat = catalog.CATALOG
+    ids = [m.id for m in cat.milestones]
+    check("01 ids unique", len(ids), len(set(ids)))
+    check("01 all bands", sorted(cat.by_band), sorted(b.key for b in sl.BANDS))
+    check("01 positions", all(cat.milestone(m.band, m.index) is m for m in cat.milestones), True)
+
+
+def test_02_views_line_up():
+    cat = catalog.CATALOG
+    check("02 same bands", sorted(cat.checklist_options), sorted(cat.domain_table))
+    check("02 same lengths", {k: len(v) for k, v in cat.checklist_options.items()},
+          {k: len(v) for k, v in cat.domain_table.items()})
+    check("02 domain table type", isinstance(cat.domain_table, sl.DomainTable), True)
+    first = cat.by_band[24][0]
+    check("02 ids of entries", cat.ids([(24, 0, "x")]), (first.id,))
+    check("02 suggestions via links", [s.id for s in cat.suggestions_for(first.id)],
+          [s.id for s in cat.band_suggestions[24] if first.id in s.addresses])
+
+
+def test_03_reference_text_covers_selected_bands():
+    cat = catalog.CATALOG
+    full = cat.reference_text()
+    check("03 every milestone", all(m.text.strip() in full for m in cat.milestones), True)
+    check("03 every label", all("[%s:]" % b.label in full for b in sl.BANDS), True)
+    some = cat.reference_text([24, 18])
+    check("03 selection in band order", some.index("[13 to 18 months:]") < some.index("[19 to 24"),
+          True)
+    check("03 excludes other bands", "[Birth to 3 months:]" in some, False)
+    check("03 cached", cat.reference_text((18, 24)) is some, True)
+
+
+def test_04_validation_rejects_inconsistent_data():
+    raw = raw_catalog()
+
+    dup = copy.deepcopy(raw)
+    dup["bands"][1]["milestones"][0]["id"] = dup["bands"][0]["milestones"][0]["id"]
+    check("04 duplicate id", "duplicate milestone id" in (rejects(dup) or ""), True)
+
+    domain = copy.deepcopy(raw)
+    domain["bands"][0]["milestones"][0]["domain"] = "Pragmatics"
+    check("04 unknown domain", "unknown domain" in (rejects(domain) or ""), True)
+
+    link = copy.deepcopy(raw)
+    link["bands"][0]["suggestions"].append("s-no-such-suggestion")
+    check("04 unknown suggestion", "unknown suggestion" in (rejects(link) or ""), True)
+
+    target = copy.deepcopy(raw)
+    target["suggestions"]["s-watch-hearing"]["addresses"].append("no-such-milestone")
+    check("04 unknown addressed milestone", "addresses unknown milestone" in (rejects(target) or ""), True)
+
+    stray = copy.deepcopy(raw)
+    stray["suggestions"]["s-watch-hearing"]["addresses"].append(stray["bands"][-1]["milestones"][0]["id"])
+    check("04 addresses outside its bands", "not listed in its band" in (rejects(stray) or ""), True)
+
+    band = copy.deepcopy(raw)
+    band["bands"][0]["key"] = 7
+    check("04 unknown band", "unknown band" in (rejects(band) or ""), True)
+
+    check("04 shipped file valid", rejects(raw), None)
+
+
+def test_05_report_prompt_lists_only_the_result_bands():
+    opts = catalog.CATALOG.checklist_options
+    ticks = {24: [True] * 2 + [False] * (len(opts[24]) - 2)}
+    res = sl.analyze(30, {36: [False] * len(opts[36]), 24: ticks[24]}, opts, catalog.CATALOG.domain_table)
+    bands = prompts.prompt_bands(res)
+    check("05 chrono and administered", set(bands) >= {36, 24}, True)
+    check("05 developmental", res.dev_band is None or res.dev_band.key in bands, True)
+    trimmed = prompts.report_instructions(bands)
+    check("05 other bands dropped", "[Birth to 3 months:]" in trimmed, False)
+    check("05 result bands kept", "[%s:]" % sl.BAND_BY_KEY[36].label in trimmed, True)
+    check("05 cached per selection", prompts.report_instructions(tuple(reversed(bands))) is trimmed, True)
+    check("05 shorter than full", len(trimmed) < len(prompts.report_instructions()), True)
+    check("05 same rules", trimmed.split("3. DERIVED VALUES")[1],
+          prompts.report_instructions().split("3. DERIVED VALUES")[1])
+
+
+def test_06_suggestions_target_unmet_milestones():
+    cat = catalog.CATALOG
+    unmet = ["36m-correctly-produces-p-b"]
+    targeted = cat.targeted_suggestions(36, unmet)
+    check("06 only aimed at the unmet", all(set(s.addresses) & set(unmet) for s in targeted), True)
+    check("06 fewer than the band", 0 < len(targeted) < len(cat.band_suggestions[36]), True)
+    check("06 band order", [s.id for s in targeted],
+          [s.id for s in cat.band_suggestions[36] if s in targeted])
+    check("06 nothing unmet: whole band", cat.targeted_suggestions(36, []), cat.band_suggestions[36])
+    unlinked = "48m-talks-smoothly"
+    check("06 nothing linked: whole band", cat.targeted_suggestions(48, [unlinked]), cat.band_suggestions[48])
+    prompt = prompts.recommendations_instructions(36, unmet)
+    check("06 prompt targeted", all(s.text in prompt for s in targeted), True)
+    check("06 prompt shorter", len(prompt) < len(prompts.recommendations_instructions(36)), True)
+    check("06 home languages is general advice", cat.suggestion_by_id["s-home-languages-4to5"].addresses, ())
+
+
+def test_07_report_inputs_list_the_targeted_activities():
+    cat = catalog.CATALOG
+    unmet = ["36m-correctly-produces-p-b"]
+    ticks = [m.id not in unmet for m in cat.by_band[36]]
+    res = sl.analyze(36, {36: ticks}, cat.checklist_options, cat.domain_table)
+    text = prompts.prose_input("1. Follows directions", 36, "", sl.build_facts_block(res), res)
+    targeted = cat.targeted_suggestions(36, unmet)
+    check("07 targeted listed", all(s.text in text for s in targeted), True)
+    check("07 the rest left out", [s.id for s in cat.band_suggestions[36] if s not in targeted and s.text in text],
+          [])
+    check("07 sections input the same block", prompts.parent_activities(36, unmet) in prompts.sections_input(
+        section_cache.Shape(36, tuple(unmet))), True)
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all catalog checks pass")
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Lazy client construction: nothing is built until it is used.
+
+No network, no bot token - run with:
+    python tests/test_clients.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clients  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+class FakeBot(object):
+    def __init__(self):
+        self.registered = []
+
+    def register_message_handler(self, callback, **kwargs):
+        self.registered.append(("message", callback.__name__, kwargs.get("commands")))
+
+    def register_callback_query_handler(self, callback, func, **kwargs):
+        self.registered.append(("callback", callback.__name__, func("x")))
+
+    def send_message(self, chat_id, text):
+        return (chat_id, text)
+
+
+def test_01_decorating_does_not_build_the_bot():
+    built = []
+    bot = clients.LazyBot(lambda: built.append(1) or FakeBot())
+
+    @bot.message_handler(commands=["start"])
+    def start(message):
+        return message
+
+    @bot.callback_query_handler(func=lambda data: data == "x")
+    def toggle(call):
+        return call
+
+    check("01 not built", built, [])
+    check("01 handler returned unchanged", start("m"), "m")
+
+
+def test_02_first_use_builds_once_and_replays_in_order():
+    built = []
+    bot = clients.LazyBot(lambda: built.append(FakeBot()) or built[-1])
+
+    @bot.message_handler(commands=["start"])
+    def start(message):
+        return message
+
+    @bot.callback_query_handler(func=lambda data: data == "x")
+    def toggle(call):
+        return call
+
+    check("02 send", bot.send_message(1, "hi"), (1, "hi"))
+    bot.send_message(2, "again")
+    check("02 built once", len(built), 1)
+    check("02 replay order", built[0].registered,
+          [("message", "start", ["start"]), ("callback", "toggle", True)])
+
+
+def test_03_registration_after_build_goes_straight_through():
+    bot = clients.LazyBot(FakeBot)
+    bot.send_message(1, "build")
+
+    @bot.message_handler(commands=["late"])
+    def late(message):
+        return message
+
+    check("03 late registered", bot.registered, [("message", "late", ["late"])])
+
+
+def test_04_once_caches():
+    calls = []
+    get = clients.once(lambda: calls.append(1) or len(calls))
+    check("04 not built", get.built(), False)
+    check("04 first", get(), 1)
+    check("04 cached", get(), 1)
+    check("04 built", get.built(), True)
+
+
+def test_05_smtp_settings_default_port():
+    saved = os.environ.pop("SMTP_PORT", None)
+    try:
+        check("05 default", clients.smtp_settings(default_port=587).port, 587)
+        check("05 none", clients.smtp_settings().port, None)
+        os.environ["SMTP_PORT"] = "2525"
+        check("05 env wins", clients.smtp_settings(default_port=587).port, 2525)
+    finally:
+        os.environ.pop("SMTP_PORT", None)
+        if saved is not None:
+            os.environ["SMTP_PORT"] = saved
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all client checks pass")
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Update deadlines: budgets, per-call timeouts, degradation and propagation.
+
+No network - run with:
+    python tests/test_deadlines.py
+"""
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import deadlines  # noqa: E402
+import llm  # noqa: E402
+import metrics  # noqa: E402
+import modelpool  # noqa: E402
+import outbound  # noqa: E402
+from llm import Route, Tier  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def raises(fn, *args, **kwargs):
+    try:
+        fn(*args, **kwargs)
+    except deadlines.DeadlineExceeded as e:
+        return e.step
+    return None
+
+
+def test_01_no_deadline_outside_an_update():
+    check("01 cap kept", deadlines.timeout(5, "x"), 5)
+    check("01 no cap", deadlines.timeout(None, "x"), None)
+    check("01 never degrades", deadlines.nearly_spent("x"), False)
+
+
+def test_02_timeouts_shrink_with_the_budget():
+    clock = Clock()
+    with deadlines.budget(30, clock=clock):
+        check("02 cap wins", deadlines.timeout(10, "x"), 10)
+        clock.now += 25
+        check("02 remaining wins", deadlines.timeout(10, "x"), 5)
+        check("02 reserve kept back", deadlines.timeout(10, "x", reserve=3), 2)
+        exceeded = metrics.DEADLINES.value(step="model.report", outcome="exceeded")
+        check("02 reserve exhausted", raises(deadlines.timeout, 10, "model.report", reserve=6), "model.report")
+        check("02 counted", metrics.DEADLINES.value(step="model.report", outcome="exceeded"), exceeded + 1)
+    check("02 reset after", deadlines.current(), None)
+
+
+def test_03_nested_budget_keeps_the_outer_one():
+    clock = Clock()
+    with deadlines.budget(30, clock=clock) as outer:
+        clock.now += 20
+        with deadlines.budget(30, clock=clock) as inner:
+            check("03 same deadline", inner is outer, True)
+            check("03 degrades", deadlines.nearly_spent("send", reserve=15), True)
+            check("03 not yet", deadlines.nearly_spent("send", reserve=5), False)
+
+
+def test_04_budget_follows_calls_onto_the_model_pool():
+    pool = modelpool.ModelPool(concurrency=1, max_queue=1)
+    clock = Clock()
+    with deadlines.budget(30, clock=clock):
+        clock.now += 10
+        seen = pool.run(deadlines.remaining)
+    check("04 pool thread sees it", seen, 20)
+    check("04 not leaked", pool.run(deadlines.remaining), None)
+
+
+def test_05_model_timeout_leaves_room_for_a_local_report():
+    clock = Clock()
+    client = SimpleNamespace(requests=[])
+    client.responses = SimpleNamespace(create=lambda **kw: client.requests.append(kw) or SimpleNamespace(output_text="ok"))
+    routes = {"report": Route(Tier("m", None), Tier("m", None), 30.0)}
+    breaker = llm.CircuitBreaker(clock=clock)
+    with deadlines.budget(deadlines.RESERVE + 12, clock=clock):
+        llm.call(client, "report", router=llm.Router(routes), breaker=breaker, input="x")
+        check("05 timeout", client.requests[-1]["timeout"], 12)
+        clock.now += 12
+        check("05 not started", raises(llm.call, client, "report", router=llm.Router(routes),
+                                       breaker=breaker, input="x"), "model.report")
+    check("05 one request", len(client.requests), 1)
+
+
+def test_06_paced_wait_bounded_but_delivery_continues():
+    release = threading.Event()
+    sent = []
+
+    def send(chat_id, text):
+        release.wait(5)
+        sent.append(text)
+
+    queue = outbound.Outbound(global_rate=100, chat_rate=100, chat_burst=10, senders=1)
+    bot = outbound.PacedBot(SimpleNamespace(send_message=send), queue)
+    with deadlines.budget(0.05):
+        check("06 caller stops waiting", raises(bot.send_message, 1, "late"), "telegram.send_message")
+    release.set()
+    future = queue.submit(1, lambda: "after", priority=outbound.NORMAL)
+    future.result(5)
+    check("06 still delivered", sent, ["late"])
+
+
+def test_07_wait_keeps_the_reserve_back():
+    never = Future()
+    started = time.monotonic()
+    with deadlines.budget(0.1 + 5):
+        step = raises(outbound.wait, never, "report.speculative_wait", reserve=5)
+    check("07 stops waiting", step, "report.speculative_wait")
+    check("07 reserve left", time.monotonic() - started < 1, True)
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all deadline checks pass")
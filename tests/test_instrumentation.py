@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Stage timing: the disabled no-op, what a span records and logs, and its export.
+
+Pure, no network - run with:
+    python tests/test_instrumentation.py
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import instrumentation  # noqa: E402
+import metrics  # noqa: E402
+from instrumentation import STAGE_SECONDS, span  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+class Lines(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(record.getMessage())
+
+
+def timing(enabled):
+    """Switch timing on or off and start from an empty histogram."""
+    instrumentation.ENABLED = enabled
+    STAGE_SECONDS.reset()
+
+
+def series(stage, outcome):
+    return STAGE_SECONDS.snapshot().get((("outcome", outcome), ("stage", stage)))
+
+
+def test_01_disabled_span_is_a_shared_noop():
+    timing(False)
+    check("01 shared", span("redis.get", 42) is span("model.report"), True)
+    with span("redis.get", 42):
+        pass
+    check("01 nothing recorded", STAGE_SECONDS.snapshot(), {})
+
+
+def test_02_span_times_the_block_and_logs_a_hashed_chat():
+    timing(True)
+    handler, level = Lines(), instrumentation.logger.level
+    instrumentation.logger.addHandler(handler)
+    instrumentation.logger.setLevel(logging.INFO)
+    try:
+        with span("redis.get", 42):
+            time.sleep(0.02)
+    finally:
+        instrumentation.logger.removeHandler(handler)
+        instrumentation.logger.setLevel(level)
+        instrumentation.ENABLED = False
+    counts, total, count = series("redis.get", "ok")
+    check("02 one observation", count, 1)
+    check("02 at least the sleep", 0.02 <= total < 1.0, True)
+    check("02 not in the 10 ms bucket", counts[STAGE_SECONDS.buckets.index(0.01)], 0)
+    check("02 in the last bucket", counts[-1], 1)
+    check("02 one line", len(handler.lines), 1)
+    check("02 chat hashed", "chat=%s " % instrumentation.hash_chat_id(42) in handler.lines[0], True)
+    check("02 raw id absent", "chat=42 " in handler.lines[0], False)
+
+
+def test_03_errors_are_recorded_and_propagate():
+    timing(True)
+    try:
+        with span("model.report"):
+            raise ValueError("bad json")
+    except ValueError:
+        check("03 propagated", True, True)
+    else:
+        check("03 propagated", False, True)
+    finally:
+        instrumentation.ENABLED = False
+    check("03 error outcome", series("model.report", "error")[2], 1)
+    check("03 no ok outcome", series("model.report", "ok"), None)
+
+
+def test_04_exported_with_the_registry():
+    timing(True)
+    try:
+        with span("smtp.send"):
+            pass
+    finally:
+        instrumentation.ENABLED = False
+    text = metrics.render()
+    check("04 declared", "# TYPE milestones_stage_seconds histogram" in text, True)
+    check("04 count", 'milestones_stage_seconds_count{outcome="ok",stage="smtp.send"} 1' in text, True)
+    check("04 inf bucket",
+          'milestones_stage_seconds_bucket{outcome="ok",stage="smtp.send",le="+Inf"} 1' in text, True)
+    STAGE_SECONDS.reset()
+
+
+def test_05_chat_hash_is_stable_and_short():
+    check("05 stable", instrumentation.hash_chat_id(42), instrumentation.hash_chat_id(42))
+    check("05 distinct", instrumentation.hash_chat_id(42) == instrumentation.hash_chat_id(43), False)
+    check("05 length", len(instrumentation.hash_chat_id(42)), 12)
+    check("05 none", instrumentation.hash_chat_id(None), "-")
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all instrumentation checks pass")
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""Model gateway: route table, env overrides, fallback, accounting, breaker and hedging.
+
+No network - run with:
+    python tests/test_llm.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm  # noqa: E402
+import metrics  # noqa: E402
+from llm import CLOSED, FALLBACK, HALF_OPEN, OPEN, PRIMARY, Route, Tier  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+ROUTES = {"age": Route(Tier("big", "none"), Tier("small", "none"), 2.0),
+          "report": Route(Tier("big", None), Tier("big", "low"), 30.0)}
+
+
+class Client(object):
+    """Records requests; fails while `failing` is set."""
+
+    def __init__(self):
+        self.requests = []
+        self.failing = False
+        self.responses = self
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        if self.failing:
+            raise RuntimeError("upstream 500")
+        return SimpleNamespace(output_text="24",
+                               usage=SimpleNamespace(input_tokens=1000, output_tokens=10))
+
+
+def test_01_request_per_tier():
+    check("01 effort set", llm.request_kwargs(Tier("m", "none"), {"input": "x"}),
+          {"input": "x", "model": "m", "reasoning": {"effort": "none"}})
+    check("01 effort left to model", llm.request_kwargs(Tier("m", None), {"input": "x"}),
+          {"input": "x", "model": "m"})
+
+
+def test_02_env_overrides():
+    routes = llm.routes_from_env(ROUTES, {"MODEL_ROUTE_AGE": "fast:minimal",
+                                          "MODEL_ROUTE_REPORT": "a:high,b:low",
+                                          "MODEL_P95_REPORT": "25"})
+    check("02 single tier is both", routes["age"], Route(Tier("fast", "minimal"), Tier("fast", "minimal"), 2.0))
+    check("02 two tiers", routes["report"], Route(Tier("a", "high"), Tier("b", "low"), 25.0))
+    check("02 untouched", llm.routes_from_env(ROUTES, {}), ROUTES)
+    check("02 prices", llm.parse_prices("a=1.25/10, b=0.5"), {"a": (1.25, 10.0), "b": (0.5, 0.5)})
+
+
+def test_03_slow_primary_falls_back_then_recovers():
+    clock = Clock()
+    router = llm.Router(ROUTES, window=10, min_samples=5, fallback_seconds=60, clock=clock)
+    for _ in range(4):
+        router.record("age", PRIMARY, 3.0, True)
+    check("03 too few samples", router.pick("age"), (PRIMARY, Tier("big", "none")))
+    router.record("age", PRIMARY, 3.0, True)
+    check("03 degraded", router.pick("age"), (FALLBACK, Tier("small", "none")))
+    check("03 other routes unaffected", router.pick("report")[0], PRIMARY)
+    router.record("age", FALLBACK, 9.0, False)
+    clock.now += 61
+    check("03 primary retried", router.pick("age")[0], PRIMARY)
+
+
+def test_04_error_rate_falls_back():
+    router = llm.Router(ROUTES, window=10, min_samples=5, max_error_rate=0.2, clock=Clock())
+    for ok in (True, True, True, False, True):
+        router.record("report", PRIMARY, 1.0, ok)
+    check("04 one in five tolerated", router.pick("report")[0], PRIMARY)
+    router.record("report", PRIMARY, 1.0, False)
+    check("04 two in six is too many", router.pick("report")[0], FALLBACK)
+
+
+def test_05_unknown_function_uses_default_model():
+    check("05 default", llm.Router(ROUTES).pick("other"), (PRIMARY, Tier(llm.OPENAI_MODEL, None)))
+
+
+def test_06_call_routes_and_accounts():
+    router = llm.Router(ROUTES, window=10, min_samples=2, clock=Clock())
+    client = Client()
+    calls = metrics.MODEL_CALLS.value(function="age", tier=PRIMARY, outcome="ok")
+    tokens = metrics.MODEL_TOKENS.value(function="age", tier=PRIMARY, model="big", direction="input")
+    response = llm.call(client, "age", router=router, instructions="i", input="2 years")
+    check("06 response", response.output_text, "24")
+    check("06 request", client.requests[-1],
+          {"instructions": "i", "input": "2 years", "model": "big", "reasoning": {"effort": "none"}})
+    check("06 counted", metrics.MODEL_CALLS.value(function="age", tier=PRIMARY, outcome="ok"), calls + 1)
+    check("06 tokens", metrics.MODEL_TOKENS.value(
+        function="age", tier=PRIMARY, model="big", direction="input"), tokens + 1000)
+    client.failing = True
+    for _ in range(2):
+        try:
+            llm.call(client, "age", router=router, input="x")
+        except RuntimeError:
+            pass
+    llm.call(Client(), "age", router=router, input="x")
+    check("06 errors trip fallback", router.pick("age")[0], FALLBACK)
+
+
+def breaker(clock):
+    return llm.CircuitBreaker(window=10, min_calls=4, failure_rate=0.5, slow_seconds=5,
+                              open_seconds=30, trial_calls=2, clock=clock)
+
+
+def test_07_breaker_trips_on_errors_and_slow_calls():
+    clock = Clock()
+    b = breaker(clock)
+    for seconds, ok in ((1, True), (1, False), (9, True)):
+        b.allow()
+        b.record(seconds, ok)
+    check("07 below min calls", b.state, CLOSED)
+    b.allow()
+    b.record(1, True)
+    check("07 two of four failed (one slow)", b.state, OPEN)
+    check("07 gauge", metrics.MODEL_BREAKER.value(), 2)
+    try:
+        b.allow()
+        check("07 fails fast", "called", "CircuitOpen")
+    except llm.CircuitOpen as e:
+        check("07 fails fast", round(e.retry_in), 30)
+
+
+def test_08_half_open_trials():
+    clock = Clock()
+    b = breaker(clock)
+    for _ in range(4):
+        b.record(1, False)
+    clock.now += 31
+    check("08 half-open after wait", b.state, HALF_OPEN)
+    b.check()
+    b.allow()
+    b.allow()
+    try:
+        b.allow()
+        check("08 only the trials", "admitted", "CircuitOpen")
+    except llm.CircuitOpen:
+        check("08 only the trials", "CircuitOpen", "CircuitOpen")
+    b.record(1, True)
+    check("08 one success not enough", b.state, HALF_OPEN)
+    b.record(1, True)
+    check("08 closed", b.state, CLOSED)
+
+    for _ in range(4):
+        b.record(1, False)
+    clock.now += 31
+    b.allow()
+    b.record(1, False)
+    check("08 failed trial reopens", b.state, OPEN)
+
+
+def test_09_call_fails_fast_while_open():
+    clock = Clock()
+    b = breaker(clock)
+    client = Client()
+    client.failing = True
+    router = llm.Router(ROUTES, clock=clock)
+    for _ in range(4):
+        try:
+            llm.call(client, "age", router=router, breaker=b, input="x")
+        except RuntimeError:
+            pass
+    sent = len(client.requests)
+    try:
+        llm.call(client, "age", router=router, breaker=b, input="x")
+    except llm.CircuitOpen:
+        pass
+    check("09 endpoint not called", len(client.requests), sent)
+
+
+class SlowClient(object):
+    """Requests sleep for the next of `delays` seconds; async if `aio`."""
+
+    def __init__(self, delays, aio=False):
+        self.delays = list(delays)
+        self.requests = []
+        self.responses = self
+        self.aio = aio
+
+    def _response(self, n):
+        return SimpleNamespace(output_text="copy %d" % n,
+                               usage=SimpleNamespace(input_tokens=10, output_tokens=1))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        n = len(self.requests)
+        delay = self.delays.pop(0)
+        if self.aio:
+            return self._acreate(n, delay)
+        time.sleep(delay)
+        return self._response(n)
+
+    async def _acreate(self, n, delay):
+        await asyncio.sleep(delay)
+        return self._response(n)
+
+
+def hedger(**kw):
+    args = dict(functions=["report"], percentile=0.9, min_seconds=0.05, budget=0.25,
+                window=10, min_samples=3)
+    args.update(kw)
+    return llm.Hedger(**args)
+
+
+def test_10_hedger_threshold_and_budget():
+    h = hedger()
+    check("10 other routes never", h.delay("age"), None)
+    check("10 too few samples", h.delay("report"), None)
+    for seconds in (0.01, 0.02, 0.2):
+        h.record("report", seconds, False)
+    check("10 percentile", h.delay("report"), 0.2)
+    check("10 floor", hedger(min_seconds=1.0).delay("report"), None)
+    check("10 first hedge admitted", h.admit("report"), True)
+    check("10 budget spent", h.admit("report"), False)
+    h.record("report", 0.01, False)
+    check("10 budget refills", h.admit("report"), True)
+
+
+def warm(h, seconds=0.05):
+    for _ in range(7):
+        h.record("report", seconds, False)
+    return h
+
+
+def test_11_slow_call_is_hedged_and_hedge_wins():
+    h = warm(hedger())
+    client = SlowClient([0.5, 0.01])
+    won = metrics.MODEL_HEDGES.value(function="report", outcome="won")
+    response = llm.call(client, "report", router=llm.Router(ROUTES), breaker=breaker(Clock()),
+                        hedger=h, input="x")
+    check("11 hedge answered", response.output_text, "copy 2")
+    check("11 identical requests", client.requests[0], client.requests[1])
+    check("11 counted", metrics.MODEL_HEDGES.value(function="report", outcome="won"), won + 1)
+
+    quick = SlowClient([0.001])
+    llm.call(quick, "report", router=llm.Router(ROUTES), breaker=breaker(Clock()), hedger=h, input="x")
+    check("11 fast call not hedged", len(quick.requests), 1)
+
+
+def test_12_async_hedge_cancels_loser():
+    h = warm(hedger())
+    client = SlowClient([0.5, 0.01], aio=True)
+    cancelled = metrics.MODEL_CALLS.value(function="report", tier=PRIMARY, outcome="cancelled")
+
+    async def scenario():
+        started = time.perf_counter()
+        response = await llm.acall(client, "report", router=llm.Router(ROUTES),
+                                   breaker=breaker(Clock()), hedger=h, input="x")
+        return response.output_text, time.perf_counter() - started < 0.4
+
+    check("12 hedge answered early", asyncio.run(scenario()), ("copy 2", True))
+    check("12 loser cancelled", metrics.MODEL_CALLS.value(
+        function="report", tier=PRIMARY, outcome="cancelled"), cancelled + 1)
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all gateway checks pass")
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Locally rendered report: sections, omissions and facts taken from the result.
+
+Pure functions, no API calls - run with:
+    python tests/test_local_report.py
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import local_report  # noqa: E402
+from evals import eval_harness  # noqa: E402
+import screening_logic as sl  # noqa: E402
+from catalog import CATALOG, DOMAIN_TABLE  # noqa: E402
+from catalog import checklist_options as CHECKLIST  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+def ticks(key, n):
+    size = len(CHECKLIST[key])
+    return [True] * n + [False] * (size - n)
+
+
+def run(age, checklists):
+    return sl.analyze(age, checklists, CHECKLIST, DOMAIN_TABLE)
+
+
+def test_01_delayed_child_lists_unmet_and_delay():
+    res = run(24, {24: ticks(24, 2)})
+    report = local_report.render(res, observations="Says mama and dada.")
+    check("01 heading", report.startswith("## SPEECH AND LANGUAGE THERAPY REPORT"), True)
+    check("01 age", "## Child's Age:\n2 years, 0 months" in report, True)
+    check("01 unmet section", "## Milestones Expected but Not Met :" in report, True)
+    for text in CHECKLIST[24][2:]:
+        check("01 unmet listed: %s" % text[:30], "    - %s" % text.strip() in report, True)
+    check("01 delay verbatim", ("delay of approximately %s" % res.delay_text) in report, True)
+    check("01 observations quoted", "(as reported): Says mama and dada." in report, True)
+    check("01 evaluation suggested", "**Further Evaluation:**" in report, True)
+
+
+def test_02_all_met_omits_unmet_section():
+    res = run(24, {24: ticks(24, len(CHECKLIST[24]))})
+    report = local_report.render(res)
+    check("02 no unmet heading", "Not Met" in report, False)
+    check("02 no percentage", "%" in report, False)
+    check("02 monitoring only", "**Further Evaluation:**" in report, False)
+    check("02 parent section kept", "## Recommendations for Parents:" in report, True)
+
+
+def test_03_met_grouped_by_domain_in_order():
+    res = run(24, {24: ticks(24, len(CHECKLIST[24]))})
+    report = local_report.render(res)
+    positions = [report.find("**%s:**" % d) for d in sl.DOMAIN_ORDER if "**%s:**" % d in report]
+    check("03 domain order", positions, sorted(positions))
+    check("03 every met milestone", all(text in report for _, _, text, _ in res.met), True)
+
+
+def test_04_suggestions_from_catalog():
+    res = run(30, {36: ticks(36, 1)})
+    report = local_report.render(res, max_suggestions=2)
+    expected = [s.text for s in CATALOG.band_suggestions[36][:2]]
+    check("04 first two", all("    - %s" % t in report for t in expected), True)
+    check("04 capped", CATALOG.band_suggestions[36][2].text in report, False)
+
+
+def test_05_scope_disclosure_when_bands_presumed():
+    res = run(30, {36: ticks(36, 1)})
+    report = local_report.render(res)
+    check("05 disclosed", ("presumed to have been met" in report), res.disclosure_needed)
+
+
+def test_06_preview():
+    res = run(24, {24: ticks(24, 2)})
+    preview = local_report.render_preview(res)
+    check("06 dev range", ("- Developmental range: %s" % res.dev_band_label) in preview, True)
+    check("06 unmet count", ("%d" % len(res.unmet)) in preview.splitlines()[-1], True)
+    check("06 age text", [local_report.age_text(m) for m in (5, 12, 25)],
+          ["5 months", "1 year, 0 months", "2 years, 1 month"])
+
+
+PROSE = {
+    "observations": ["The parent reports the child enjoys shared books."],
+    "parent_recommendations": [{"heading": "Speech and Language Enrichment",
+                                "points": ["Narrate daily routines.", " "]}],
+    "clinical_recommendations": [{"heading": "Ongoing Monitoring:",
+                                  "points": ["Re-screen in three months."]}],
+}
+
+RED_FLAG_PROSE = dict(PROSE, observations=[
+    "The parent reports the child does not respond to their name and has stopped speaking."],
+    clinical_recommendations=[{"heading": "Further Evaluation",
+                               "points": ["Refer for an audiological and developmental evaluation."]}])
+
+
+def test_07_prose_fills_only_the_prose_sections():
+    res = run(24, {24: ticks(24, 2)})
+    report = local_report.render(res, observations="raw text", prose=PROSE)
+    check("07 model observation", "  - The parent reports the child enjoys shared books." in report, True)
+    check("07 raw observations not quoted", "raw text" in report, False)
+    check("07 group heading", "  - **Speech and Language Enrichment:**\n    - Narrate daily routines." in report, True)
+    check("07 colon not doubled", "**Ongoing Monitoring:**" in report, True)
+    check("07 blank point dropped", "    - \n" in report, False)
+    check("07 no local note", local_report.LOCAL_NOTE in report, False)
+    check("07 unmet still rendered", all(t.strip() in report for t in CHECKLIST[24][2:]), True)
+
+
+def test_08_parse_prose_rejects_bad_shapes():
+    check("08 round trip", local_report.parse_prose(json.dumps(PROSE)), PROSE)
+    for bad in ('{"observations": "x", "parent_recommendations": [], "clinical_recommendations": []}',
+                '{"observations": [], "parent_recommendations": [{"heading": "h"}], "clinical_recommendations": []}',
+                'not json'):
+        try:
+            local_report.parse_prose(bad)
+            check("08 rejected %s" % bad[:20], "accepted", "ValueError")
+        except ValueError:
+            check("08 rejected %s" % bad[:20], "ValueError", "ValueError")
+
+
+def test_09_eval_checks_pass_by_construction():
+    for case in eval_harness.build_report_cases(CHECKLIST):
+        truth = run(case["age"], case["checklists"])
+        prose = RED_FLAG_PROSE if case.get("expect_safety_override") else PROSE
+        report = local_report.render(truth, case["observations"], prose=prose)
+        checks = eval_harness.score_report(report, case, truth, CHECKLIST)
+        check("09 %s" % case["id"], sorted(k for k, v in checks.items() if not v), [])
+
+
+def test_10_local_suggestions_target_unmet():
+    res = run(36, {36: [i != 8 for i in range(len(CHECKLIST[36]))]})
+    report = local_report.render(res)
+    targeted = CATALOG.targeted_suggestions(36, CATALOG.ids(res.unmet))
+    check("10 targeted listed", all("    - %s" % s.text in report for s in targeted), True)
+    others = [s for s in CATALOG.band_suggestions[36] if s not in targeted]
+    check("10 others left out", any(s.text in report for s in others), False)
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all local report checks pass")
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Log redaction: hashed chat ids, session summaries and the gated full dump.
+
+Pure, no network - run with:
+    python tests/test_logsafe.py
+"""
+
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logsafe  # noqa: E402
+from instrumentation import hash_chat_id  # noqa: E402
+from logsafe import Capped, HashedChat, SessionSummary  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+SESSION = {
+    "name": "Amelia Rose",
+    "observations": "Says about ten words; her grandmother lives with us.",
+    "recommendations": "## SPEECH AND LANGUAGE THERAPY REPORT\n" + "x" * 500,
+    "email_subject": "Milestones Report - Amelia Rose",
+    "age": 26,
+    "age_group": 24,
+    "checklists": {"24": [True, False, True], "18": [True, True]},
+    "awaiting": "observations",
+}
+
+
+def test_01_hashed_chat_renders_the_digest():
+    check("01 digest", str(HashedChat(123456789)), hash_chat_id(123456789))
+    check("01 raw id absent", "123456789" in str(HashedChat(123456789)), False)
+    check("01 lazy %-argument", "chat %s" % HashedChat(7), "chat %s" % hash_chat_id(7))
+
+
+def test_02_session_summary_redacts_free_text():
+    text = str(SessionSummary(SESSION))
+    for field in ("name", "observations", "recommendations", "email_subject"):
+        check("02 %s sized" % field, "%s=<%d chars>" % (field, len(SESSION[field])) in text, True)
+    for secret in ("Amelia", "grandmother", "THERAPY"):
+        check("02 %s absent" % secret, secret in text, False)
+    check("02 plain values kept", "age=26" in text and "awaiting=observations" in text, True)
+    check("02 checklists counted", "checklists={18:2/2,24:2/3}" in text, True)
+    check("02 empty session", str(SessionSummary(None)), "{}")
+
+
+def test_03_other_values_are_capped():
+    check("03 short kept", str(Capped("abc", 5)), "abc")
+    check("03 long cut", str(Capped("abcdefgh", 5)), "abcde...(+3 chars)")
+    check("03 none", str(Capped(None)), "")
+    check("03 session value cap", "x" * 41 in str(SessionSummary({"note": "x" * 100})), False)
+
+
+def dumped(full, level):
+    logger = logging.getLogger("test_logsafe.dump")
+    handler, previous = Records(), logsafe.FULL_PAYLOADS
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    logsafe.FULL_PAYLOADS = full
+    try:
+        logsafe.dump(logger, "Session", SESSION)
+    finally:
+        logsafe.FULL_PAYLOADS = previous
+        logger.removeHandler(handler)
+    return [r.getMessage() for r in handler.records]
+
+
+def test_04_dump_needs_the_flag_and_debug():
+    check("04 flag off", dumped(False, logging.DEBUG), [])
+    check("04 flag on, above debug", dumped(True, logging.INFO), [])
+    lines = dumped(True, logging.DEBUG)
+    check("04 flag on, debug", len(lines), 1)
+    check("04 full payload", "Amelia Rose" in lines[0], True)
+
+
+def test_05_flag_is_off_by_default():
+    if os.environ.get("LOG_FULL_PAYLOADS"):
+        return
+    check("05 default", logsafe.FULL_PAYLOADS, False)
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all logsafe checks pass")
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Exposition-format tests for the in-process metrics registry.
+
+Pure, no network - run with:
+    python tests/test_metrics.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+from instrumentation import Histogram  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+def test_01_counter_labels_are_independent():
+    c = metrics.Counter("t_total", "test")
+    c.inc(function="age", outcome="ok")
+    c.inc(function="age", outcome="ok")
+    c.inc(function="age", outcome="error")
+    check("01 ok", c.value(function="age", outcome="ok"), 2)
+    check("01 error", c.value(outcome="error", function="age"), 1)
+    check("01 unseen", c.value(function="report", outcome="ok"), 0)
+
+
+def test_02_counter_rendering():
+    c = metrics.Counter("t_total", "A test counter.")
+    c.inc(handler="start")
+    text = metrics.render([c])
+    check("02 help", "# HELP t_total A test counter." in text, True)
+    check("02 type", "# TYPE t_total counter" in text, True)
+    check("02 sample", 't_total{handler="start"} 1' in text, True)
+
+
+def test_03_histogram_is_cumulative():
+    h = Histogram("t_seconds", "test", buckets=(0.1, 1.0))
+    h.observe(0.05, function="age")
+    h.observe(0.5, function="age")
+    h.observe(5.0, function="age")
+    text = metrics.render([h])
+    check("03 first bucket", 't_seconds_bucket{function="age",le="0.1"} 1' in text, True)
+    check("03 second bucket", 't_seconds_bucket{function="age",le="1"} 2' in text, True)
+    check("03 inf bucket", 't_seconds_bucket{function="age",le="+Inf"} 3' in text, True)
+    check("03 count", 't_seconds_count{function="age"} 3' in text, True)
+
+
+def test_04_label_values_are_escaped():
+    c = metrics.Counter("t_total", "test")
+    c.inc(handler='a"b\\c')
+    check("04 escaped", 't_total{handler="a\\"b\\\\c"} 1' in metrics.render([c]), True)
+
+
+def test_05_default_registry_renders():
+    text = metrics.render()
+    for name in ("milestones_updates_total", "milestones_model_calls_total",
+                 "milestones_model_seconds", "milestones_redis_ops_total",
+                 "milestones_cache_lookups_total", "milestones_smtp_sends_total"):
+        check("05 %s declared" % name, ("# TYPE %s " % name) in text, True)
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all metrics checks pass")
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""Model pool: concurrency bound, queue positions, saturation and gauges.
+
+No network - run with:
+    python tests/test_modelpool.py
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import deadlines  # noqa: E402
+import metrics  # noqa: E402
+import modelpool  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+def blocked_pool(concurrency, max_queue):
+    """A pool whose first `concurrency` calls hold their threads until released."""
+    pool = modelpool.ModelPool(concurrency=concurrency, max_queue=max_queue)
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def hold():
+        started.release()
+        release.wait(5)
+        return "held"
+
+    held = [pool.submit(hold)[0] for _ in range(concurrency)]
+    for _ in range(concurrency):
+        started.acquire(timeout=5)
+    return pool, release, held
+
+
+def test_01_runs_and_returns():
+    pool = modelpool.ModelPool(concurrency=2, max_queue=2)
+    check("01 result", pool.run(lambda a, b=0: a + b, 2, b=3), 5)
+    check("01 idle after", pool.depth(), (0, 0))
+
+
+def test_02_positions_in_arrival_order():
+    pool, release, held = blocked_pool(concurrency=2, max_queue=5)
+    positions = [pool.submit(lambda i=i: i)[1] for i in range(3)]
+    check("02 positions", positions, [1, 2, 3])
+    check("02 depth", pool.depth(), (2, 3))
+    check("02 gauge queued", metrics.MODEL_POOL.value(state="queued"), 3)
+    release.set()
+    check("02 held finish", [f.result(timeout=5) for f in held], ["held", "held"])
+
+
+def test_03_saturated_refuses_without_queueing():
+    pool, release, _ = blocked_pool(concurrency=1, max_queue=1)
+    pool.submit(lambda: None)
+    rejected = metrics.MODEL_POOL_REJECTED.value()
+    try:
+        pool.submit(lambda: None)
+        check("03 raised", "nothing", "Saturated")
+    except modelpool.Saturated:
+        check("03 raised", "Saturated", "Saturated")
+    check("03 not queued", pool.depth(), (1, 1))
+    check("03 counted", metrics.MODEL_POOL_REJECTED.value(), rejected + 1)
+    release.set()
+
+
+def test_04_run_announces_position_once():
+    pool, release, _ = blocked_pool(concurrency=1, max_queue=3)
+    announced = []
+    result = []
+    worker = threading.Thread(target=lambda: result.append(
+        pool.run(lambda: "done", on_queued=announced.append)))
+    worker.start()
+    while pool.depth() != (1, 1):
+        time.sleep(0.001)
+    release.set()
+    worker.join(5)
+    check("04 announced", announced, [1])
+    check("04 result", result, ["done"])
+    check("04 no announcement when free", pool.run(lambda: 1, on_queued=announced.append), 1)
+    check("04 still one", announced, [1])
+
+
+def test_05_errors_reach_the_caller_and_free_the_slot():
+    pool = modelpool.ModelPool(concurrency=1, max_queue=1)
+
+    def boom():
+        raise ValueError("model down")
+
+    try:
+        pool.run(boom)
+        check("05 raised", "nothing", "ValueError")
+    except ValueError:
+        check("05 raised", "ValueError", "ValueError")
+    check("05 slot freed", pool.depth(), (0, 0))
+
+
+def test_06_queue_wait_bounded_by_the_update_budget():
+    pool, release, held = blocked_pool(concurrency=1, max_queue=2)
+    started = time.monotonic()
+    try:
+        with deadlines.budget(deadlines.RESERVE + 0.1):
+            pool.run(lambda: "late")
+        check("06 raised", "nothing", "DeadlineExceeded")
+    except deadlines.DeadlineExceeded as e:
+        check("06 raised", e.step, "model.queue")
+    check("06 stopped waiting", time.monotonic() - started < 2, True)
+    check("06 queued call cancelled", pool.depth(), (1, 0))
+    release.set()
+    held[0].result(timeout=5)
+
+
+def test_07_async_pool_bounds_positions_and_saturates():
+    pool = modelpool.AsyncModelPool(concurrency=1, max_queue=1)
+    announced = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            await release.wait()
+            return "held"
+
+        async def announce(position):
+            announced.append(position)
+
+        first = asyncio.ensure_future(pool.run(hold))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(pool.run(lambda: asyncio.sleep(0, "done"), on_queued=announce))
+        await asyncio.sleep(0)
+        check("07 depth", pool.depth(), (1, 1))
+        try:
+            await pool.run(hold)
+            check("07 raised", "nothing", "Saturated")
+        except modelpool.Saturated:
+            check("07 raised", "Saturated", "Saturated")
+        release.set()
+        return await first, await second
+
+    check("07 results", asyncio.run(scenario()), ("held", "done"))
+    check("07 announced", announced, [1])
+    check("07 idle after", pool.depth(), (0, 0))
+
+
+def test_08_async_queue_wait_bounded_by_the_update_budget():
+    pool = modelpool.AsyncModelPool(concurrency=1, max_queue=2)
+
+    async def scenario():
+        release = asyncio.Event()
+        held = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0)
+        try:
+            with deadlines.budget(deadlines.RESERVE + 0.1):
+                await pool.run(lambda: asyncio.sleep(0, "late"))
+            check("08 raised", "nothing", "DeadlineExceeded")
+        except deadlines.DeadlineExceeded as e:
+            check("08 raised", e.step, "model.queue")
+        check("08 queued call dropped", pool.depth(), (1, 0))
+        release.set()
+        await held
+
+    started = time.monotonic()
+    asyncio.run(scenario())
+    check("08 stopped waiting", time.monotonic() - started < 2, True)
+    check("08 slot freed", pool.depth(), (0, 0))
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all model pool checks pass")
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Outbound pacing: buckets, scheduling order, 429 retries and the bot wrapper.
+
+No network - run with:
+    python tests/test_outbound.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import outbound  # noqa: E402
+from outbound import BULK, INTERACTIVE, NORMAL  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Throttled(Exception):
+    """Shaped like telebot's ApiTelegramException for a 429."""
+
+    error_code = 429
+
+    def __init__(self, retry_after):
+        Exception.__init__(self, "Too Many Requests")
+        self.result_json = {"ok": False, "parameters": {"retry_after": retry_after}}
+
+
+def drain(queue, clock):
+    """Run the scheduler by hand, advancing the fake clock; returns the run order."""
+    order = []
+    while queue._pending:
+        job, wait = queue.next_job(clock())
+        if job is None:
+            clock.now += wait
+            continue
+        order.append(job.args[0])
+        queue._busy.discard(job.chat_id)
+    return order
+
+
+def test_01_token_bucket():
+    bucket = outbound.TokenBucket(rate=2, burst=2, now=0.0)
+    check("01 full", bucket.wait(0.0), 0.0)
+    bucket.take(0.0)
+    bucket.take(0.0)
+    check("01 empty waits 1/rate", bucket.wait(0.0), 0.5)
+    check("01 refills", bucket.wait(0.5), 0.0)
+    check("01 capped at burst", outbound.TokenBucket(2, 2, 0.0).wait(100.0), 0.0)
+
+
+def test_02_priority_first_then_submission_order():
+    clock = Clock()
+    queue = outbound.Outbound(global_rate=100, chat_rate=100, chat_burst=100, clock=clock)
+    for name, chat, prio in (("a-bulk-1", 1, BULK), ("a-bulk-2", 1, BULK),
+                             ("b-normal", 2, NORMAL), ("c-toggle", 3, INTERACTIVE)):
+        queue._pending.append(outbound._Job(prio, next(queue._seq), chat, None, (name,), {}))
+    check("02 order", drain(queue, clock), ["c-toggle", "b-normal", "a-bulk-1", "a-bulk-2"])
+
+
+def test_02b_one_chat_sends_in_submission_order():
+    clock = Clock()
+    queue = outbound.Outbound(global_rate=100, chat_rate=100, chat_burst=100, clock=clock)
+    for name, prio in (("chunk-1", BULK), ("chunk-2", BULK), ("keyboard", NORMAL), ("preview", INTERACTIVE)):
+        queue._pending.append(outbound._Job(prio, next(queue._seq), 1, None, (name,), {}))
+    check("02b order", drain(queue, clock), ["chunk-1", "chunk-2", "keyboard", "preview"])
+
+
+def test_03_per_chat_rate_does_not_block_other_chats():
+    clock = Clock()
+    queue = outbound.Outbound(global_rate=100, chat_rate=1, chat_burst=1, clock=clock)
+    for name, chat in (("a1", 1), ("a2", 1), ("a3", 1), ("b1", 2)):
+        queue._pending.append(outbound._Job(BULK, next(queue._seq), chat, None, (name,), {}))
+    start = clock.now
+    check("03 order", drain(queue, clock), ["a1", "b1", "a2", "a3"])
+    check("03 chat paced", clock.now - start, 2.0)
+
+
+def test_04_busy_chat_waits_for_its_call():
+    clock = Clock()
+    queue = outbound.Outbound(global_rate=100, chat_rate=100, chat_burst=100, clock=clock)
+    for name in ("x1", "x2"):
+        queue._pending.append(outbound._Job(NORMAL, next(queue._seq), 9, None, (name,), {}))
+    first, _ = queue.next_job(clock())
+    second, wait = queue.next_job(clock())
+    check("04 first out", first.args[0], "x1")
+    check("04 nothing while in flight", (second, wait), (None, None))
+
+
+def test_04b_idle_chat_buckets_are_dropped():
+    clock = Clock()
+    queue = outbound.Outbound(global_rate=100, chat_rate=1, chat_burst=2, clock=clock)
+    for name, chat in (("a1", 1), ("b1", 2), ("c1", 3)):
+        queue._pending.append(outbound._Job(NORMAL, next(queue._seq), chat, None, (name,), {}))
+    drain(queue, clock)
+    check("04b one bucket per chat", sorted(queue._chats), [1, 2, 3])
+    clock.now += outbound.SWEEP_EVERY
+    queue._pending.append(outbound._Job(NORMAL, next(queue._seq), 2, None, ("b2",), {}))
+    queue._busy.add(3)
+    job, _ = queue.next_job(clock())
+    check("04b queued and in-flight chats kept", sorted(queue._chats), [2, 3])
+    check("04b still sends", job.args[0], "b2")
+    queue._busy.clear()
+    clock.now += 0.5
+    queue._swept = clock.now - outbound.SWEEP_EVERY
+    queue.next_job(clock())
+    check("04b a bucket still refilling is kept", sorted(queue._chats), [2])
+
+
+def test_05_retry_after_honoured_and_order_kept():
+    calls = []
+    failures = [Throttled(0.05)]
+
+    def send(chat_id, text):
+        if text == "chunk-1" and failures:
+            raise failures.pop()
+        calls.append(text)
+        return text
+
+    queue = outbound.Outbound(global_rate=1000, chat_rate=1000, chat_burst=1000, senders=3)
+    futures = [queue.submit(5, send, (5, "chunk-%d" % i), priority=BULK) for i in range(1, 4)]
+    results = [f.result(timeout=5) for f in futures]
+    check("05 all delivered", results, ["chunk-1", "chunk-2", "chunk-3"])
+    check("05 order kept through retry", calls, ["chunk-1", "chunk-2", "chunk-3"])
+
+
+def test_06_other_errors_reach_the_caller():
+    def boom(chat_id):
+        raise ValueError("bad request")
+
+    queue = outbound.Outbound(senders=1)
+    try:
+        queue.submit(1, boom, (1,)).result(timeout=5)
+        check("06 raised", "nothing", "ValueError")
+    except ValueError:
+        check("06 raised", "ValueError", "ValueError")
+    check("06 retry_after only for 429", outbound.retry_after(ValueError()), None)
+    check("06 retry_after value", outbound.retry_after(Throttled(7)), 7.0)
+
+
+def test_07_paced_bot_wraps_only_send_methods():
+    class Bot(object):
+        def send_message(self, chat_id, text, **kwargs):
+            return ("sent", chat_id, text, kwargs)
+
+        def register_next_step_handler(self, msg, fn):
+            return "registered"
+
+    queue = outbound.Outbound(senders=1)
+    bot = outbound.PacedBot(Bot(), queue)
+    check("07 paced returns result", bot.send_message(3, "hi", parse_mode="X"),
+          ("sent", 3, "hi", {"parse_mode": "X"}))
+    check("07 priority kw not forwarded", bot.send_message(3, "hi", priority=BULK)[3], {})
+    check("07 passthrough", bot.register_next_step_handler(None, None), "registered")
+    check("07 submit", bot.submit("send_message", 4, "x").result(timeout=5)[:3], ("sent", 4, "x"))
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all outbound checks pass")
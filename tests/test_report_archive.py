@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Report archive: append, list, fetch and retention, against an in-memory stand-in.
+
+No network - run with:
+    python tests/test_report_archive.py
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import report_archive  # noqa: E402
+from fake_redis import AsyncFakeRedis, FakeRedis  # noqa: E402
+from report_archive import AsyncReportArchive, ReportArchive  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+NOW = 1800000000.0
+DAY = 24 * 3600
+
+
+def test_01_round_trip_compressed():
+    r = FakeRedis()
+    archive = ReportArchive(r)
+    report = "## SPEECH AND LANGUAGE THERAPY REPORT\n" + "- a recommendation line\n" * 200
+    rid = archive.append(42, report, subject="Milestones Report - Alex", age=24, now=NOW)
+    check("01 id is ms timestamp", rid, int(NOW * 1000))
+    record = archive.get(42, rid)
+    check("01 report back", (record["report"], record["subject"], record["age"]),
+          (report, "Milestones Report - Alex", 24))
+    stored = r.hget("reports:42:body", rid)
+    check("01 compressed", len(stored) * 10 < len(report), True)
+    check("01 missing", archive.get(42, 1), None)
+    check("01 other chat", archive.get(43, rid), None)
+
+
+def test_02_entries_newest_first():
+    archive = ReportArchive(FakeRedis())
+    for i in range(3):
+        archive.append(7, "r%d" % i, subject="s%d" % i, now=NOW + i)
+    check("02 order", [e.subject for e in archive.entries(7)], ["s2", "s1", "s0"])
+    check("02 limit", len(archive.entries(7, limit=2)), 2)
+    check("02 empty", archive.entries(8), [])
+
+
+def test_03_retention_by_count_and_age():
+    r = FakeRedis()
+    archive = ReportArchive(r, max_reports=3, retention_days=30)
+    archive.append(7, "ancient", now=NOW - 40 * DAY)
+    for i in range(4):
+        archive.append(7, "r%d" % i, subject="s%d" % i, now=NOW + i)
+    check("03 newest kept", [e.subject for e in archive.entries(7)], ["s3", "s2", "s1"])
+    check("03 bodies trimmed too", len(r.hashes["reports:7:body"]), 3)
+    check("03 keys expire", (r.ttl("reports:7"), r.ttl("reports:7:body")), (30 * DAY, 30 * DAY))
+
+
+def test_04_defaults_from_environment():
+    check("04 max", ReportArchive(FakeRedis()).max_reports, report_archive.MAX_REPORTS)
+
+
+def test_05_async_archive_matches():
+    async def run():
+        r = AsyncFakeRedis()
+        archive = AsyncReportArchive(r, max_reports=2)
+        ids = [await archive.append(7, "r%d" % i, subject="s%d" % i, now=NOW + i) for i in range(3)]
+        entries = await archive.entries(7)
+        record = await archive.get(7, ids[-1])
+        return [e.subject for e in entries], record["report"], len(r.sync.hashes["reports:7:body"])
+
+    check("05 async archive", asyncio.run(run()), (["s2", "s1"], "r2", 2))
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all archive checks pass")
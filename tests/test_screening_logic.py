@@ -5,17 +5,14 @@ Pure functions, no API calls - run these on every change:
     python tests/test_screening_logic.py
 """
 
-import ast
 import os
 import sys
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import screening_logic as sl  # noqa: E402
-
-HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-with open(os.path.join(HERE, "checklist_options.json"), encoding="utf-8") as f:
-    CHECKLIST = {int(k): v for k, v in ast.literal_eval(f.read()).items()}
+from catalog import DOMAIN_TABLE  # noqa: E402
+from catalog import checklist_options as CHECKLIST  # noqa: E402
 
 NO_DOMAINS = {}
 
@@ -194,9 +191,7 @@ def test_15_inconsistent_lower_band_is_flagged():
 
 def test_16_facts_block_contents():
     """The FACTS block must carry the computed values and the right variant."""
-    import milestone_domains as md
-
-    res = sl.analyze(24, {24: band(24, "some", 4)}, CHECKLIST, md.MILESTONE_DOMAINS)
+    res = sl.analyze(24, {24: band(24, "some", 4)}, CHECKLIST, DOMAIN_TABLE)
     facts = sl.build_facts_block(res)
     check("16 chrono", "CURRENT_CHRONOLOGICAL_AGE_RANGE: 19 to 24 months" in facts, True)
     check("16 dev", "DEVELOPMENTAL_AGE_RANGE: 13 to 18 months" in facts, True)
@@ -206,7 +201,7 @@ def test_16_facts_block_contents():
     check("16 safety override", "SAFETY OVERRIDE:" in facts, True)
     check("16 exactly 2 unmet", "exactly these 2, and ONLY these" in facts, True)
 
-    res2 = sl.analyze(24, {24: band(24, "all")}, CHECKLIST, md.MILESTONE_DOMAINS)
+    res2 = sl.analyze(24, {24: band(24, "all")}, CHECKLIST, DOMAIN_TABLE)
     facts2 = sl.build_facts_block(res2)
     check("16 all-met no percentage", "DELAY_PERCENTAGE: NONE" in facts2, True)
     check("16 all-met omit section", "MILESTONES_NOT_MET: NONE" in facts2, True)
@@ -214,20 +209,45 @@ def test_16_facts_block_contents():
           "still produce both sections in full" in facts2, True)
     check("16 all-met no scope block", "SCREENING_SCOPE:" in facts2, False)
 
-    res3 = sl.analyze(4, {6: band(6), 3: band(3, "all")}, CHECKLIST, md.MILESTONE_DOMAINS)
+    res3 = sl.analyze(4, {6: band(6), 3: band(3, "all")}, CHECKLIST, DOMAIN_TABLE)
     facts3 = sl.build_facts_block(res3)
     check("16 at-least variant", "at least 25.00%" in facts3, True)
     check("16 at-least no 100", "100%" not in facts3.split("never print")[0], True)
 
 
 def test_17_every_milestone_has_a_domain():
-    """The domain map must cover every milestone in the checklist."""
-    import milestone_domains as md
-
-    expected = {(k, i) for k, opts in CHECKLIST.items() for i in range(len(opts))}
-    check("17 full coverage", set(md.MILESTONE_DOMAINS.keys()), expected)
+    """The domain table must cover every milestone in the checklist."""
+    check("17 full coverage", {k: len(v) for k, v in DOMAIN_TABLE.items()},
+          {k: len(v) for k, v in CHECKLIST.items()})
     check("17 valid values",
-          set(md.MILESTONE_DOMAINS.values()) <= set(sl.DOMAIN_ORDER), True)
+          {d for ds in DOMAIN_TABLE.values() for d in ds} <= set(sl.DOMAIN_ORDER), True)
+
+
+def test_18_templated_facts_match_regrouped():
+    """Precompiled fragments must render exactly what per-report regrouping did."""
+    cases = [
+        (24, {24: band(24, "some", 4)}),
+        (14, {18: band(18), 12: band(12), 9: band(9), 6: band(6, "all"), 3: band(3, "all")}),
+        (37, {48: band(48, "some", 5), 36: band(36, "all")}),
+        (60, {60: band(60, "some", 7), 48: band(48, "some", 12)}),
+        (9, {9: band(9), 6: band(6), 3: band(3, "some", 2)}),
+    ]
+    for domains in (DOMAIN_TABLE, NO_DOMAINS):
+        for age, checklists in cases:
+            res = sl.analyze(age, checklists, CHECKLIST, domains)
+            templated = sl.build_facts_block(res)
+            res.templates = None
+            check("18 age %d %s" % (age, "domains" if domains else "no domains"),
+                  templated, sl.build_facts_block(res))
+
+
+def test_19_catalog_table_agrees_with_raw_map():
+    """A positional {(band, idx): domain} map still works and gives the same result."""
+    raw_map = {(b, i): d for b, ds in DOMAIN_TABLE.items() for i, d in enumerate(ds)}
+    res = sl.analyze(24, {24: band(24, "some", 4)}, CHECKLIST, DOMAIN_TABLE)
+    raw = sl.analyze(24, {24: band(24, "some", 4)}, CHECKLIST, raw_map)
+    check("19 analyze agrees", res.unmet, raw.unmet)
+    check("19 facts agree", sl.build_facts_block(res), sl.build_facts_block(raw))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""Shared Recommendations sections: keys, storage, stitching into the report.
+
+No network - run with:
+    python tests/test_section_cache.py
+"""
+
+import asyncio
+import copy
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+import prompts  # noqa: E402
+import local_report  # noqa: E402
+import screening_logic as sl  # noqa: E402
+import section_cache  # noqa: E402
+from evals import eval_harness  # noqa: E402
+from fake_redis import AsyncFakeRedis, FakeRedis  # noqa: E402
+from catalog import CATALOG, CATALOG_PATH, DOMAIN_TABLE, Catalog  # noqa: E402
+from catalog import checklist_options as CHECKLIST  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+class BrokenRedis(object):
+    def pipeline(self, transaction=True):
+        raise ConnectionError("down")
+
+    def exists(self, key):
+        raise ConnectionError("down")
+
+    def set(self, key, value, ex=None):
+        raise ConnectionError("down")
+
+
+def seen(redis):
+    return dict(redis.zrange(section_cache.SEEN_KEY, 0, -1, withscores=True))
+
+
+def run(age, checklists):
+    return sl.analyze(age, checklists, CHECKLIST, DOMAIN_TABLE)
+
+
+def missing(key, *indexes):
+    return {key: [i not in indexes for i in range(len(CHECKLIST[key]))]}
+
+
+SECTIONS = {
+    "parent_recommendations": [{"heading": "Speech and Language Enrichment",
+                                "points": ["Narrate daily routines."]}],
+    "clinical_recommendations": [{"heading": "Ongoing Monitoring",
+                                  "points": ["Re-screen in three months."]}],
+}
+
+
+SHAPE = section_cache.Shape(36, ("36m-a", "36m-b"))
+
+
+def test_01_key_is_band_unmet_and_version():
+    a = section_cache.shape_of(run(36, missing(36, 2, 5)))
+    check("01 same unmet, another child", section_cache.shape_of(run(36, missing(36, 5, 2))), a)
+    check("01 other unmet", section_cache.shape_of(run(36, missing(36, 2))) == a, False)
+    check("01 version in key", section_cache.cache_key(a, version="old") == section_cache.cache_key(a),
+          False)
+    check("01 band in key", ":36:" in section_cache.cache_key(a), True)
+    check("01 member round trip", section_cache.parse_member(section_cache.member(a).encode()), a)
+    check("01 empty member", section_cache.parse_member("24:"), section_cache.Shape(24, ()))
+
+
+def test_01b_version_follows_the_catalog():
+    with open(CATALOG_PATH, encoding="utf-8") as f:
+        raw = json.load(f)
+    check("01b same catalog", prompts.catalog_digest(Catalog(copy.deepcopy(raw))),
+          prompts.catalog_digest(CATALOG))
+    edited = copy.deepcopy(raw)
+    sid = next(iter(edited["suggestions"]))
+    edited["suggestions"][sid]["text"] += " Sing it too."
+    check("01b suggestion edit", prompts.catalog_digest(Catalog(edited)) == prompts.catalog_digest(CATALOG),
+          False)
+
+
+def test_02_sections_input_has_nothing_about_the_child():
+    earlier = dict(missing(36, 2))
+    earlier[24] = [True] * len(CHECKLIST[24])
+    a, b = run(36, missing(36, 2)), run(30, earlier)
+    check("02 same shape", section_cache.shape_of(a), section_cache.shape_of(b))
+    text = prompts.sections_input(section_cache.shape_of(a))
+    check("02 unmet listed", CHECKLIST[36][2].strip() in text, True)
+    check("02 none when all met", "MILESTONES_NOT_MET:\nNONE" in prompts.sections_input(
+        section_cache.shape_of(run(24, {24: [True] * len(CHECKLIST[24])}))), True)
+
+
+def test_03_round_trip_counts_hits_misses_and_shapes():
+    redis = FakeRedis()
+    cache = section_cache.SectionCache(redis, ttl_days=2)
+    hits = metrics.CACHE_LOOKUPS.value(cache="sections", result="hit")
+    misses = metrics.CACHE_LOOKUPS.value(cache="sections", result="miss")
+    check("03 miss", cache.get(SHAPE), None)
+    cache.put(SHAPE, SECTIONS)
+    check("03 hit", cache.get(SHAPE), SECTIONS)
+    check("03 expires", redis.ttl(section_cache.cache_key(SHAPE)), 2 * 24 * 3600)
+    check("03 counted", (metrics.CACHE_LOOKUPS.value(cache="sections", result="hit") - hits,
+                         metrics.CACHE_LOOKUPS.value(cache="sections", result="miss") - misses), (1, 1))
+    check("03 shape seen twice", seen(redis), {b"36:36m-a,36m-b": 2})
+
+
+def test_04_redis_outage_is_a_miss():
+    cache = section_cache.SectionCache(BrokenRedis())
+    check("04 miss", cache.get(SHAPE), None)
+    check("04 put swallowed", cache.put(SHAPE, SECTIONS), None)
+    check("04 not contained", cache.contains(SHAPE), False)
+
+
+def test_04b_unreadable_entry_is_a_miss():
+    redis = FakeRedis()
+    cache = section_cache.SectionCache(redis)
+    for blob in (b"not json", b"[1, 2]", b'{"parent_recommendations": "x"}'):
+        redis.set(section_cache.cache_key(SHAPE), blob)
+        check("04b miss on %r" % blob, cache.get(SHAPE), None)
+
+
+def test_04c_speculative_lookups_are_not_counted():
+    redis = FakeRedis()
+    cache = section_cache.SectionCache(redis)
+    check("04c contains, before", cache.contains(SHAPE), False)
+    cache.put(SHAPE, SECTIONS)
+    check("04c contains", cache.contains(SHAPE), True)
+    check("04c uncounted get", cache.get(SHAPE, count=False), SECTIONS)
+    check("04c nothing seen", seen(redis), {})
+    cache.seen(SHAPE)
+    check("04c counted once used", seen(redis), {b"36:36m-a,36m-b": 1})
+
+
+def test_05_async_cache():
+    async def scenario():
+        cache = section_cache.AsyncSectionCache(AsyncFakeRedis())
+        before = await cache.get(SHAPE), await cache.contains(SHAPE)
+        await cache.put(SHAPE, SECTIONS)
+        return before, (await cache.get(SHAPE), await cache.contains(SHAPE))
+
+    check("05 async round trip", asyncio.run(scenario()), ((None, False), (SECTIONS, True)))
+
+
+def test_06_parsers_reject_bad_shapes():
+    check("06 sections", section_cache.parse_sections(json.dumps(SECTIONS)), SECTIONS)
+    for parse, bad in ((section_cache.parse_sections, '{"parent_recommendations": []}'),
+                       (section_cache.parse_observations, '{"observations": []}'),
+                       (section_cache.parse_observations, '{"observations": "x", "concerns": []}')):
+        try:
+            parse(bad)
+            check("06 rejected %s" % bad[:30], "accepted", "ValueError")
+        except ValueError:
+            check("06 rejected %s" % bad[:30], "ValueError", "ValueError")
+
+
+def test_07_concerns_lead_the_clinical_section():
+    personal = {"observations": ["Enjoys shared books."], "concerns": []}
+    check("07 no concerns", section_cache.stitch(personal, SECTIONS),
+          dict(SECTIONS, observations=personal["observations"]))
+    flagged = dict(personal, concerns=["Refer for an audiological evaluation.", " "])
+    clinical = section_cache.stitch(flagged, SECTIONS)["clinical_recommendations"]
+    check("07 concerns first", clinical[0], {"heading": section_cache.CONCERNS_HEADING,
+                                             "points": ["Refer for an audiological evaluation."]})
+    check("07 shared kept", clinical[1:], SECTIONS["clinical_recommendations"])
+    check("07 shared not mutated", len(SECTIONS["clinical_recommendations"]), 1)
+
+
+def test_08_stitched_reports_pass_the_eval_checks():
+    for case in eval_harness.build_report_cases(CHECKLIST):
+        truth = run(case["age"], case["checklists"])
+        personal = {"observations": ["The parent reports the child enjoys shared books."], "concerns": []}
+        if case.get("expect_safety_override"):
+            personal = {"observations": ["The parent reports the child does not respond to their name."],
+                        "concerns": ["Refer for an audiological and developmental evaluation."]}
+        report = local_report.render(truth, case["observations"],
+                                     prose=section_cache.stitch(personal, SECTIONS))
+        checks = eval_harness.score_report(report, case, truth, CHECKLIST)
+        check("08 %s" % case["id"], sorted(k for k, v in checks.items() if not v), [])
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all section cache checks pass")
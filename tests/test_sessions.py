@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Session phases, expiry and compaction, against an in-memory Redis stand-in.
+
+No network - run with:
+    python tests/test_sessions.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sessions  # noqa: E402
+from fake_redis import FakeRedis  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+class FakeArchive(object):
+    def __init__(self):
+        self.appended = []
+
+    def append(self, chat_id, report, subject=None, age=None, now=None):
+        self.appended.append((chat_id, report, subject, now))
+        return len(self.appended)
+
+
+NOW = 1800000000
+DAY = 24 * 3600
+
+REPORT = "## SPEECH AND LANGUAGE THERAPY REPORT\n" + "- a recommendation line\n" * 200
+
+
+def finished(**extra):
+    data = {"name": "Alex", "age": 24, "age_group": 24, "checklists": {24: [True] * 6},
+            "formatted_checklist": "1. x\n" * 20, "achieved_milestones": ["x"] * 6,
+            "recommendations": REPORT, "email_subject": "Milestones Report - Alex",
+            "email_body": REPORT}
+    data.update(extra)
+    return data
+
+
+def test_01_phase_and_ttl():
+    check("01 intake", sessions.phase_of({}), "intake")
+    check("01 screening", sessions.phase_of({"checklists": {3: [False]}}), "screening")
+    check("01 report", sessions.phase_of(finished()), "report")
+    check("01 sent", sessions.phase_of(finished(emailed_at=NOW)), "sent")
+    check("01 ttl default", sessions.ttl_for({}), sessions.DEFAULT_TTLS["intake"])
+    os.environ["SESSION_TTL_INTAKE"] = "60"
+    try:
+        check("01 ttl env", sessions.ttl_for({}), 60)
+    finally:
+        del os.environ["SESSION_TTL_INTAKE"]
+
+
+def test_02_encode_round_trips_and_stamps():
+    data = finished()
+    raw = sessions.encode(data, now=NOW)
+    back = sessions.decode(raw.encode("utf-8"))
+    check("02 stamped", back["touched"], NOW)
+    check("02 int band keys survive", back["checklists"], {24: [True] * 6})
+    check("02 missing", sessions.decode(None), None)
+
+
+def test_03_compaction_archives_then_slims_idle_reports():
+    r = FakeRedis()
+    r.set("101", sessions.encode(finished(), now=NOW - 2 * DAY), ex=60)
+    r.set("102", sessions.encode(finished(), now=NOW - 3600), ex=60)
+    r.set("103", sessions.encode({"name": "B", "age": 9}, now=NOW), ex=60)
+    r.set("prod_check", "ok")
+
+    archive = FakeArchive()
+    stats = sessions.compact(r, archive, now=NOW)
+    check("03 stats", stats, (3, 1, 0, 1))
+
+    slim = sessions.decode(r.get("101"))
+    check("03 bulky dropped", [f for f in sessions.BULKY_FIELDS if f in slim], [])
+    check("03 flagged", sessions.is_compacted(slim), True)
+    check("03 keeps small fields", (slim["name"], slim["age"], slim["email_subject"]),
+          ("Alex", 24, "Milestones Report - Alex"))
+    check("03 remaining ttl", r.ttl("101"), sessions.DEFAULT_TTLS["report"] - 2 * DAY)
+    check("03 recent untouched", "recommendations" in sessions.decode(r.get("102")), True)
+    check("03 non-session key ignored", r.get("prod_check"), b"ok")
+
+    check("03 archived at its own time", archive.appended,
+          [(101, REPORT, "Milestones Report - Alex", NOW - 2 * DAY)])
+
+    already = FakeArchive()
+    r.set("104", sessions.encode(finished(report_id=7), now=NOW - 2 * DAY), ex=60)
+    check("03 archived reports not re-archived",
+          sessions.compact(r, already, now=NOW).archived, 0)
+    check("03 no append", already.appended, [])
+
+
+def test_04_legacy_keys_get_an_expiry():
+    r = FakeRedis()
+    r.set("201", str({"name": "C", "checklists": {3: [True]}}))
+    r.set("202", str(finished()))
+    stats = sessions.compact(r, FakeArchive(), now=NOW)
+    check("04 stats", stats, (2, 1, 1, 1))
+    check("04 screening ttl", r.ttl("201"), sessions.DEFAULT_TTLS["screening"])
+    check("04 legacy report compacted", sessions.is_compacted(sessions.decode(r.get("202"))), True)
+
+
+def test_04b_a_save_during_compaction_is_kept():
+    r = FakeRedis()
+    r.set("401", sessions.encode(finished(), now=NOW - 2 * DAY), ex=60)
+    saved = sessions.encode(finished(email_subject="Edited"), now=NOW)
+
+    transaction, raced = r.transaction, []
+
+    def bot_saves(func, *keys, **kwargs):
+        # The clinician edits the subject between compaction's read and EXEC.
+        def racing(pipe):
+            value = func(pipe)
+            if not raced:
+                raced.append(keys)
+                r.set(keys[0], saved, ex=sessions.DEFAULT_TTLS["report"])
+            return value
+        return transaction(racing, *keys, **kwargs)
+
+    r.transaction = bot_saves
+    stats = sessions.compact(r, FakeArchive(), now=NOW)
+    check("04b raced", raced, [("401",)])
+    check("04b seen once, not compacted", stats, (1, 0, 0, 0))
+    check("04b the save wins", r.get("401"), saved.encode("utf-8"))
+    check("04b its expiry too", r.ttl("401"), sessions.DEFAULT_TTLS["report"])
+
+
+def test_05_dry_run_changes_nothing_and_footprint_shrinks():
+    r = FakeRedis()
+    for i in range(5):
+        r.set(str(300 + i), sessions.encode(finished(), now=NOW - 2 * DAY), ex=60)
+    before = dict(r.strings)
+    archive = FakeArchive()
+    check("05 dry run counts", sessions.compact(r, archive, now=NOW, dry_run=True)[1:], (5, 0, 5))
+    check("05 dry run untouched", (r.strings, archive.appended), (before, []))
+
+    fp_before = sessions.footprint(r)
+    sessions.compact(r, archive, now=NOW)
+    fp_after = sessions.footprint(r)
+    check("05 same sessions", fp_after["report"].sessions, fp_before["report"].sessions)
+    check("05 smaller", fp_after["report"].bytes * 10 < fp_before["report"].bytes, True)
+    check("05 report renders", "bytes/user" in sessions.format_footprint(fp_after), True)
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all session checks pass")
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Speculative reports: keyed hand-over, replacement, discard and expiry.
+
+No network - run with:
+    python tests/test_speculation.py
+"""
+
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+import speculation  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+SESSION = {"age": 30, "checklists": {24: [True, False], 30: [False, False]},
+           "formatted_checklist": "1. Points to pictures"}
+
+
+def speculator(clock=None):
+    return speculation.Speculator(ThreadPoolExecutor(max_workers=2), clock=clock or Clock())
+
+
+def test_01_key_tracks_report_inputs():
+    key = speculation.report_key(SESSION)
+    check("01 same inputs", speculation.report_key(dict(SESSION, name="Sam", observations="x")), key)
+    check("01 checklist order ignored", speculation.report_key(
+        dict(SESSION, checklists={30: [False, False], 24: [True, False]})), key)
+    check("01 tick changes key", speculation.report_key(
+        dict(SESSION, checklists={24: [True, True], 30: [False, False]})) == key, False)
+    check("01 age changes key", speculation.report_key(dict(SESSION, age=31)) == key, False)
+
+
+def test_02_take_hands_over_matching_job_once():
+    spec = speculator()
+    used = metrics.SPECULATIONS.value(outcome="used")
+    spec.start(1, "k", lambda: "report")
+    future = spec.take(1, "k")
+    check("02 result", future.result(1), "report")
+    check("02 counted", metrics.SPECULATIONS.value(outcome="used"), used + 1)
+    check("02 taken once", spec.take(1, "k"), None)
+    check("02 other chat", spec.take(2, "k"), None)
+
+
+def test_03_stale_key_is_dropped():
+    spec = speculator()
+    stale = metrics.SPECULATIONS.value(outcome="stale")
+    spec.start(1, "old", lambda: "report")
+    check("03 mismatch", spec.take(1, "new"), None)
+    check("03 counted", metrics.SPECULATIONS.value(outcome="stale"), stale + 1)
+    check("03 gone", spec.take(1, "old"), None)
+
+
+def test_04_start_replaces_and_discard_cancels():
+    spec = speculation.Speculator(ThreadPoolExecutor(max_workers=1), clock=Clock())
+    gate = threading.Event()
+    spec.start(9, "busy", gate.wait, 5)
+    first = spec.start(1, "a", lambda: "a")
+    second = spec.start(1, "b", lambda: "b")
+    check("04 queued job cancelled", first.cancelled(), True)
+    spec.discard(1)
+    check("04 discard cancels", second.cancelled(), True)
+    check("04 nothing left", spec.take(1, "b"), None)
+    gate.set()
+
+
+def test_05_uncollected_jobs_expire():
+    clock = Clock()
+    spec = speculator(clock)
+    spec.start(1, "k", lambda: "report")
+    clock.now += speculation.MAX_AGE + 1
+    spec.start(2, "k", lambda: "other")
+    check("05 expired", spec.take(1, "k"), None)
+    check("05 fresh kept", spec.take(2, "k").result(1), "other")
+
+
+def test_06_task_spawner_runs_on_the_loop():
+    async def scenario():
+        spec = speculation.Speculator(speculation.TaskSpawner(), clock=Clock())
+
+        async def write(text):
+            await asyncio.sleep(0)
+            return text
+
+        spec.start(1, "k", write, "report")
+        kept = await spec.take(1, "k")
+        task = spec.start(2, "k", asyncio.sleep, 5)
+        spec.discard(2)
+        await asyncio.sleep(0)
+        return kept, task.cancelled()
+
+    check("06 task result and cancel", asyncio.run(scenario()), ("report", True))
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all speculation checks pass")
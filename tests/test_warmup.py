@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Section warm-up: candidate shapes, skipping cached ones, concurrency, decay.
+
+No network - run with:
+    python tests/test_warmup.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm  # noqa: E402
+import section_cache  # noqa: E402
+import warmup  # noqa: E402
+from catalog import CATALOG  # noqa: E402
+from fake_redis import FakeRedis  # noqa: E402
+from section_cache import Shape  # noqa: E402
+
+_failures = []
+_passes = []
+
+
+def check(name, got, expected):
+    if got == expected:
+        _passes.append(name)
+    else:
+        _failures.append("%s\n      expected: %r\n      got:      %r" % (name, expected, got))
+
+
+def seeded(*counts):
+    redis = FakeRedis()
+    for shape, count in counts:
+        redis.zincrby(section_cache.SEEN_KEY, count, section_cache.member(shape))
+    return redis, section_cache.SectionCache(redis)
+
+
+A = Shape(36, ("36m-a",))
+B = Shape(24, ())
+C = Shape(36, ("36m-a", "36m-b"))
+
+
+def test_01_candidates_most_frequent_first():
+    _, cache = seeded((A, 3), (B, 7), (C, 1))
+    check("01 top two", warmup.candidates(cache, top=2), [B, A])
+    shapes = warmup.candidates(cache, top=2, enumerate_all=True)
+    check("01 no duplicates", len(shapes), len(set(shapes)))
+    check("01 counted first", shapes[:2], [B, A])
+    check("01 enumerated", len(warmup.enumerate_shapes()),
+          sum(1 + len(ms) for ms in CATALOG.by_band.values()))
+
+
+def test_02_only_missing_shapes_are_written():
+    redis, cache = seeded((A, 3), (B, 7))
+    cache.put(A, {"parent_recommendations": [], "clinical_recommendations": []})
+    written = []
+    stats = warmup.warm(cache, [B, A], write=lambda s: written.append(s) or {"s": list(s.unmet)})
+    check("02 stats", stats, warmup.WarmupStats(2, 1, 1, 0, 0))
+    check("02 wrote B", written, [B])
+    check("02 stored", redis.exists(section_cache.cache_key(B)), 1)
+    check("02 dry run writes nothing", warmup.warm(cache, [C], write=None, dry_run=True),
+          warmup.WarmupStats(1, 0, 0, 0, 0))
+
+
+def test_03_concurrency_is_capped():
+    _, cache = seeded()
+    lock = threading.Lock()
+    state = {"now": 0, "peak": 0}
+
+    def write(shape):
+        with lock:
+            state["now"] += 1
+            state["peak"] = max(state["peak"], state["now"])
+        time.sleep(0.02)
+        with lock:
+            state["now"] -= 1
+        return {}
+
+    shapes = [Shape(36, ("m%d" % i,)) for i in range(8)]
+    stats = warmup.warm(cache, shapes, write=write, concurrency=2)
+    check("03 all written", stats.written, 8)
+    check("03 peak", state["peak"], 2)
+
+
+def test_04_open_breaker_stops_the_run():
+    _, cache = seeded()
+    calls = []
+
+    def write(shape):
+        calls.append(shape)
+        if len(calls) == 1:
+            raise ValueError("bad json")
+        raise llm.CircuitOpen(30)
+
+    stats = warmup.warm(cache, [Shape(36, ("m%d" % i,)) for i in range(6)], write=write, concurrency=1)
+    check("04 stopped early", len(calls), 2)
+    check("04 one failed, the rest skipped", stats, warmup.WarmupStats(6, 0, 0, 1, 5))
+
+
+def test_04b_breaker_open_from_the_start_fails_nothing():
+    _, cache = seeded()
+
+    def write(shape):
+        raise llm.CircuitOpen(30)
+
+    stats = warmup.warm(cache, [Shape(36, ("m%d" % i,)) for i in range(3)], write=write, concurrency=1)
+    check("04b all skipped", stats, warmup.WarmupStats(3, 0, 0, 0, 3))
+
+
+def test_05_decay_halves_and_trims():
+    redis, cache = seeded((A, 4), (B, 8), (C, 2))
+    cache.decay(keep=2)
+    check("05 halved, least frequent dropped",
+          redis.zrange(section_cache.SEEN_KEY, 0, -1, withscores=True),
+          [(section_cache.member(A).encode("utf-8"), 2), (section_cache.member(B).encode("utf-8"), 4)])
+
+
+def test_06_window():
+    check("06 inside", warmup.in_window("1-6", 3), True)
+    check("06 end exclusive", warmup.in_window("1-6", 6), False)
+    check("06 wraps midnight", [warmup.in_window("22-4", h) for h in (23, 2, 12)], [True, True, False])
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    for t in tests:
+        try:
+            t()
+        except Exception as exc:  # noqa: BLE001
+            _failures.append("%s raised %s: %s" % (t.__name__, type(exc).__name__, exc))
+    print("passed: %d" % len(_passes))
+    if _failures:
+        print("FAILED: %d" % len(_failures))
+        for f in _failures:
+            print("  - %s" % f)
+        sys.exit(1)
+    print("all warm-up checks pass")
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Off-peak warm-up of the shared Recommendations sections.
+
+section_cache.py shares the two Recommendations sections between reports with
+the same band and unmet milestones, but a shape's first report of the day
+still pays for the sections call, and at peak that is when the model is
+slowest. Every lookup counts its shape in Redis. This job runs off-peak and
+writes the sections for the shapes peak traffic will ask for:
+
+- the TOP most frequent shapes counted since the last runs;
+- with --enumerate, every band with nothing unmet and with each single
+  milestone unmet. These are cheap to list and common on a fresh deployment,
+  before there are any counts.
+
+Shapes already cached under the current prompt version are skipped. The rest
+are written CONCURRENCY at a time, so the job never takes more than that
+share of the model's rate limit. When the breaker opens, the job stops and
+leaves the rest for the next run; those count as skipped, not failed, and only
+failed writes make it exit 1. Afterwards the counts are halved
+(section_cache.SectionCache.decay), so the ranking follows recent traffic.
+
+Run it from Heroku Scheduler (or by hand); it needs REDIS_URL and the OpenAI
+key:
+
+    python warmup.py [--top 200] [--concurrency 4] [--enumerate] [--dry-run]
+
+Outside WARMUP_HOURS (UTC, "start-end") it does nothing unless given --now.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import llm
+import section_cache
+from catalog import CATALOG
+
+logger = logging.getLogger(__name__)
+
+TOP = int(os.environ.get("WARMUP_TOP", 200))
+CONCURRENCY = int(os.environ.get("WARMUP_CONCURRENCY", 4))
+HOURS = os.environ.get("WARMUP_HOURS", "1-6")
+
+WarmupStats = namedtuple("WarmupStats", ["candidates", "cached", "written", "failed", "skipped"])
+
+
+def enumerate_shapes(catalog=CATALOG):
+    """Every band with nothing unmet, and with each single milestone unmet."""
+    shapes = []
+    for band, milestones in catalog.by_band.items():
+        shapes.append(section_cache.Shape(band, ()))
+        shapes.extend(section_cache.Shape(band, (m.id,)) for m in milestones)
+    return shapes
+
+
+def candidates(cache, top=TOP, enumerate_all=False, catalog=CATALOG):
+    """The shapes to warm, most frequent first, without duplicates."""
+    shapes = [shape for shape, _count in cache.common(top)]
+    if enumerate_all:
+        shapes.extend(enumerate_shapes(catalog))
+    return list(OrderedDict.fromkeys(shapes))
+
+
+def in_window(hours, hour):
+    """Whether `hour` falls in "start-end" (end exclusive; may wrap midnight)."""
+    start, _, end = hours.partition("-")
+    start, end = int(start), int(end)
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def write_sections(shape):
+    import clients
+
+    response = llm.call(clients.openai_client(), "sections", **section_cache.request(shape))
+    return section_cache.parse_sections(response.output_text)
+
+
+def warm(cache, shapes, write=write_sections, concurrency=CONCURRENCY, dry_run=False):
+    """Write and store the sections of every shape not already cached."""
+    missing = [shape for shape, found in zip(shapes, cache.cached(shapes)) if not found]
+    if dry_run or not missing:
+        return WarmupStats(len(shapes), len(shapes) - len(missing), 0, 0, 0)
+    stop = threading.Event()
+
+    def one(shape):
+        if stop.is_set():
+            return "skipped"
+        try:
+            cache.put(shape, write(shape))
+            return "written"
+        except llm.CircuitOpen:
+            # The breaker refused the call; nothing was attempted.
+            stop.set()
+            return "skipped"
+        except Exception as e:  # noqa: BLE001 - one bad shape must not end the run
+            logger.warning("warm-up of %s failed: %s", section_cache.member(shape), e)
+            return "failed"
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="warmup") as pool:
+        outcomes = list(pool.map(one, missing))
+    return WarmupStats(len(shapes), len(shapes) - len(missing), outcomes.count("written"),
+                       outcomes.count("failed"), outcomes.count("skipped"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--top", type=int, default=TOP)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--enumerate", action="store_true", help="add every single-unmet shape")
+    parser.add_argument("--hours", default=HOURS, help="UTC window to run in, as start-end")
+    parser.add_argument("--now", action="store_true", help="run outside the window")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    if not args.now and not in_window(args.hours, time.gmtime().tm_hour):
+        print("outside the warm-up window (%s UTC); pass --now to run anyway" % args.hours)
+        return 0
+
+    import clients
+
+    cache = section_cache.SectionCache(clients.redis)
+    shapes = candidates(cache, args.top, args.enumerate)
+    stats = warm(cache, shapes, concurrency=args.concurrency, dry_run=args.dry_run)
+    if not args.dry_run:
+        cache.decay()
+    print("candidates=%d cached=%d written=%d failed=%d skipped=%d%s"
+          % (stats + (" (dry run)" if args.dry_run else "",)))
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())